@@ -1,13 +1,11 @@
 #%% Import Dependencies
 import streamlit as st
 st.set_page_config(layout="wide")
-import functions.housing_statistics.acs_streamlit as ast
-import functions.housing_statistics.acs_data_fetch as cf
-import functions.stock_market.stocks_streamlit as ss
-import functions.news.news_streamlit as ns
 import functions.tools as tl
-import functions.fourteeners.fourteeners_streamlit as fs
-import functions.weather.weather_streamlit as ws
+import functions.instrumentation as instr
+import importlib
+import time
+from types import SimpleNamespace
 import us
 
 # Function to get a list of all US states
@@ -17,22 +15,37 @@ def us_states_list():
     return us_states
 us_states = us_states_list()
 
-# Get Most Recently Available ACS Year
-year_max = cf.get_most_recent_acs_year()
-year_min = year_max - 10
 
-# Read in Style.css
-with open('assets/style.css') as f:
-    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+# Function to import a view's page modules the first time that view is selected
+@st.cache_resource
+def load_view(view_name):
+    '''
+    Imports (and so initializes) every module a view needs. Cached as a resource so the import and any
+    module level work it triggers (API probes, symbol lists, geo data) is only paid once per process,
+    and only for views a user actually opens.
 
-# Add Sidebar Filters
-dropdown_views = ['Weather', 'Stock Market', 'News and Research', 'Housing Statistics', 'Colorado 14ers']
-view_selection = st.sidebar.selectbox("#### View Selection", dropdown_views)
-st.sidebar.write('')
+    Parameters:
+        - view_name: Key into VIEW_REGISTRY
+
+    Returns:
+        - modules: Namespace of the imported modules keyed by their alias in VIEW_REGISTRY
+        - startup_seconds: Time spent importing and initializing the view's modules
+    '''
+    start = time.perf_counter()
+    modules = {alias: importlib.import_module(path) for alias, path in VIEW_REGISTRY[view_name]['modules'].items()}
+    startup_seconds = time.perf_counter() - start
+    print(f"View '{view_name}' initialized in {startup_seconds:.2f}s")
+    return SimpleNamespace(**modules), startup_seconds
 
 
 # Create Housing Statistics Page
-if view_selection == 'Housing Statistics':
+def housing_page(m, view_selection):
+    # Get Most Recently Available ACS Year
+    year_max = m.cf.get_most_recent_acs_year()
+
+    # Plan every ACS request the page's sections need so overlapping requests are merged
+    plan = m.ast.plan_housing_requests(year_max)
+
     # Display the page title
     st.markdown(
         f"""
@@ -46,63 +59,115 @@ if view_selection == 'Housing Statistics':
     ## Section title
     tl.write_around_markdown('#### Cumulative Change in Housing Costs and Incomes', 0, 1)
 
-    ## Create two columns to display filters side by side
-    col1, col2 = st.columns([1, 2])
-    with col1:
-        state_selection = st.selectbox("**Select Geographic Level**", ['US National Average'] + us_states)
-    with col2:
-        year_range1 = st.slider('**Select Year Range**', min_value=year_min, max_value=year_max, value=(year_min, year_max), key='slider_key_1')
-
-    ## Display the Cumulative Change in Housing Costs and Incomes chart based on filter selections
-    ast.yoy_cum_change_line_charts(state_selection, year_range1)
+    ## Display the filters and the Cumulative Change in Housing Costs and Incomes chart, each section is a fragment
+    ## so its filters only rerun that section
+    m.ast.cum_change_section(us_states, plan, year_max)
 
 
     # Section 2: Share of Renters Housing Burdened
     ## Section title
     tl.write_around_markdown('#### Share of Renters Housing Burdened Map', 1, 1)
 
-    ## State vs. County Selection
-    level_list = ['State Level', 'County Level']
-    level_selection = st.selectbox("**Geographic Level Selection**", level_list)
+    ## Display the level filter and the Share of Renters Housing Burdened figs
+    m.ast.renter_burden_section(us_states, plan)
 
-    ## Display the Share of Renters Housing Burdened figs based on filter selection
-    ast.renter_house_burden(level_selection, us_states)
 
-    
     # Section 3: National Average vs. Select State -- Year over Year
     ## Section title
     tl.write_around_markdown('#### National Average vs. Select State -- Year over Year', 1, 1)
 
     ## Display the National Average vs. Select State -- Year over Year figs based on filter selection
-    ast.yoy_comp_line_charts(state_selection, us_states)
+    m.ast.yoy_comp_line_charts(us_states, plan, year_max)
 
     # Final Section
-    ast.housing_terms()
+    m.ast.housing_terms()
 
 
 # Create Stock Market Page
-elif view_selection == 'Stock Market':
+def stock_market_page(m, view_selection):
     # Add n random s&p 500 stock tickers
-    ss.stock_ticker(6)
+    m.ss.stock_ticker(6)
 
     # Add market index time series section
-    ss.market_time_series()
+    m.ss.market_time_series()
 
     # Add individual selected stock overview section
-    ss.selected_stock_summary()
+    m.ss.selected_stock_summary()
 
 
 # Create News and Research Page
-elif view_selection == 'News and Research':
-    ns.news_and_research()
+def news_page(m, view_selection):
+    m.ns.news_and_research()
 
 
 # Create 14ers Page
-elif view_selection == 'Colorado 14ers':
-    fs.fourteeners_heading()
-    fs.fourteeners_table()
+def fourteeners_page(m, view_selection):
+    m.fs.fourteeners_heading()
+    m.fs.fourteeners_table()
 
 
 # Create Weather Page
-elif view_selection == 'Weather':
-    ws.weather_main()
\ No newline at end of file
+def weather_page(m, view_selection):
+    m.ws.weather_main()
+
+
+# View registry, maps each dropdown view to the modules it needs and the function that renders it.
+# Modules are only imported by load_view() once their view is first selected.
+VIEW_REGISTRY = {
+    'Weather': {
+        'modules': {'ws': 'functions.weather.weather_streamlit'},
+        'render': weather_page,
+    },
+    'Stock Market': {
+        'modules': {'ss': 'functions.stock_market.stocks_streamlit'},
+        'render': stock_market_page,
+    },
+    'News and Research': {
+        'modules': {'ns': 'functions.news.news_streamlit'},
+        'render': news_page,
+    },
+    'Housing Statistics': {
+        'modules': {'cf': 'functions.housing_statistics.acs_data_fetch',
+                    'ast': 'functions.housing_statistics.acs_streamlit'},
+        'render': housing_page,
+    },
+    'Colorado 14ers': {
+        'modules': {'fs': 'functions.fourteeners.fourteeners_streamlit'},
+        'render': fourteeners_page,
+    },
+}
+
+
+# Function to start the Prometheus metrics endpoint once per process
+@st.cache_resource
+def start_metrics_server():
+    instr.start_metrics_server()
+
+
+# Start collecting this run's timing spans
+instr.begin_render()
+start_metrics_server()
+
+# Read in Style.css
+with open('assets/style.css') as f:
+    st.markdown(f'<style>{f.read()}</style>', unsafe_allow_html=True)
+
+# Add Sidebar Filters
+dropdown_views = list(VIEW_REGISTRY.keys())
+view_selection = st.sidebar.selectbox("#### View Selection", dropdown_views, key='view_selection')
+st.sidebar.write('')
+
+# Load the selected view's modules (only imported on first selection) and report how long that took
+view_modules, startup_seconds = load_view(view_selection)
+st.sidebar.caption(f'{view_selection} startup time: {startup_seconds:.2f}s')
+show_timings = st.sidebar.checkbox('Show render timings', value=instr.SHOW_TIMINGS)
+
+# Render the selected view
+with instr.span('page', view_selection):
+    VIEW_REGISTRY[view_selection]['render'](view_modules, view_selection)
+
+# Show where this run's time went, fetches, chart builders and plotly serialization inside the page total
+if show_timings:
+    timings_df = instr.render_timings()
+    st.sidebar.dataframe(timings_df, hide_index=True, use_container_width=True,
+                         column_config={'Seconds': st.column_config.NumberColumn(format='%.3f')})
@@ -0,0 +1,99 @@
+#%%
+'''
+Benchmarks the AcsCube transform engine against the pandas pivot/groupby/melt path the housing charts used before,
+on a synthetic panel the size of the YoY section's (every state plus the nation, 11 years, every yaml variable).
+Also checks both paths give the same numbers, including for a geography missing the panel's first year.
+
+Usage:
+    python -m devtools.bench_acs_transforms [--repeat 50]
+'''
+import argparse
+import timeit
+import numpy as np
+import pandas as pd
+import rwend_tools.utils as ru
+from functions.housing_statistics.acs_transforms import AcsCube
+
+line_chart_setup = ru.read_config('config/yoy_comp_line_chart_setup.yaml')
+cum_change_vars = ['B19013_001E', 'B25058_001E', 'B25077_001E']
+
+
+# Function to make a synthetic wide panel, NAME, Year and one column per variable
+def synthetic_panel(n_geo=53, years=range(2013, 2024)):
+    variables = sorted({metric['details'][key] for metric in line_chart_setup['metrics'] for key in ['variable', 'numerator', 'denominator']} - {'None'})
+    rng = np.random.default_rng(0)
+    rows = [(f'Geo {geo}', year) for geo in range(n_geo) for year in years]
+    df = pd.DataFrame(rows, columns=['NAME', 'Year'])
+    for variable in variables:
+        df[variable] = rng.uniform(1_000, 1_000_000, len(df))
+    return df
+
+
+# The pandas path the cumulative change chart used, minus the plotting
+def legacy_cum_change(long_df):
+    df = long_df.pivot_table(index=['NAME', 'Year'], values='Value', columns='Variable').reset_index()
+    def cumulative_change(column):
+        return (column - column.iloc[0]) / column.iloc[0]
+    cumulative_changes = df.groupby('NAME').transform(cumulative_change)
+    cumulative_changes.drop(columns='Year', inplace=True)
+    df = pd.concat([df[['NAME', 'Year']], cumulative_changes], axis=1)
+    return df.melt(id_vars=['NAME', 'Year'], var_name='Metric', value_name='Value')
+
+
+# The pandas path the YoY comparison charts used for one metric, minus the plotting
+def legacy_comp_metric(long_df, details):
+    vars = [var for var in [details['variable'], details['numerator'], details['denominator']] if var != 'None']
+    df = long_df[long_df['Variable'].isin(vars)].reset_index(drop=True)
+    df = df.pivot_table(index=['NAME', 'Year'], values='Value', columns='Variable').reset_index(drop=False)
+    if details['rate_flag'] == 1:
+        df['Chart Var'] = df[details['numerator']] / df[details['denominator']]
+    else:
+        df['Chart Var'] = df[details['variable']]
+    return df[['NAME', 'Year', 'Chart Var']]
+
+
+def legacy_all(wide_df):
+    long_df = pd.melt(wide_df, id_vars=['NAME', 'Year'], var_name='Variable', value_name='Value')
+    cum_change = legacy_cum_change(long_df[long_df['Variable'].isin(cum_change_vars)])
+    metrics = {metric['name']: legacy_comp_metric(long_df, metric['details']) for metric in line_chart_setup['metrics']}
+    return cum_change, metrics
+
+
+def cube_all(wide_df):
+    cube = AcsCube.from_wide(wide_df)
+    cum_change = cube.subset(cum_change_vars).cumulative_change().to_frame(var_name='Metric')
+    metrics_cube = cube.metrics(line_chart_setup['metrics'])
+    metrics = {name: metrics_cube.to_frame(name, value_name='Chart Var') for name in metrics_cube.variables}
+    return cum_change, metrics
+
+
+# Function to check the engine matches the pandas path
+def check(wide_df):
+    legacy_cum, legacy_metrics = legacy_all(wide_df)
+    cube_cum, cube_metrics = cube_all(wide_df)
+
+    key = ['NAME', 'Year', 'Metric']
+    merged = legacy_cum.merge(cube_cum, on=key, suffixes=('_legacy', '_cube'))
+    assert len(merged) == len(legacy_cum)
+    np.testing.assert_allclose(merged['Value_legacy'], merged['Value_cube'])
+
+    for name, legacy_df in legacy_metrics.items():
+        merged = legacy_df.merge(cube_metrics[name], on=['NAME', 'Year'], suffixes=('_legacy', '_cube'))
+        assert len(merged) == len(legacy_df)
+        np.testing.assert_allclose(merged['Chart Var_legacy'], merged['Chart Var_cube'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the ACS transform engine')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    wide_df = synthetic_panel()
+    check(wide_df)
+    check(wide_df[~((wide_df['NAME'] == 'Geo 0') & (wide_df['Year'] == wide_df['Year'].min()))])
+
+    legacy_seconds = min(timeit.repeat(lambda: legacy_all(wide_df), number=1, repeat=args.repeat))
+    cube_seconds = min(timeit.repeat(lambda: cube_all(wide_df), number=1, repeat=args.repeat))
+    print(f'Panel: {len(wide_df)} geography-years x {wide_df.shape[1] - 2} variables, {len(line_chart_setup["metrics"])} metrics')
+    print(f'pandas path: {legacy_seconds * 1000:8.2f} ms')
+    print(f'AcsCube:     {cube_seconds * 1000:8.2f} ms ({legacy_seconds / cube_seconds:.1f}x)')
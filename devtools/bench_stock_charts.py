@@ -0,0 +1,101 @@
+#%%
+'''
+Benchmarks building the stock figures against the number of daily bars, comparing the candlestick and time series
+builders in stocks_charts.py to the row-wise hover label and go.Line versions they replaced, on synthetic bars. Also
+checks both candlestick versions give the same hover labels.
+
+Usage:
+    python -m devtools.bench_stock_charts [--bars 250 500 1000 2500 5000 10000] [--repeat 20]
+'''
+import argparse
+import timeit
+import warnings
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import functions.stock_market.stocks_charts as sc
+import functions.instrumentation as instr
+
+
+# Function to make n synthetic daily bars, a random walk on business days
+def synthetic_bars(n):
+    rng = np.random.default_rng(0)
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, n)))
+    open = close * (1 + rng.normal(0, 0.005, n))
+    return pd.DataFrame({
+        't': pd.bdate_range(end='2024-06-28', periods=n),
+        'o': open,
+        'h': np.maximum(open, close) * (1 + rng.uniform(0, 0.01, n)),
+        'l': np.minimum(open, close) * (1 - rng.uniform(0, 0.01, n)),
+        'c': close,
+        'v': rng.integers(1_000_000, 10_000_000, n),
+    })
+
+
+# The candlestick builder before, formatting the dates twice and the hover labels a row at a time
+@instr.timed('chart')
+def legacy_candle_stick_chart(df):
+    formatted_dates = df['t'].dt.strftime('%Y-%m-%d')
+    fig = go.Figure(data=[go.Candlestick(x=formatted_dates, open=df['o'], high=df['h'], low=df['l'], close=df['c'])])
+    y_min = df['l'].min()
+    y_max = df['h'].max()
+    fig.update_yaxes(tickformat='$,.0f', range=[y_min - (0.2 * (y_max - y_min)), y_max + (0.2 * (y_max - y_min))])
+    fig.update_layout(xaxis_rangeslider_visible=False, margin=dict(t=25, b=0, l=0, r=0))
+    fig.update_traces(hoverinfo='text',
+                      hovertext=df[['t', 'o', 'h', 'l', 'c']].apply(lambda row: f"<b>Date</b>: {row['t'].strftime('%Y-%m-%d')}<br>"
+                                                                                f"<b>Open</b>: ${row['o']:.2f}<br>"
+                                                                                f"<b>High</b>: ${row['h']:.2f}<br>"
+                                                                                f"<b>Low</b>: ${row['l']:.2f}<br>"
+                                                                                f"<b>Close</b>: ${row['c']:.2f}",
+                                                                                axis=1))
+    return fig
+
+
+# The time series builder before, on the deprecated go.Line
+@instr.timed('chart')
+def legacy_time_series_chart(df, title):
+    fig = go.Figure()
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        fig.add_trace(go.Line(x=df['t'], y=df['c'], hovertemplate='Date: %{x|%Y-%m-%d}<br>Close Price: $%{y:,.2f}<br><extra></extra>'))
+    fig.update_layout(xaxis_title=None, yaxis_title=None, title={'text': title, 'x': 0, 'y': 1, 'xanchor': 'left', 'yanchor': 'top'},
+                      xaxis_tickformat='%Y-%m-%d', showlegend=False, margin=dict(t=25, b=0, l=0, r=0))
+    fig.update_yaxes(tickformat='$,.0f')
+    return fig
+
+
+# Function to check the new candlestick hover labels match the old ones
+def check(df):
+    legacy = list(legacy_candle_stick_chart(df).data[0].hovertext)
+    current = list(sc.candle_stick_chart(df).data[0].hovertext)
+    assert legacy == current
+
+
+# Function to time a figure builder, best of repeat, in milliseconds
+def best_ms(build, repeat):
+    return min(timeit.repeat(build, number=1, repeat=repeat)) * 1000
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark stock figure build time against bar count')
+    parser.add_argument('--bars', nargs='+', type=int, default=[250, 500, 1000, 2500, 5000, 10000])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    check(synthetic_bars(500))
+
+    rows = []
+    for n in args.bars:
+        df = synthetic_bars(n)
+        rows.append({
+            'bars': n,
+            'candle_legacy_ms': best_ms(lambda: legacy_candle_stick_chart(df), args.repeat),
+            'candle_ms': best_ms(lambda: sc.candle_stick_chart(df), args.repeat),
+            'line_legacy_ms': best_ms(lambda: legacy_time_series_chart(df, 'Benchmark'), args.repeat),
+            'line_ms': best_ms(lambda: sc.time_series_chart(df, 'Benchmark'), args.repeat),
+        })
+
+    results_df = pd.DataFrame(rows)
+    results_df['candle_speedup'] = results_df['candle_legacy_ms'] / results_df['candle_ms']
+    results_df['line_speedup'] = results_df['line_legacy_ms'] / results_df['line_ms']
+    print(results_df.round(2).to_string(index=False))
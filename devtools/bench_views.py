@@ -0,0 +1,155 @@
+#%%
+'''
+Renders every view in app.py with Streamlit's AppTest against recorded http fixtures, and reports wall time, peak
+memory and upstream request counts per view. Each view is rendered cold (empty caches) and then warm (a rerun in the
+same session). Runs offline with dummy api keys, so it can run in CI. Every cache and store lives in a temp directory
+for the run, so results don't depend on local state. The committed fixtures in devtools/fixtures are synthetic (see
+devtools/record_fixtures.py), and so is the zip code file the weather and 14ers views read, devtools/fixtures/uszips.csv
+unless DASHBOARD_ZIPCODES_PATH is set.
+
+Usage:
+    python -m devtools.bench_views [--views Weather "Stock Market"] [--json results.json]
+    python -m devtools.bench_views --baseline results.json --tolerance 0.25   # Fail on a >25% wall time regression
+'''
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Every store the dashboard reads or writes goes under one temp directory, so a run neither depends on nor changes
+# the local data directory and every upstream request is served from (or recorded to) the fixtures. Has to be set
+# before the dashboard's modules are imported
+BENCH_DATA_PATH = tempfile.mkdtemp(prefix='bench-views-')
+os.environ.setdefault('DASHBOARD_HTTP_MODE', 'replay')
+os.environ.setdefault('DASHBOARD_METRICS_PORT', '0')
+os.environ.update({
+    'DASHBOARD_CACHE_PATH': os.path.join(BENCH_DATA_PATH, 'cache', 'fetch_cache.sqlite'),
+    'DASHBOARD_VINTAGE_CATALOG_PATH': os.path.join(BENCH_DATA_PATH, 'cache', 'acs_vintages.json'),
+    'DASHBOARD_ACS_STORE_PATH': os.path.join(BENCH_DATA_PATH, 'acs_store'),
+    'DASHBOARD_BAR_STORE_PATH': os.path.join(BENCH_DATA_PATH, 'bar_store'),
+    'DASHBOARD_GEO_DATA_PATH': os.path.join(BENCH_DATA_PATH, 'geo'),
+})
+os.environ.setdefault('DASHBOARD_ZIPCODES_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'uszips.csv'))
+
+import pandas as pd
+from streamlit.testing.v1 import AppTest
+import functions.http_client as hc
+import functions.http_fixtures as fixtures
+import functions.housing_statistics.geo_build as gb
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'app.py')
+
+VIEWS = ['Weather', 'Stock Market', 'News and Research', 'Housing Statistics', 'Colorado 14ers']
+
+# Secrets the pages read at import, any value works against fixtures
+DUMMY_SECRETS = {
+    'weather_api_key': 'replay',
+    'news_api_key': 'replay',
+    'polygon_stock_api_key': 'replay',
+    'finnhub_api_key': 'replay',
+    'census_api_key': 'replay',
+}
+
+
+# Function to build the geography data into the temp directory, from the fixtures in replay mode (recording them in
+# record mode), so the housing view has it without touching data/geo
+def prepare_geo():
+    if os.path.exists(gb.artifact_path(gb.FIPS_ARTIFACT)):
+        return
+    try:
+        gb.build()
+    except Exception as e:
+        print(f'Could not build the geography data, the housing view will fail: {e}')
+
+
+# Function to check there are fixtures to replay, the benchmark can't run without them
+def check_fixtures():
+    if fixtures.HTTP_MODE == 'replay' and not os.path.isdir(fixtures.FIXTURES_PATH):
+        print(f'No fixtures in {fixtures.FIXTURES_PATH}, record them with: python -m devtools.record_fixtures --synthetic')
+        sys.exit(1)
+
+
+# Function to run one script run of an AppTest and measure it
+def measure(at, timeout):
+    counts_before = dict(hc.REQUEST_COUNTS)
+    tracemalloc.start()
+    start = time.perf_counter()
+    at.run(timeout=timeout)
+    seconds = time.perf_counter() - start
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    requests_made = {host: count - counts_before.get(host, 0) for host, count in hc.REQUEST_COUNTS.items() if count != counts_before.get(host, 0)}
+    return {
+        'seconds': round(seconds, 3),
+        'peak_mb': round(peak_bytes / 1024 ** 2, 1),
+        'requests': sum(requests_made.values()),
+        'requests_by_host': requests_made,
+        'exceptions': [exception.value for exception in at.exception],
+    }
+
+
+# Function to render one view cold and then warm
+def bench_view(view, timeout=120, secrets=None):
+    '''
+    Parameters:
+        - view: Key into app.py's VIEW_REGISTRY
+        - timeout: Seconds a single script run may take
+        - secrets: Secrets to give the app, None to use .streamlit/secrets.toml
+
+    Returns:
+        - rows: One result dict for the cold render and one for the warm render
+    '''
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    if secrets is not None:
+        at.secrets = secrets
+    at.session_state['view_selection'] = view
+
+    rows = []
+    for run in ['cold', 'warm']:
+        rows.append({'view': view, 'run': run, **measure(at, timeout)})
+    return rows
+
+
+# Function to compare results to a saved baseline
+def regressions(df, baseline_path, tolerance):
+    baseline = pd.DataFrame(json.load(open(baseline_path)))[['view', 'run', 'seconds']]
+    merged = df.merge(baseline, on=['view', 'run'], suffixes=('', '_baseline'))
+    return merged[merged['seconds'] > merged['seconds_baseline'] * (1 + tolerance)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark every dashboard view against recorded fixtures')
+    parser.add_argument('--views', nargs='+', default=VIEWS)
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--json', help='Write the results to this file')
+    parser.add_argument('--baseline', help='Results file from an earlier run to compare wall times against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    check_fixtures()
+    prepare_geo()
+    secrets = DUMMY_SECRETS if os.environ['DASHBOARD_HTTP_MODE'] == 'replay' else None
+    rows = [row for view in args.views for row in bench_view(view, args.timeout, secrets)]
+    df = pd.DataFrame(rows)
+
+    with pd.option_context('display.width', 200, 'display.max_colwidth', 60):
+        print(df[['view', 'run', 'seconds', 'peak_mb', 'requests', 'requests_by_host']].to_string(index=False))
+    for row in rows:
+        for exception in row['exceptions']:
+            print(f"{row['view']} ({row['run']}) raised: {exception}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=1)
+
+    failed = any(row['exceptions'] for row in rows)
+    if args.baseline:
+        slower = regressions(df, args.baseline, args.tolerance)
+        for row in slower.itertuples():
+            print(f'{row.view} ({row.run}) took {row.seconds}s, baseline {row.seconds_baseline}s')
+        failed = failed or not slower.empty
+    sys.exit(1 if failed else 0)
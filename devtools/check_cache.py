@@ -0,0 +1,115 @@
+#%%
+'''
+Checks for the keying, eviction and failure tracking behaviour of functions/cache.py, runnable without network access or api keys.
+Exits non-zero if a check fails.
+
+Usage:
+    python -m devtools.check_cache
+'''
+import concurrent.futures
+import functions.cache as cache
+import functions.upstreams as upstreams
+
+# Roughly 1KB per value, so a 3000 byte budget holds two
+VALUE = b'x' * 1000
+
+
+# A new key inserted into a full LFU cache is kept, and the least used older entry is evicted instead
+def check_lfu_keeps_inserted_key():
+    sized = cache.SizedCache('check_lfu', max_bytes=3000, policy='lfu')
+    sized.put('popular', VALUE)
+    for _ in range(5):
+        sized.get('popular')
+    sized.put('old', VALUE)
+    sized.put('new', VALUE)
+    assert sized.get('new') is not None, 'the inserted key was evicted'
+    assert sized.get('popular') is not None, 'the most used key was evicted'
+    assert 'old' not in sized.entries, 'the least used key was kept'
+
+
+# Every new key of a full LFU cached function misses once and then hits
+def check_lfu_new_keys_hit():
+    calls = []
+
+    @cache.cached(max_bytes=3000, policy='lfu')
+    def fetch(key):
+        calls.append(key)
+        return VALUE
+
+    for key in range(1, 8):
+        fetch(key)
+        fetch(key)
+    assert calls == list(range(1, 8)), f'new keys missed more than once: {calls}'
+
+
+# LFU hit counts are halved as the cache is used, so old popularity fades
+def check_lfu_aging():
+    sized = cache.SizedCache('check_aging', max_bytes=3000, policy='lfu')
+    sized.put('a', VALUE)
+    for _ in range(cache.LFU_AGING_HITS):
+        sized.get('a')
+    assert sized.entries['a'].hits == cache.LFU_AGING_HITS // 2, sized.entries['a'].hits
+
+
+# LRU still evicts the least recently used entry, and never the one being inserted
+def check_lru():
+    sized = cache.SizedCache('check_lru', max_bytes=3000, policy='lru')
+    sized.put('a', VALUE)
+    sized.put('b', VALUE)
+    sized.get('a')
+    sized.put('c', VALUE)
+    assert list(sized.entries) == ['a', 'c'], list(sized.entries)
+
+
+# A failure recorded on a worker thread reaches the cached function's scope, so its partial result isn't cached
+def check_worker_failures_reach_scope():
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=2)
+    failing = {'on': True}
+
+    def fetch_part(part):
+        if failing['on'] and part == 2:
+            upstreams.record_failure('example.com', 'ConnectionError')
+            return None
+        return part
+
+    @cache.cached(max_bytes=3000)
+    def fetch_all():
+        return [part for part in executor.map(upstreams.run_in_context(fetch_part), [1, 2, 3]) if part is not None]
+
+    assert fetch_all() == [1, 3]
+    failing['on'] = False
+    assert fetch_all() == [1, 2, 3], 'the partial result was cached'
+    assert fetch_all() == [1, 2, 3]
+    assert fetch_all.cache_info()['hits'] == 1, fetch_all.cache_info()
+
+
+# Calls that bind the same arguments share a cache entry, however they are passed
+def check_bound_arguments_share_key():
+    calls = []
+
+    @cache.cached()
+    def fetch(a, b=1, *, c=2):
+        calls.append((a, b, c))
+        return VALUE
+
+    fetch('x', 1)
+    fetch('x', b=1)
+    fetch('x')
+    fetch(a='x', c=2)
+    fetch('x', 2)
+    assert calls == [('x', 1, 2), ('x', 2, 2)], f'equivalent calls missed each other: {calls}'
+
+
+CHECKS = [check_bound_arguments_share_key, check_lfu_keeps_inserted_key, check_lfu_new_keys_hit, check_lfu_aging, check_lru, check_worker_failures_reach_scope]
+
+
+if __name__ == '__main__':
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f'ok      {check.__name__}')
+        except AssertionError as e:
+            failed += 1
+            print(f'FAILED  {check.__name__}: {e}')
+    raise SystemExit(1 if failed else 0)
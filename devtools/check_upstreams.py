@@ -0,0 +1,96 @@
+#%%
+'''
+Checks each failure mode of devtools/upstream_stub.py against the http client and cache. For throttle, error, hang
+and reset, a cached fetch from a stubbed upstream fails, the upstream's circuit breaker opens, and the last good value
+is served stale, without waiting once the breaker is open. Runnable without network access or api keys.
+Exits non-zero if a check fails.
+
+Usage:
+    python -m devtools.check_upstreams
+'''
+import os
+import tempfile
+import time
+import devtools.upstream_stub as stub
+
+# The stub has to be running and the http client pointed at it before the dashboard's modules are imported. A short
+# read timeout so the hang mode fails in a second
+server = stub.serve(port=0)
+os.environ['DASHBOARD_UPSTREAM_BASE_URL'] = f'http://127.0.0.1:{server.server_address[1]}'
+os.environ['DASHBOARD_HTTP_MODE'] = 'live'
+os.environ['DASHBOARD_HTTP_READ_TIMEOUT'] = '1'
+stub.settings['fixtures'] = tempfile.mkdtemp(prefix='check-upstreams-')
+
+import functions.cache as cache
+import functions.http_client as hc
+import functions.upstreams as upstreams
+
+# Cut the retry waits so each check takes a second or two, the throttle mode's Retry-After is capped at BACKOFF_MAX
+hc.BACKOFF_BASE = 0.01
+hc.BACKOFF_MAX = 0.05
+
+# Seconds the checked fetch's results stay fresh
+TTL = 0.5
+
+
+# Function to check one failure mode, on its own stubbed host so every mode gets its own breaker
+def check_failure_mode(mode):
+    host = f'{mode}.upstream.check'
+    upstreams.UPSTREAM_POLICIES[host] = {'failure_threshold': 2, 'reset_timeout': 60}
+    with open(os.path.join(stub.settings['fixtures'], f'{host}.json'), 'w') as f:
+        f.write(f'{{"value": "{mode}"}}')
+
+    # Fails like the dashboard's fetchers do, printing and returning None on a bad status and raising on network errors
+    @cache.cached(ttl=TTL)
+    def fetch():
+        response = hc.get(f'https://{host}/value', max_retries=1)
+        if response.status_code != 200:
+            print(f"Error fetching data: {response.status_code}")
+            return None
+        return response.json()
+
+    stub.modes[host] = 'ok'
+    assert fetch() == {'value': mode}, 'the stub did not serve the good value'
+
+    stub.modes[host] = mode
+    time.sleep(TTL)
+    served = fetch.with_age()
+    assert served.value == {'value': mode} and served.stale, f'the last good value was not served stale: {served}'
+    assert upstreams.get_upstream(host).breaker.state == 'open', upstreams.get_upstream(host).info()
+
+    start = time.monotonic()
+    served = fetch.with_age()
+    assert served.value == {'value': mode} and served.stale, f'the last good value was not served stale: {served}'
+    assert time.monotonic() - start < 0.5, 'the open breaker did not fail fast'
+    assert fetch.cache_info()['degraded'] == 2, fetch.cache_info()
+
+
+def check_throttle():
+    check_failure_mode('throttle')
+
+
+def check_error():
+    check_failure_mode('error')
+
+
+def check_hang():
+    check_failure_mode('hang')
+
+
+def check_reset():
+    check_failure_mode('reset')
+
+
+CHECKS = [check_throttle, check_error, check_hang, check_reset]
+
+
+if __name__ == '__main__':
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f'ok      {check.__name__}')
+        except AssertionError as e:
+            failed += 1
+            print(f'FAILED  {check.__name__}: {e}')
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,304 @@
+#%%
+'''
+Load test for the dashboard. Starts a Streamlit server in replay mode (see functions/http_fixtures.py) and drives N
+simulated sessions over Streamlit's websocket protocol, the same way browsers do. Each session loops through a
+scripted tour of the views: entering zip codes, switching views, moving the year sliders and changing the stock
+selection. Every step is one script rerun, and its latency is the time from sending the rerun to the server reporting
+the script finished.
+
+For each session count it reports rerun latency percentiles, throughput, the server's thread count and memory, and
+where throughput stops growing with more sessions.
+
+Usage:
+    python -m devtools.load_test --sessions 1 2 4 8 16 32 --duration 30
+    python -m devtools.load_test --url http://127.0.0.1:8501 --pid 12345   # An already running server
+'''
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+import numpy as np
+import pandas as pd
+import psutil
+from tornado.websocket import websocket_connect
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+from devtools.bench_views import APP_PATH, DUMMY_SECRETS, check_fixtures, prepare_geo
+
+# Widgets a step can change
+WIDGET_TYPES = {'selectbox', 'slider', 'radio', 'checkbox', 'text_input'}
+
+# A throughput gain smaller than this from doubling sessions counts as saturated
+SATURATION_GAIN = 0.1
+
+
+# Widget matchers, by label, by the key in the widget's id, or by placeholder
+def label(text):
+    return lambda proto: proto.label == text
+
+
+def key(widget_key):
+    return lambda proto: proto.id.endswith(f'-{widget_key}')
+
+
+def placeholder(text):
+    return lambda proto: text in getattr(proto, 'placeholder', '')
+
+
+class SimulatedSession:
+    '''
+    One browser tab, connected to the server's websocket. Keeps the widget values it has set and sends them with every
+    rerun like the frontend does, and tracks the widgets drawn by the latest run so steps can find them.
+    '''
+    def __init__(self, url, rng):
+        self.url = url.replace('http', 'ws', 1).rstrip('/') + '/_stcore/stream'
+        self.rng = rng
+        self.page_script_hash = ''
+        self.widget_states = {}
+        self.widgets = {}
+        self.message_cache = {}
+
+    async def connect(self):
+        self.ws = await websocket_connect(self.url, max_message_size=512 * 1024 ** 2, subprotocols=['streamlit'])
+
+    def close(self):
+        self.ws.close()
+
+    async def rerun(self):
+        '''
+        Returns:
+            - (seconds, errors): How long the rerun took and how many exceptions the page showed
+        '''
+        msg = BackMsg()
+        msg.rerun_script.query_string = ''
+        msg.rerun_script.page_script_hash = self.page_script_hash
+        msg.rerun_script.widget_states.widgets.extend(self.widget_states.values())
+
+        self.widgets = {}
+        errors = 0
+        start = time.perf_counter()
+        await self.ws.write_message(msg.SerializeToString(), binary=True)
+        while True:
+            data = await self.ws.read_message()
+            if data is None:
+                raise ConnectionError('Server closed the websocket')
+            forward = ForwardMsg()
+            forward.ParseFromString(data)
+
+            # Large messages the session has already received are sent as a reference to the earlier copy
+            if forward.ref_hash:
+                forward = self.message_cache.get(forward.ref_hash, forward)
+            elif forward.hash:
+                self.message_cache[forward.hash] = forward
+
+            kind = forward.WhichOneof('type')
+            if kind == 'new_session':
+                self.page_script_hash = forward.new_session.page_script_hash
+            elif kind == 'delta' and forward.delta.WhichOneof('type') == 'new_element':
+                element = forward.delta.new_element
+                element_type = element.WhichOneof('type')
+                if element_type in WIDGET_TYPES:
+                    self.widgets[getattr(element, element_type).id] = (element_type, getattr(element, element_type))
+                elif element_type == 'exception':
+                    errors += 1
+            elif kind == 'script_finished' and forward.script_finished != ForwardMsg.FINISHED_EARLY_FOR_RERUN:
+                return time.perf_counter() - start, errors
+
+    def find(self, matcher):
+        for widget_type, proto in self.widgets.values():
+            if matcher(proto):
+                return widget_type, proto
+        return None, None
+
+    # Pick an option of a selectbox or radio, a random one if option is None
+    def select(self, matcher, option=None):
+        widget_type, proto = self.find(matcher)
+        if proto is None:
+            return False
+        index = list(proto.options).index(option) if option is not None else self.rng.randrange(len(proto.options))
+        self.widget_states[proto.id] = WidgetState(id=proto.id, int_value=index)
+        return True
+
+    # Move a range slider to a random sub range
+    def slide(self, matcher):
+        widget_type, proto = self.find(matcher)
+        if proto is None:
+            return False
+        low, high = sorted(self.rng.uniform(proto.min, proto.max) for _ in range(2))
+        if proto.data_type == proto.INT:
+            low, high = round(low), round(high)
+        state = WidgetState(id=proto.id)
+        state.double_array_value.data.extend([low, high])
+        self.widget_states[proto.id] = state
+        return True
+
+
+# The scripted tour each session loops through, (step name, action), where a step whose widget isn't on the page is skipped
+SCENARIO = [
+    ('Weather zip code', lambda s: s.select(label('**Enter Zipcode**'))),
+    ('Switch to Stock Market', lambda s: s.select(label('#### View Selection'), 'Stock Market')),
+    ('Stock selection', lambda s: s.select(placeholder('Enter a stock symbol'))),
+    ('Candlestick slider', lambda s: s.slide(key('slider_stock'))),
+    ('Market history slider', lambda s: s.slide(key('slider_markets'))),
+    ('Switch to Housing Statistics', lambda s: s.select(label('#### View Selection'), 'Housing Statistics')),
+    ('Housing year slider', lambda s: s.slide(key('slider_key_1'))),
+    ('Housing burden level', lambda s: s.select(label('**Geographic Level Selection**'))),
+    ('Switch to News and Research', lambda s: s.select(label('#### View Selection'), 'News and Research')),
+    ('Switch to Colorado 14ers', lambda s: s.select(label('#### View Selection'), 'Colorado 14ers')),
+    ('14ers zip code', lambda s: s.select(label('**Enter Zipcode**'))),
+    ('Switch to Weather', lambda s: s.select(label('#### View Selection'), 'Weather')),
+]
+
+
+# Function to run one simulated session until the deadline
+async def run_session(url, deadline, seed, results):
+    session = SimulatedSession(url, random.Random(seed))
+    await asyncio.sleep(session.rng.uniform(0, 1))
+    await session.connect()
+    try:
+        seconds, errors = await session.rerun()
+        results.append(('Initial load', seconds, errors, time.monotonic()))
+        while time.monotonic() < deadline:
+            for step, action in SCENARIO:
+                if time.monotonic() >= deadline:
+                    break
+                if not action(session):
+                    continue
+                seconds, errors = await session.rerun()
+                results.append((step, seconds, errors, time.monotonic()))
+    finally:
+        session.close()
+
+
+# Function to sample the server's threads and memory while a level runs
+async def sample_process(process, deadline, samples):
+    while time.monotonic() < deadline:
+        if process is not None:
+            samples.append((process.num_threads(), process.memory_info().rss))
+        await asyncio.sleep(0.5)
+
+
+# Function to run one session count for a fixed duration
+async def run_level(url, n_sessions, duration, process):
+    results, samples = [], []
+    deadline = time.monotonic() + duration
+    await asyncio.gather(
+        sample_process(process, deadline, samples),
+        *[run_session(url, deadline, seed, results) for seed in range(n_sessions)],
+    )
+
+    df = pd.DataFrame(results, columns=['step', 'seconds', 'errors', 'finished'])
+    latencies = df['seconds'].to_numpy() * 1000
+    threads = max((threads for threads, rss in samples), default=np.nan)
+    rss_mb = max((rss for threads, rss in samples), default=np.nan) / 1024 ** 2
+    return {
+        'sessions': n_sessions,
+        'reruns': len(df),
+        'throughput': len(df) / duration,
+        'p50_ms': np.percentile(latencies, 50) if len(df) else np.nan,
+        'p95_ms': np.percentile(latencies, 95) if len(df) else np.nan,
+        'p99_ms': np.percentile(latencies, 99) if len(df) else np.nan,
+        'errors': int(df['errors'].sum()),
+        'threads': threads,
+        'rss_mb': rss_mb,
+    }, df
+
+
+# Function to find the first session count where more sessions stop adding throughput
+def saturation_point(summary_df):
+    previous = None
+    for row in summary_df.itertuples():
+        if previous is not None and row.throughput < previous.throughput * (1 + SATURATION_GAIN):
+            return previous.sessions
+        previous = row
+    return None
+
+
+# Function to start a dashboard server in replay mode with dummy secrets
+def start_server(port):
+    home = tempfile.mkdtemp(prefix='load-test-')
+    os.makedirs(os.path.join(home, '.streamlit'))
+    with open(os.path.join(home, '.streamlit', 'secrets.toml'), 'w') as f:
+        f.writelines(f'{name} = "{value}"\n' for name, value in DUMMY_SECRETS.items())
+
+    # os.environ already points every store at bench_views' temp directory
+    env = {
+        **os.environ,
+        'HOME': home,
+        'DASHBOARD_HTTP_MODE': os.environ.get('DASHBOARD_HTTP_MODE', 'replay'),
+        'DASHBOARD_METRICS_PORT': '0',
+        'DASHBOARD_CACHE_PATH': os.path.join(home, 'fetch_cache.sqlite'),
+    }
+    command = [sys.executable, '-m', 'streamlit', 'run', APP_PATH, '--server.headless', 'true',
+               '--server.port', str(port), '--browser.gatherUsageStats', 'false']
+    server = subprocess.Popen(command, cwd=os.path.dirname(APP_PATH), env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(120):
+        try:
+            urllib.request.urlopen(f'{url}/_stcore/health', timeout=1)
+            return server, url
+        except OSError:
+            time.sleep(0.5)
+    server.kill()
+    raise RuntimeError('Streamlit server did not start')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive simulated sessions through the dashboard and report how it scales')
+    parser.add_argument('--sessions', nargs='+', type=int, default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run each session count for')
+    parser.add_argument('--port', type=int, default=8599)
+    parser.add_argument('--url', help='Test an already running server instead of starting one')
+    parser.add_argument('--pid', type=int, help="The running server's process id, for thread and memory stats")
+    parser.add_argument('--steps', action='store_true', help='Also report latency by scenario step')
+    parser.add_argument('--csv', help='Write the summary to this file')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        url = args.url
+        process = psutil.Process(args.pid) if args.pid else None
+    else:
+        check_fixtures()
+        prepare_geo()
+        server, url = start_server(args.port)
+        process = psutil.Process(server.pid)
+
+    try:
+        summaries, step_dfs = [], []
+        for n_sessions in args.sessions:
+            summary, df = asyncio.run(run_level(url, n_sessions, args.duration, process))
+            summaries.append(summary)
+            step_dfs.append(df.assign(sessions=n_sessions))
+            print(f"{n_sessions:>4} sessions: {summary['throughput']:6.1f} reruns/s, p95 {summary['p95_ms']:8.1f} ms, "
+                  f"{summary['threads']} threads, {summary['rss_mb']:.0f} MB")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    summary_df = pd.DataFrame(summaries)
+    summary_df['rss_mb_per_session'] = summary_df['rss_mb'] / summary_df['sessions']
+    print()
+    print(summary_df.round(1).to_string(index=False))
+
+    if args.steps:
+        steps_df = pd.concat(step_dfs).groupby(['sessions', 'step'])['seconds'].describe(percentiles=[0.5, 0.95])
+        print()
+        print((steps_df[['count', '50%', '95%']] * [1, 1000, 1000]).round(1).rename(columns={'50%': 'p50_ms', '95%': 'p95_ms'}).to_string())
+
+    saturated = saturation_point(summary_df)
+    if saturated is None:
+        print(f'\nThroughput was still growing at {summary_df["sessions"].max()} sessions')
+    else:
+        print(f'\nThroughput saturates at about {saturated} sessions ({summary_df.loc[summary_df["sessions"] == saturated, "throughput"].iloc[0]:.1f} reruns/s)')
+
+    if args.csv:
+        summary_df.to_csv(args.csv, index=False)
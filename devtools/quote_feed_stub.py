@@ -0,0 +1,75 @@
+#%%
+'''
+Local stand-in for Finnhub's trade stream (wss://ws.finnhub.io), speaking the same protocol: clients send
+{"type": "subscribe", "symbol": "AAPL"} / {"type": "unsubscribe", ...} and receive
+{"type": "trade", "data": [{"s": "AAPL", "p": 189.3, "t": 1718000000000, "v": 100}]} messages, plus pings.
+Prices are a random walk per symbol.
+
+Usage:
+    python -m devtools.quote_feed_stub --port 8766 --interval 0.5
+    DASHBOARD_QUOTE_FEED_URL=ws://127.0.0.1:8766 streamlit run app.py
+'''
+import argparse
+import asyncio
+import json
+import random
+import time
+import tornado.web
+import tornado.websocket
+
+clients = set()
+
+
+class TradeStreamHandler(tornado.websocket.WebSocketHandler):
+    def open(self):
+        self.symbols = set()
+        clients.add(self)
+
+    def on_message(self, message):
+        message = json.loads(message)
+        if message.get('type') == 'subscribe':
+            self.symbols.add(message['symbol'])
+        elif message.get('type') == 'unsubscribe':
+            self.symbols.discard(message['symbol'])
+
+    def on_close(self):
+        clients.discard(self)
+
+
+# Sends every client a trade for each of its symbols every interval, and a ping every 10 seconds
+async def publish(interval):
+    prices = {}
+    last_ping = time.monotonic()
+    while True:
+        await asyncio.sleep(interval)
+        now = int(time.time() * 1000)
+        for client in list(clients):
+            trades = []
+            for symbol in client.symbols:
+                price = prices.get(symbol, random.uniform(20, 500))
+                prices[symbol] = round(max(1, price * (1 + random.gauss(0, 0.001))), 2)
+                trades.append({'s': symbol, 'p': prices[symbol], 't': now, 'v': random.randint(1, 500)})
+            try:
+                if trades:
+                    client.write_message(json.dumps({'type': 'trade', 'data': trades}))
+                if time.monotonic() - last_ping > 10:
+                    client.write_message(json.dumps({'type': 'ping'}))
+            except tornado.websocket.WebSocketClosedError:
+                clients.discard(client)
+        if time.monotonic() - last_ping > 10:
+            last_ping = time.monotonic()
+
+
+async def main(port, interval):
+    app = tornado.web.Application([(r'/', TradeStreamHandler)])
+    app.listen(port, address='127.0.0.1')
+    print(f'Stub trade stream on ws://127.0.0.1:{port}')
+    await publish(interval)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in for the Finnhub trade stream')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--interval', type=float, default=0.5, help='Seconds between trades for each symbol')
+    args = parser.parse_args()
+    asyncio.run(main(args.port, args.interval))
@@ -0,0 +1,82 @@
+#%%
+'''
+Records the http fixtures devtools/bench_views.py and devtools/load_test.py replay, by rendering every view in app.py
+and saving every response. Api keys are never written to the fixtures. Every cache and store starts empty in a temp
+directory (see bench_views.py), so every request a view can make is recorded rather than served from local data.
+Re-run it when a fetcher starts calling a new endpoint.
+
+The committed fixtures are recorded with --synthetic, against devtools/synthetic_upstreams.py instead of the real
+upstreams, so they can be re-recorded anywhere without network access or api keys. That mode also renders the views
+once for every zip code, stock and housing map level the load test can pick. Without --synthetic the real upstreams
+are recorded, with the api keys in .streamlit/secrets.toml, for realistic payloads to benchmark against.
+
+Usage:
+    python -m devtools.record_fixtures --synthetic
+    python -m devtools.record_fixtures [--views Weather "Stock Market"]
+'''
+import argparse
+import os
+
+# Has to be set before the dashboard's modules are imported
+os.environ['DASHBOARD_HTTP_MODE'] = 'record'
+
+from streamlit.testing.v1 import AppTest
+import functions.http_client as hc
+import functions.http_fixtures as fixtures
+import functions.upstreams as upstreams
+import devtools.synthetic_upstreams as synthetic
+from devtools.bench_views import APP_PATH, DUMMY_SECRETS, VIEWS, bench_view, prepare_geo
+
+# Selectboxes whose every option the load test can pick, as (view, label or placeholder)
+LOAD_TEST_OPTIONS = [
+    ('Weather', '**Enter Zipcode**'),
+    ('Stock Market', 'Enter a stock symbol'),
+    ('Housing Statistics', '**Geographic Level Selection**'),
+]
+
+
+# Function to render a view once for every option of one of its selectboxes
+def record_options(view, label, timeout, secrets=None):
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    if secrets is not None:
+        at.secrets = secrets
+    at.session_state['view_selection'] = view
+    at.run()
+
+    find = lambda: next(selectbox for selectbox in at.selectbox if label == selectbox.label or label in selectbox.proto.placeholder)
+    for option in find().options:
+        find().set_value(option)
+        at.run()
+        for exception in at.exception:
+            print(f'{view} with {option} raised: {exception.value}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Record http fixtures for every dashboard view')
+    parser.add_argument('--views', nargs='+', default=VIEWS)
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--synthetic', action='store_true', help='Record devtools/synthetic_upstreams.py instead of the real upstreams')
+    args = parser.parse_args()
+
+    secrets = None
+    if args.synthetic:
+        # Every request goes to the local server, so the real upstreams' rate limits don't apply, and there's no
+        # trade stream to connect to (the views read the recorded REST quotes instead)
+        server = synthetic.serve(port=0)
+        upstreams.UPSTREAM_BASE_URL = f'http://127.0.0.1:{server.server_address[1]}'
+        upstreams.UPSTREAM_POLICIES.clear()
+        os.environ['DASHBOARD_QUOTE_FEED_URL'] = ''
+        secrets = DUMMY_SECRETS
+
+    # Records the geography source downloads too, the caches and stores start empty so every request is recorded
+    prepare_geo()
+    for view in args.views:
+        cold, warm = bench_view(view, args.timeout, secrets)
+        print(f"{view}: {cold['requests']} requests recorded in {cold['seconds']}s")
+        for exception in cold['exceptions']:
+            print(f'{view} raised: {exception}')
+    if args.synthetic:
+        for view, label in LOAD_TEST_OPTIONS:
+            if view in args.views:
+                record_options(view, label, args.timeout, secrets)
+    print(f'Fixtures in {fixtures.FIXTURES_PATH}: {sum(hc.REQUEST_COUNTS.values())} requests')
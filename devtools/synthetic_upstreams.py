@@ -0,0 +1,379 @@
+#%%
+'''
+Local stand-in for every upstream the dashboard calls that answers with synthetic, deterministic data in each api's
+response format, so fixtures can be recorded without network access or api keys. The committed fixtures in
+devtools/fixtures were recorded against it:
+
+    python -m devtools.record_fixtures --synthetic
+
+It can also serve a running dashboard directly, requests arrive as /{upstream host}/{original path}:
+
+    python -m devtools.synthetic_upstreams --port 8766
+    DASHBOARD_UPSTREAM_BASE_URL=http://127.0.0.1:8766 streamlit run app.py
+
+The data is made up, every value is derived from a hash of what it describes (symbol, geography, year, ...) so the
+same request always gets the same answer. Only the shapes the dashboard's parsers read are filled in: 14 Colorado
+fourteeners, a six stock S&P 500 table, 64 counties on a grid of squares per state, and so on.
+'''
+import argparse
+import datetime
+import html
+import json
+import threading
+import zlib
+import numpy as np
+import us
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, unquote
+
+# States with counties, and the grid of counties each state is drawn as
+STATES = us.states.STATES + [us.states.DC, us.states.PR]
+COUNTY_GRID = 8
+
+# Rank, name, range, elevation in feet and meters, latitude and longitude
+FOURTEENERS = [
+    (1, 'Mount Elbert', 'Sawatch Range', 14440, 4401, 39.1178, -106.4454),
+    (2, 'Mount Massive', 'Sawatch Range', 14428, 4398, 39.1875, -106.4757),
+    (3, 'Mount Harvard', 'Sawatch Range', 14421, 4396, 38.9244, -106.3207),
+    (4, 'Blanca Peak', 'Sangre de Cristo Mountains', 14351, 4374, 37.5775, -105.4856),
+    (5, 'La Plata Peak', 'Sawatch Range', 14343, 4372, 39.0294, -106.4729),
+    (6, 'Uncompahgre Peak', 'San Juan Mountains', 14321, 4365, 38.0717, -107.4621),
+    (7, 'Crestone Peak', 'Sangre de Cristo Mountains', 14300, 4359, 37.9668, -105.5855),
+    (8, 'Mount Lincoln', 'Mosquito Range', 14293, 4356, 39.3515, -106.1116),
+    (9, 'Grays Peak', 'Front Range', 14278, 4352, 39.6339, -105.8176),
+    (10, 'Mount Antero', 'Sawatch Range', 14276, 4351, 38.6741, -106.2462),
+    (11, 'Torreys Peak', 'Front Range', 14275, 4351, 39.6428, -105.8212),
+    (12, 'Quandary Peak', 'Tenmile Range', 14271, 4350, 39.3973, -106.1064),
+    (13, 'Longs Peak', 'Front Range', 14259, 4346, 40.2550, -105.6151),
+    (14, 'Pikes Peak', 'Front Range', 14115, 4302, 38.8405, -105.0442),
+]
+
+# Symbol, name, and whether the stock is in the S&P 500 table (every one of them is picked for the ticker strip)
+STOCKS = [
+    ('AAPL', 'APPLE INC', True),
+    ('MSFT', 'MICROSOFT CORP', True),
+    ('AMZN', 'AMAZON.COM INC', True),
+    ('NVDA', 'NVIDIA CORP', True),
+    ('GOOGL', 'ALPHABET INC-CL A', True),
+    ('JPM', 'JPMORGAN CHASE & CO', True),
+    ('DIA', 'SPDR DOW JONES INDUSTRIAL AVERAGE ETF', False),
+    ('VOO', 'VANGUARD S&P 500 ETF', False),
+    ('XOM', 'EXXON MOBIL CORP', False),
+    ('KO', 'COCA-COLA CO/THE', False),
+]
+
+# First day of every synthetic price history
+PRICE_EPOCH = datetime.date(2015, 1, 2)
+
+# ACS variables as (parent, share of the parent, yearly growth), a root's share is its value for the whole country.
+# Medians have no parent and don't scale with a geography's size
+ACS_VARIABLES = {
+    'B01003_001E': (None, 330e6, 1.005),
+    'B25001_001E': ('B01003_001E', 0.43, 1.0),
+    'B25002_001E': ('B25001_001E', 1.0, 1.0),
+    'B25002_003E': ('B25002_001E', 0.1, 1.0),
+    'B25003_001E': ('B25002_001E', 0.9, 1.0),
+    'B25003_002E': ('B25003_001E', 0.65, 1.0),
+    'B25140_010E': ('B25003_001E', 0.35, 1.0),
+    'B25140_011E': ('B25140_010E', 0.45, 1.0),
+    'B05010_001E': ('B01003_001E', 0.98, 1.0),
+    'B05010_002E': ('B05010_001E', 0.13, 1.0),
+}
+ACS_MEDIANS = {
+    'B19013_001E': (60000, 1.03),
+    'B25119_002E': (85000, 1.03),
+    'B25119_003E': (42000, 1.03),
+    'B25058_001E': (900, 1.04),
+    'B25077_001E': (200000, 1.05),
+}
+
+
+# Function to get a deterministic number in [0, 1) for anything
+def unit(*parts):
+    return zlib.crc32(repr(parts).encode()) / 2 ** 32
+
+
+# Function to get the latest published ACS year as of today, releases come out in the fall after the survey year
+def latest_acs_year(today=None):
+    today = today or datetime.date.today()
+    return today.year - 1 if today.month >= 10 else today.year - 2
+
+
+# Function to list every synthetic county as (state, county FIPS code, county name, grid column, grid row)
+def counties():
+    for state in STATES:
+        for i in range(COUNTY_GRID ** 2):
+            yield state, f'{2 * i + 1:03d}', f'{state.name} County {i + 1}', i % COUNTY_GRID, i // COUNTY_GRID
+
+
+# Function to get an ACS value for one geography and year
+def acs_value(variable, geo_id, size, year):
+    if variable in ACS_MEDIANS:
+        base, growth = ACS_MEDIANS[variable]
+        return round(base * (0.7 + 0.6 * unit(variable, geo_id)) * growth ** (year - 2010) * (0.98 + 0.04 * unit(variable, geo_id, year)))
+    if variable not in ACS_VARIABLES:
+        return round(1000 * size * (0.5 + unit(variable, geo_id)))
+
+    parent, share, growth = ACS_VARIABLES[variable]
+    if parent is None:
+        return round(share * size * growth ** (year - 2010))
+    return round(acs_value(parent, geo_id, size, year) * share * (0.8 + 0.4 * unit(variable, geo_id)) * (0.98 + 0.04 * unit(variable, geo_id, year)))
+
+
+# Function to answer a Census api data request, or the dataset probe when there's no get parameter
+def census(path, query):
+    parts = path.strip('/').split('/')
+    year, acs_type = int(parts[1]), parts[3]
+    first_year = {'acs1': 2005, 'acs5': 2009}.get(acs_type)
+    if first_year is None or not first_year <= year <= latest_acs_year() or (acs_type == 'acs1' and year == 2020):
+        return 404, 'text/html', f'<p>There was an error while running your query: unknown dataset {year}/acs/{acs_type}</p>'
+    if 'get' not in query:
+        return 200, 'application/json', json.dumps({'dataset': [{'c_vintage': year, 'c_dataset': ['acs', acs_type]}]})
+
+    variables = query['get'][0].split(',')
+    level = query['for'][0].split(':')[0]
+    if level == 'us':
+        geographies = [('United States', ['1'], 1.0)]
+    elif level == 'state':
+        geographies = [(state.name, [state.fips], (0.3 + 2.2 * unit(state.fips)) / len(STATES)) for state in STATES]
+    elif level == 'county':
+        geographies = [(name, [state.fips, fips], (0.3 + 2.2 * unit(state.fips)) * (0.2 + 1.6 * unit(state.fips, fips)) / len(STATES) / COUNTY_GRID ** 2) for state, fips, name, column, row in counties()]
+    else:
+        return 400, 'text/plain', f'error: unknown/unsupported geography hierarchy {level}'
+
+    header = variables + {'us': ['us'], 'state': ['state'], 'county': ['state', 'county']}[level]
+    rows = [[name if variable == 'NAME' else str(acs_value(variable, '-'.join(codes), size, year)) for variable in variables] + codes for name, codes, size in geographies]
+    return 200, 'application/json', json.dumps([header] + rows)
+
+
+# Function to build the national_county.txt file
+def national_county():
+    return 200, 'text/plain', ''.join(f'{state.abbr},{state.fips},{fips},{name},H1\n' for state, fips, name, column, row in counties())
+
+
+# Function to build the county GeoJSON, every county a square whose borders are shared exactly with its neighbours
+def county_geojson():
+    # States on a grid over the lower 48's extent, counties on a grid inside each state
+    columns, rows = 9, 6
+    west, south, width, height = -124.0, 25.0, 57.0 / (columns * COUNTY_GRID), 24.0 / (rows * COUNTY_GRID)
+
+    # Both counties on an edge build it from the lattice points at its ends, so both get the same bent line
+    def edge(start, end):
+        (x0, y0), (x1, y1) = start, end
+        key = (min(start, end), max(start, end))
+        points = []
+        for step in range(1, 4):
+            offset = (unit('edge', key, step) - 0.5) * 0.1
+            x, y = x0 + (x1 - x0) * step / 4, y0 + (y1 - y0) * step / 4
+            points.append((x + offset * (y1 - y0), y + offset * (x1 - x0)))
+        return [start] + points
+
+    def position(x, y):
+        return [round(west + x * width, 4), round(south + y * height, 4)]
+
+    features = []
+    for index, (state, fips, name, column, row) in enumerate(counties()):
+        state_index = STATES.index(state)
+        x = (state_index % columns) * COUNTY_GRID + column
+        y = (state_index // columns) * COUNTY_GRID + row
+        corners = [(x, y), (x + 1, y), (x + 1, y + 1), (x, y + 1)]
+        ring = [point for start, end in zip(corners, corners[1:] + corners[:1]) for point in edge(start, end)]
+        features.append({
+            'type': 'Feature',
+            'properties': {'GEO_ID': f'0500000US{state.fips}{fips}', 'STATE': state.fips, 'COUNTY': fips, 'NAME': name, 'LSAD': 'County'},
+            'geometry': {'type': 'Polygon', 'coordinates': [[position(*point) for point in ring + ring[:1]]]},
+            'id': state.fips + fips,
+        })
+    return 200, 'application/json', json.dumps({'type': 'FeatureCollection', 'features': features}, separators=(',', ':'))
+
+
+# Function to answer weatherapi.com's current, astronomy and forecast endpoints
+def weather(path, query):
+    location = query.get('q', ['80501'])[0]
+    condition = {'text': 'Partly cloudy', 'icon': '//cdn.weatherapi.com/weather/64x64/day/116.png', 'code': 1003}
+    temp_f = round(40 + 40 * unit('temp', location), 1)
+
+    if path.endswith('/current.json'):
+        current = {
+            'temp_c': round((temp_f - 32) / 1.8, 1), 'temp_f': temp_f, 'is_day': 1, 'condition': condition,
+            'wind_mph': 6.9, 'wind_kph': 11.2, 'wind_dir': 'NW', 'pressure_in': 30.1, 'precip_in': 0.0, 'humidity': 35,
+            'cloud': 25, 'feelslike_f': temp_f - 2, 'vis_miles': 9.0, 'uv': 4.0, 'gust_mph': 9.4,
+            'air_quality': {'co': 230.3, 'no2': 13.5, 'o3': 68.7, 'so2': 2.1, 'pm2_5': 4.9, 'pm10': 6.2, 'us-epa-index': 1, 'gb-defra-index': 1},
+        }
+        return 200, 'application/json', json.dumps({'location': {'name': location}, 'current': current})
+
+    if path.endswith('/astronomy.json'):
+        astro = {'sunrise': '07:09 AM', 'sunset': '06:14 PM', 'moonrise': '03:21 PM', 'moonset': '02:47 AM', 'moon_phase': 'Waxing Gibbous', 'moon_illumination': 78, 'is_moon_up': 0, 'is_sun_up': 0}
+        return 200, 'application/json', json.dumps({'location': {'name': location}, 'astronomy': {'astro': astro}})
+
+    # The forecast's day keys are kept in weatherapi.com's order, the weather view reads some of them by position
+    days = []
+    for offset in range(int(query.get('days', ['3'])[0])):
+        date = datetime.date.today() + datetime.timedelta(days=offset)
+        high = round(temp_f + 10 * unit('high', location, offset), 1)
+        low = round(high - 20, 1)
+        rain = round(100 * unit('rain', location, offset))
+        days.append({'date': date.isoformat(), 'day': {
+            'maxtemp_c': round((high - 32) / 1.8, 1), 'maxtemp_f': high, 'mintemp_c': round((low - 32) / 1.8, 1), 'mintemp_f': low,
+            'avgtemp_c': round((high + low - 64) / 3.6, 1), 'avgtemp_f': round((high + low) / 2, 1), 'maxwind_mph': 12.1,
+            'maxwind_kph': 19.4, 'totalprecip_mm': 0.0, 'totalprecip_in': 0.0, 'totalsnow_cm': 0.0, 'avgvis_km': 10.0,
+            'avgvis_miles': 6.0, 'avghumidity': 40, 'daily_will_it_rain': int(rain > 50), 'daily_chance_of_rain': rain,
+            'daily_will_it_snow': 0, 'daily_chance_of_snow': 0, 'condition': condition, 'uv': 5.0,
+        }})
+    return 200, 'application/json', json.dumps({'location': {'name': location}, 'forecast': {'forecastday': days}})
+
+
+# Function to get a stock's synthetic daily closes, a random walk from PRICE_EPOCH through today
+def closes(symbol):
+    days = np.array([day for day in (PRICE_EPOCH + datetime.timedelta(days=i) for i in range((datetime.date.today() - PRICE_EPOCH).days + 1)) if day.weekday() < 5])
+    rng = np.random.default_rng(zlib.crc32(symbol.encode()))
+    prices = (50 + 400 * unit('price', symbol)) * np.exp(np.cumsum(rng.normal(0.0004, 0.015, len(days))))
+    return days, prices
+
+
+# Function to answer polygon.io's daily aggregates endpoint
+def polygon(path, query):
+    parts = path.strip('/').split('/')
+    symbol, start, end = parts[3], datetime.date.fromisoformat(parts[7]), datetime.date.fromisoformat(parts[8])
+    days, prices = closes(symbol)
+
+    results = []
+    for day, close in zip(days, prices):
+        if start <= day <= end:
+            spread = close * 0.01
+            timestamp = datetime.datetime.combine(day, datetime.time(5), datetime.timezone.utc).timestamp()
+            results.append({'v': round(1e6 * (1 + unit('volume', symbol, day))), 'o': round(close - spread / 2, 2), 'c': round(close, 2), 'h': round(close + spread, 2), 'l': round(close - spread, 2), 't': int(timestamp * 1000)})
+    return 200, 'application/json', json.dumps({'ticker': symbol, 'adjusted': True, 'resultsCount': len(results), 'results': results, 'status': 'OK'})
+
+
+# Function to answer finnhub.io's quote and symbol list endpoints
+def finnhub(path, query):
+    if path.endswith('/stock/symbol'):
+        symbols = [{'currency': 'USD', 'description': name, 'displaySymbol': symbol, 'symbol': symbol, 'type': 'Common Stock'} for symbol, name, sp500 in STOCKS]
+        return 200, 'application/json', json.dumps(symbols)
+
+    symbol = query.get('symbol', [''])[0]
+    days, prices = closes(symbol)
+    close, previous = round(prices[-1], 2), round(prices[-2], 2)
+    quote = {'c': close, 'd': round(close - previous, 2), 'dp': round(100 * (close - previous) / previous, 4), 'h': round(close * 1.01, 2), 'l': round(close * 0.99, 2), 'o': previous, 'pc': previous, 't': int(datetime.datetime.combine(days[-1], datetime.time(20)).timestamp())}
+    return 200, 'application/json', json.dumps(quote)
+
+
+# Function to answer the two Wikipedia lists the dashboard scrapes
+def wikipedia(path, query):
+    if 'S%26P_500' in path or 'S&P_500' in unquote(path):
+        rows = ''.join(f'<tr><td><a>{symbol}</a></td><td>{html.escape(name.title())}</td><td>Information Technology</td></tr>\n' for symbol, name, sp500 in STOCKS if sp500)
+        return 200, 'text/html', f'<html><body><table class="wikitable sortable" id="constituents">\n<tr><th>Symbol</th><th>Security</th><th>GICS Sector</th></tr>\n{rows}</table></body></html>'
+
+    rows = ''.join(
+        f'<tr><td>{rank}</td><td><a>{name}</a></td><td>{mountain_range}</td><td>{meters}.0&nbsp;m{feet:,}&nbsp;ft</td><td>1000 ft</td><td>10 mi</td>'
+        f'<td>{lat:.4f}°N {-long:.4f}°W / {lat:.4f}°N {-long:.4f}°W / {lat:.4f}; {long:.4f}</td></tr>\n'
+        for rank, name, mountain_range, feet, meters, lat, long in FOURTEENERS
+    )
+    return 200, 'text/html', f'<html><body><table class="wikitable sortable">\n<tr><th>Rank</th><th>Mountain Peak</th><th>Mountain Range</th><th>Elevation</th><th>Prominence</th><th>Isolation</th><th>Location</th></tr>\n{rows}</table></body></html>'
+
+
+# Function to answer mountain-forecast.com's peak lists and peak forecasts
+def mountain_forecast(path, query):
+    parts = path.strip('/').split('/')
+    if parts[0] == 'countries':
+        letter = parts[-1]
+        items = ''.join(f'<li><span><a>{name}</a></span><span>{meters} m</span></li>' for rank, name, mountain_range, feet, meters, lat, long in FOURTEENERS if name.lower().startswith(letter))
+        return 200, 'text/html', f'<html><body><ul class="b-list-table">{items}</ul></body></html>'
+
+    peak = parts[1]
+    phrases = ['clear', 'some clouds', 'light snow', 'mostly dry', 'risk of thunderstorms', 'rain shwrs']
+    today = datetime.date.today()
+    day_names = ''.join(f'<div class="forecast-table-days__name">{(today + datetime.timedelta(days=offset)).strftime("%A %d")}</div>' for offset in range(6))
+    times = ''.join(f'<div class="forecast-table__container forecast-table__time">{time_of_day}</div>' for offset in range(6) for time_of_day in ['AM', 'PM', 'night'])
+    conditions = ''.join(f'<span class="forecast-table__phrase forecast-table__phrase--en">{phrases[int(len(phrases) * unit(peak, slot))]}</span>' for slot in range(18))
+    return 200, 'text/html', f'<html><body>{day_names}{times}{conditions}</body></html>'
+
+
+# Function to answer newsapi.org's top headlines endpoint
+def news(path, query):
+    category = query.get('category', ['general'])[0]
+    articles = [{
+        'source': {'id': None, 'name': f'Example News {i + 1}'},
+        'author': f'Reporter {i + 1}',
+        'title': f'{category.title()} headline {i + 1}',
+        'description': f'Summary of the {category.lower()} story number {i + 1}.',
+        'url': f'https://news.example.com/{category.lower()}/{i + 1}',
+        'urlToImage': f'https://news.example.com/{category.lower()}/{i + 1}.jpg' if i % 3 else None,
+        'publishedAt': f'{datetime.date.today().isoformat()}T12:00:00Z',
+        'content': None,
+    } for i in range(int(query.get('pageSize', ['15'])[0]))]
+    return 200, 'application/json', json.dumps({'status': 'ok', 'totalResults': len(articles), 'articles': articles})
+
+
+# Function to answer arxiv's query endpoint with an Atom feed
+def arxiv(path, query):
+    entries = ''.join(f'''
+  <entry>
+    <id>http://arxiv.org/abs/2501.{10000 + i}v1</id>
+    <published>{datetime.date.today().isoformat()}T0{i % 10}:00:00Z</published>
+    <title>Synthetic economics paper {i + 1}</title>
+    <summary>{'An abstract sentence about housing, labor and prices. ' * 10}</summary>
+    <author><name>Author {2 * i + 1}</name></author>
+    <author><name>Author {2 * i + 2}</name></author>
+    <link href="http://arxiv.org/abs/2501.{10000 + i}v1" rel="alternate" type="text/html"/>
+    <link title="pdf" href="http://arxiv.org/pdf/2501.{10000 + i}v1" rel="related" type="application/pdf"/>
+  </entry>''' for i in range(int(query.get('max_results', ['10'])[0])))
+    return 200, 'application/atom+xml', f'<?xml version="1.0" encoding="UTF-8"?>\n<feed xmlns="http://www.w3.org/2005/Atom">\n  <title>arXiv Query</title>{entries}\n</feed>\n'
+
+
+# Every upstream host and the function that answers it
+HOSTS = {
+    'api.census.gov': census,
+    'www2.census.gov': lambda path, query: national_county(),
+    'raw.githubusercontent.com': lambda path, query: county_geojson(),
+    'api.weatherapi.com': weather,
+    'api.polygon.io': polygon,
+    'finnhub.io': finnhub,
+    'en.wikipedia.org': wikipedia,
+    'www.mountain-forecast.com': mountain_forecast,
+    'newsapi.org': news,
+    'export.arxiv.org': arxiv,
+}
+
+
+class SyntheticHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        host, path = (parsed.path.lstrip('/').split('/', 1) + [''])[:2]
+        if host not in HOSTS:
+            return self.send(404, 'text/plain', f'No synthetic upstream for {host}')
+        try:
+            self.send(*HOSTS[host]('/' + path, parse_qs(parsed.query)))
+        except Exception as e:
+            self.send(500, 'text/plain', f'{e.__class__.__name__}: {e}')
+
+    def send(self, status, content_type, body):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header('Content-Type', f'{content_type}; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the server on a background thread, for driving it from a script
+def serve(port=8766):
+    server = ThreadingHTTPServer(('127.0.0.1', port), SyntheticHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Synthetic upstream server for every api the dashboard calls')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), SyntheticHandler)
+    server.daemon_threads = True
+    print(f'Synthetic upstreams on http://127.0.0.1:{args.port}')
+    server.serve_forever()
@@ -0,0 +1,126 @@
+#%%
+'''
+Local stand-in for every upstream the dashboard calls, to see how the upstream policies, circuit breakers and degraded
+serving from cache behave when an upstream misbehaves. Point the dashboard at it with DASHBOARD_UPSTREAM_BASE_URL,
+requests arrive as /{upstream host}/{original path}.
+
+Failure modes, set per host (or '*' for every host):
+    - ok: 200 with the host's fixture body ({fixtures}/{host}.json), or {} if there isn't one
+    - slow: Waits --delay seconds, then behaves like ok
+    - hang: Never answers (until the client's read timeout)
+    - throttle: 429 with a Retry-After header
+    - error: 503
+    - reset: Closes the connection without answering
+
+Usage:
+    python -m devtools.upstream_stub --port 8765 --mode api.weatherapi.com=throttle --mode '*=ok'
+    DASHBOARD_UPSTREAM_BASE_URL=http://127.0.0.1:8765 streamlit run app.py
+
+    # Change a host's mode while both are running
+    curl 'http://127.0.0.1:8765/_stub/mode?host=newsapi.org&mode=hang'
+'''
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+MODES = ['ok', 'slow', 'hang', 'throttle', 'error', 'reset']
+
+modes = {'*': 'ok'}
+settings = {'delay': 5.0, 'fixtures': 'devtools/stub_responses'}
+requests_seen = {}
+lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/_stub/mode':
+            return self.set_mode(parse_qs(parsed.query))
+        if parsed.path == '/_stub/stats':
+            return self.send_json(200, {'modes': modes, 'requests': requests_seen})
+
+        host = parsed.path.lstrip('/').split('/', 1)[0]
+        with lock:
+            requests_seen[host] = requests_seen.get(host, 0) + 1
+            mode = modes.get(host, modes['*'])
+
+        if mode == 'reset':
+            self.close_connection = True
+            self.connection.close()
+            return
+        if mode == 'hang':
+            time.sleep(60 * 60)
+            return
+        if mode == 'throttle':
+            return self.send_json(429, {'message': 'Too many requests (stub)'}, {'Retry-After': '1'})
+        if mode == 'error':
+            return self.send_json(503, {'message': 'Service unavailable (stub)'})
+        if mode == 'slow':
+            time.sleep(settings['delay'])
+        self.send_fixture(host)
+
+    def set_mode(self, query):
+        host = query.get('host', ['*'])[0]
+        mode = query.get('mode', ['ok'])[0]
+        if mode not in MODES:
+            return self.send_json(400, {'message': f'Unknown mode {mode}, expected one of {MODES}'})
+        with lock:
+            modes[host] = mode
+        self.send_json(200, {'modes': modes})
+
+    def send_fixture(self, host):
+        path = os.path.join(settings['fixtures'], f'{host}.json')
+        body = b'{}'
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                body = f.read()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Function to start the stub server on a background thread, for driving it from a script
+def serve(port=8765):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stub upstream server with switchable failure modes')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--mode', action='append', default=[], help='host=mode, use * for every host')
+    parser.add_argument('--delay', type=float, default=settings['delay'], help='Seconds the slow mode waits')
+    parser.add_argument('--fixtures', default=settings['fixtures'], help='Directory of {host}.json response bodies')
+    args = parser.parse_args()
+
+    for setting in args.mode:
+        host, mode = setting.split('=', 1)
+        modes[host] = mode
+    settings['delay'] = args.delay
+    settings['fixtures'] = args.fixtures
+
+    server = ThreadingHTTPServer(('127.0.0.1', args.port), StubHandler)
+    server.daemon_threads = True
+    print(f'Stub upstreams on http://127.0.0.1:{args.port}, modes: {modes}')
+    server.serve_forever()
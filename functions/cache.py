@@ -0,0 +1,503 @@
+#%%
+import copy
+import datetime
+import functools
+import hashlib
+import inspect
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import concurrent.futures
+from collections import OrderedDict, namedtuple
+import pandas as pd
+import functions.upstreams as upstreams
+
+# Default memory budget per cached function
+DEFAULT_MAX_BYTES = 32 * 1024 ** 2
+
+# Location of the shared on disk cache tier, point every replica at the same file to share it
+DISK_CACHE_PATH = os.environ.get('DASHBOARD_CACHE_PATH', 'data/cache/fetch_cache.sqlite')
+
+# Every cache created by @cached, by function name, for cache_report()
+CACHES = {}
+
+# How old a last good value can be and still be served in place of a failed fetch while its upstream is failing
+DEGRADED_MAX_AGE = 7 * 24 * 60 * 60
+
+# LFU caches halve every entry's hit count after this many hits per entry, so entries that were popular once don't
+# stay in the cache forever
+LFU_AGING_HITS = 10
+
+# Workers that refresh stale entries in the background for stale-while-revalidate caches
+REFRESH_WORKERS = 4
+_refresh_executor = concurrent.futures.ThreadPoolExecutor(max_workers=REFRESH_WORKERS, thread_name_prefix='cache-refresh')
+
+# What with_age() returns, the value, its age in seconds, and whether it is past its ttl
+CachedValue = namedtuple('CachedValue', ['value', 'age', 'stale'])
+
+_TTL_UNITS = {'s': 1, 'm': 60, 'h': 60 * 60, 'd': 24 * 60 * 60}
+
+
+# Function to convert a ttl in any of the formats st.cache_data accepts into seconds
+def parse_ttl(ttl):
+    '''
+    Parameters:
+        - ttl: None, seconds as a number, a timedelta, or a string like '30s', '10m', '6h', '1d'
+
+    Returns:
+        - Seconds as a float, or None for no expiry
+    '''
+    if ttl is None:
+        return None
+    if isinstance(ttl, datetime.timedelta):
+        return ttl.total_seconds()
+    if isinstance(ttl, str):
+        return float(ttl[:-1]) * _TTL_UNITS[ttl[-1]]
+    return float(ttl)
+
+
+# Function to estimate how many bytes a cached value takes
+def sizeof(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return int(value.memory_usage(deep=True).sum()) if isinstance(value, pd.DataFrame) else int(value.memory_usage(deep=True))
+    if isinstance(value, (list, tuple, set)):
+        return sys.getsizeof(value) + sum(sizeof(item) for item in value)
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sizeof(key) + sizeof(item) for key, item in value.items())
+    return sys.getsizeof(value)
+
+
+# Function to build the canonical cache key for a call
+def cache_key(func, args, kwargs, signature=None):
+    '''
+    The arguments are bound to the function's parameters, defaults included, before they're hashed, so f(a, b=1),
+    f(a, 1) and (when b defaults to 1) f(a) share a key.
+
+    Parameters:
+        - func: The cached function
+        - args: Positional arguments of the call
+        - kwargs: Keyword arguments of the call
+        - signature: The function's inspect.signature(), computed if not given
+
+    Returns:
+        - key: Hex digest of the function's name and bound arguments
+    '''
+    bound = (signature or inspect.signature(func)).bind(*args, **kwargs)
+    bound.apply_defaults()
+    payload = pickle.dumps((func.__module__, func.__qualname__, bound.args, sorted(bound.kwargs.items())), protocol=4)
+    return hashlib.sha256(payload).hexdigest()
+
+
+class CacheEntry:
+    def __init__(self, value, size, created):
+        self.value = value
+        self.size = size
+        self.created = created
+        self.hits = 0
+
+
+class SingleFlight:
+    '''
+    Coalesces concurrent calls for the same key, the first caller runs the call and every caller that arrives while
+    it is in flight waits for it and gets the same result (or exception). Shared by every Streamlit session's script
+    thread, so a burst of sessions loading the same uncached page makes one upstream request instead of one each.
+
+    Usage:
+        value = get_single_flight().do(key, lambda: fetch(*args))
+    '''
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def do(self, key, fn):
+        '''
+        Returns:
+            - (result, shared): The call's result, and whether it came from another caller's call
+        '''
+        with self.lock:
+            call = self.calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.calls[key] = {'done': threading.Event(), 'result': None, 'error': None}
+
+        if not leader:
+            call['done'].wait()
+            if call['error'] is not None:
+                raise call['error']
+            return call['result'], True
+
+        try:
+            call['result'] = fn()
+        except Exception as e:
+            call['error'] = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call['done'].set()
+        return call['result'], False
+
+
+_single_flight = SingleFlight()
+
+
+# Function to get the process wide single flight group
+def get_single_flight():
+    return _single_flight
+
+
+class SizedCache:
+    '''
+    In memory cache bounded by the actual byte size of its entries rather than their count. When the budget is
+    exceeded entries are evicted least recently used first ('lru') or least frequently used first ('lfu'). LFU hit
+    counts are halved as the cache is used so they reflect recent use, ties go to the least recently used entry, and
+    the entry being inserted is never the one evicted.
+    Entries past their ttl are kept for up to max_stale longer so they can be served while they are refreshed, and up
+    to DEGRADED_MAX_AGE as a last good value for when their upstream is failing.
+    Keeps hit, miss, stale hit, refresh, coalesced call, degraded serve and eviction counters.
+    '''
+    def __init__(self, name, max_bytes=DEFAULT_MAX_BYTES, policy='lru', ttl=None, max_stale=None):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.ttl = parse_ttl(ttl)
+        self.max_stale = parse_ttl(max_stale) or 0
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.refreshes = 0
+        self.coalesced = 0
+        self.degraded = 0
+        self.evictions = 0
+        self.hits_since_aging = 0
+        self.lock = threading.Lock()
+
+    # Seconds an entry is kept for, None to keep it until evicted
+    def retention(self):
+        return None if self.ttl is None else self.ttl + self.max_stale
+
+    # Seconds an entry is kept as a last good value, None to keep it until evicted
+    def keep_for(self):
+        return None if self.ttl is None else max(self.retention(), DEGRADED_MAX_AGE)
+
+    def is_fresh(self, created):
+        return self.ttl is None or time.time() - created <= self.ttl
+
+    def is_usable(self, created):
+        return self.retention() is None or time.time() - created <= self.retention()
+
+    def is_kept(self, created):
+        return self.keep_for() is None or time.time() - created <= self.keep_for()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and not self.is_kept(entry.created):
+                self._remove(key)
+                entry = None
+            if entry is None or not self.is_usable(entry.created):
+                self.misses += 1
+                return None
+            self.hits += 1
+            entry.hits += 1
+            self.entries.move_to_end(key)
+            if self.policy == 'lfu':
+                self._age()
+            return entry
+
+    # Function to get an entry whatever its age, without counting it as a hit
+    def last_good(self, key):
+        with self.lock:
+            return self.entries.get(key)
+
+    def put(self, key, value, created=None):
+        size = sizeof(value)
+        if size > self.max_bytes:
+            print(f"Not caching {self.name} result, {size} bytes is over its {self.max_bytes} byte budget")
+            return
+        with self.lock:
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = CacheEntry(value, size, created or time.time())
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+                self._remove(self._victim(key))
+                self.evictions += 1
+
+    # Function to pick the entry to evict, never the one just inserted
+    def _victim(self, inserted):
+        candidates = (key for key in self.entries if key != inserted)
+        if self.policy == 'lfu':
+            # min() keeps the first of equal counts, which is the least recently used since hits move entries to the end
+            return min(candidates, key=lambda key: self.entries[key].hits)
+        return next(candidates)
+
+    # Function to halve every LFU hit count once the cache has seen LFU_AGING_HITS hits per entry since the last time
+    def _age(self):
+        self.hits_since_aging += 1
+        if self.hits_since_aging < LFU_AGING_HITS * len(self.entries):
+            return
+        for entry in self.entries.values():
+            entry.hits //= 2
+        self.hits_since_aging = 0
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry.size
+
+    # Function to add one to a counter, under the lock like the hit and miss counters since sessions share the cache
+    def count(self, counter):
+        with self.lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def info(self):
+        with self.lock:
+            return {
+                'function': self.name,
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'refreshes': self.refreshes,
+                'coalesced': self.coalesced,
+                'degraded': self.degraded,
+                'evictions': self.evictions,
+            }
+
+
+class DiskCache:
+    '''
+    Persistent cache tier in a SQLite file, so a restarted process or a new replica starts warm. SQLite's WAL mode
+    and busy timeout make it safe for several processes to read and write the same file at once. Each thread gets its
+    own connection.
+    '''
+    def __init__(self, path=DISK_CACHE_PATH):
+        self.path = path
+        self.local = threading.local()
+
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA busy_timeout=30000')
+            connection.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, function TEXT, created REAL, value BLOB)')
+            connection.commit()
+            self.local.connection = connection
+        return connection
+
+    def get(self, key):
+        '''
+        Returns:
+            - (value, created) for a stored key, None if it is not stored or can't be read
+        '''
+        try:
+            row = self.connection().execute('SELECT value, created FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            return pickle.loads(row[0]), row[1]
+        except Exception as e:
+            print(f"Error reading disk cache: {e}")
+            return None
+
+    def put(self, key, function, value, created, keep_for=None):
+        try:
+            connection = self.connection()
+            with connection:
+                connection.execute('INSERT OR REPLACE INTO cache (key, function, created, value) VALUES (?, ?, ?, ?)',
+                                   (key, function, created, pickle.dumps(value, protocol=4)))
+                # Drop this function's entries that are too old to be served while we're here
+                if keep_for is not None:
+                    connection.execute('DELETE FROM cache WHERE function = ? AND created < ?', (function, created - keep_for))
+        except Exception as e:
+            print(f"Error writing disk cache: {e}")
+
+    def clear(self, function):
+        connection = self.connection()
+        with connection:
+            connection.execute('DELETE FROM cache WHERE function = ?', (function,))
+
+
+_disk_cache = None
+
+
+# Function to get the process wide disk cache tier
+def get_disk_cache():
+    global _disk_cache
+    if _disk_cache is None:
+        _disk_cache = DiskCache()
+    return _disk_cache
+
+
+# Decorator to cache a fetch function, drop in replacement for @st.cache_data in the fetch modules
+def cached(ttl=None, max_bytes=DEFAULT_MAX_BYTES, policy='lru', persist=False, max_stale=None):
+    '''
+    Caches a function's results keyed by its canonical arguments, within a memory budget. Like st.cache_data
+    every call gets its own copy of the cached value, so callers can modify what they get back. With persist=True
+    results are also written to the on disk tier, which is checked on a memory miss before calling the function.
+
+    Calls are single flight, concurrent callers with the same arguments share one call to the function instead of each
+    making their own.
+
+    With max_stale set the cache is stale-while-revalidate, a value past its ttl (but not by more than max_stale)
+    is returned immediately and refreshed on a background worker, so no caller waits on a refresh that is already due.
+
+    Fetches run inside upstreams.track_failures(). When the function's upstream failed (an open circuit breaker, a
+    timeout, or a 429/5xx after retries) its result is not cached, and the last good value is served instead, tagged
+    stale, if there is one younger than DEGRADED_MAX_AGE.
+
+    Parameters:
+        - ttl: Time to live, same formats as st.cache_data (i.e. '1d', '6h', '10m'), None to never expire
+        - max_bytes: Memory budget for this function's cached results
+        - policy: Eviction policy once over budget, 'lru' or 'lfu'
+        - persist: Also keep results in the shared on disk cache tier, with the same ttl, which is then required so a bad
+                   result can't outlive restarts
+        - max_stale: How long past its ttl a value can still be served while it refreshes, same formats as ttl
+
+    Usage:
+        @cache.cached(ttl='1h', max_bytes=8 * 1024 ** 2, persist=True, max_stale='6h')
+        def get_news_data(api_key, country, category, number=15):
+            ...
+        get_news_data.with_age(api_key, 'us', 'General')  # CachedValue(value, age, stale)
+        get_news_data.cache_info()
+    '''
+    if persist and ttl is None:
+        raise ValueError('persist=True needs a ttl, a result kept on disk without one is never replaced')
+
+    def decorator(func):
+        name = f'{func.__module__}.{func.__qualname__}'
+        cache = SizedCache(name, max_bytes, policy, ttl, max_stale)
+        signature = inspect.signature(func)
+        CACHES[name] = cache
+        refreshing = set()
+        refreshing_lock = threading.Lock()
+
+        # Get the last good value for a key from any tier, as (value, created)
+        def last_good(key):
+            entry = cache.last_good(key)
+            stored = (entry.value, entry.created) if entry is not None else None
+            if stored is None and persist:
+                stored = get_disk_cache().get(key)
+            if stored is not None and cache.is_kept(stored[1]):
+                return stored
+            return None
+
+        # Call the function and store its result in every tier, joining the call already in flight if there is one
+        def refresh(key, args, kwargs):
+            def call():
+                error = None
+                with upstreams.track_failures() as failures:
+                    try:
+                        value = func(*args, **kwargs)
+                    except Exception as e:
+                        if not failures:
+                            raise
+                        value, error = None, e
+
+                # The upstream failed, so whatever the function returned is not worth caching
+                if failures:
+                    stored = last_good(key)
+                    if stored is not None:
+                        cache.count('degraded')
+                        host, reason = failures[-1]
+                        print(f"{name}: {host} is failing ({reason}), serving the last good value")
+                        return CachedValue(stored[0], time.time() - stored[1], True)
+                    if error is not None:
+                        raise error
+                    return CachedValue(value, 0, False)
+
+                created = time.time()
+                cache.put(key, value, created)
+                if persist:
+                    get_disk_cache().put(key, name, value, created, cache.keep_for())
+                return CachedValue(value, 0, False)
+
+            result, shared = get_single_flight().do(key, call)
+            if shared:
+                cache.count('coalesced')
+            return result
+
+        # Refresh on a background worker, at most one refresh per key at a time
+        def refresh_in_background(key, args, kwargs):
+            with refreshing_lock:
+                if key in refreshing:
+                    return
+                refreshing.add(key)
+            cache.count('refreshes')
+
+            def run():
+                try:
+                    refresh(key, args, kwargs)
+                except Exception as e:
+                    print(f"Error refreshing {name} in the background: {e}")
+                finally:
+                    with refreshing_lock:
+                        refreshing.discard(key)
+            _refresh_executor.submit(run)
+
+        def lookup(args, kwargs):
+            key = cache_key(func, args, kwargs, signature)
+            stored = None
+            entry = cache.get(key)
+            if entry is not None:
+                stored = entry.value, entry.created
+            elif persist:
+                stored = get_disk_cache().get(key)
+                if stored is not None and cache.is_kept(stored[1]):
+                    cache.put(key, *stored)
+                if stored is not None and not cache.is_usable(stored[1]):
+                    stored = None
+
+            if stored is not None:
+                value, created = stored
+                if cache.is_fresh(created):
+                    return CachedValue(value, time.time() - created, False)
+                cache.count('stale_hits')
+                refresh_in_background(key, args, kwargs)
+                return CachedValue(value, time.time() - created, True)
+
+            return refresh(key, args, kwargs)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return copy.deepcopy(lookup(args, kwargs).value)
+
+        # Same as calling the function, but returns a CachedValue so the UI can show how old the value is
+        def with_age(*args, **kwargs):
+            result = lookup(args, kwargs)
+            return result._replace(value=copy.deepcopy(result.value))
+
+        def clear():
+            cache.clear()
+            if persist:
+                get_disk_cache().clear(name)
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache.info
+        wrapper.clear = clear
+        wrapper.with_age = with_age
+        return wrapper
+    return decorator
+
+
+# Function to report on every cache
+def cache_report():
+    '''
+    Returns:
+        - df: One row per cached function with its entries, bytes used, budget, hits, misses, stale hits, refreshes,
+              coalesced calls, degraded serves and evictions
+    '''
+    return pd.DataFrame([cache.info() for cache in CACHES.values()])
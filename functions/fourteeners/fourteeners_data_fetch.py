@@ -1,13 +1,19 @@
 # %%
-import requests
+import functions.http_client as hc
 from bs4 import BeautifulSoup
 import pandas as pd
-import streamlit as st
+import functions.cache as cache
 import re
+import functions.instrumentation as instr
+import os
+
+# Location of the zip code reference file the weather and 14ers views read
+ZIPCODES_PATH = os.environ.get('DASHBOARD_ZIPCODES_PATH', 'data/us_zipcodes/uszips.csv')
 
 
 # Function to fetch ZIP codes csv
-@st.cache_data()
+@cache.cached(max_bytes=64 * 1024 ** 2)
+@instr.timed('fetch')
 def read_zipcodes(path):
     df = pd.read_csv(path)
     df['zip'] = df['zip'].astype(str).str.zfill(5)
@@ -16,7 +22,8 @@ def read_zipcodes(path):
 
 
 # Function to get the meter measurement of each peak on the mountain forecast website which we need to make the forecast request
-@st.cache_data()
+@cache.cached(ttl='1d', max_bytes=8 * 1024 ** 2, persist=True, max_stale='7d')
+@instr.timed('fetch')
 def get_forecast_meters():
     '''
     This function loops through each leter of the alphabet to get the list of mountains on the mountain forecast website under
@@ -28,7 +35,7 @@ def get_forecast_meters():
     data = []
     for char in char_range:
         url = f'https://www.mountain-forecast.com/countries/United-States/locations/{char}'
-        response = requests.get(url)
+        response = hc.get(url)
 
         if response.status_code == 200:
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -48,7 +55,8 @@ def get_forecast_meters():
 
 
 # Function to get the meter measurement of each peak on the mountain forecast website which we need to make the forecast request
-@st.cache_data(ttl='6h')
+@cache.cached(ttl='6h', max_bytes=16 * 1024 ** 2, persist=True, max_stale='1d')
+@instr.timed('fetch')
 def get_mountain_forecast(peak, meter_height):
     '''
     This function obtains the conditions report at the peak of the mountain input.
@@ -63,7 +71,7 @@ def get_mountain_forecast(peak, meter_height):
     '''
     try:
         url = f'https://www.mountain-forecast.com/peaks/{peak}/forecasts/{meter_height}'
-        response = requests.get(url)
+        response = hc.get(url)
 
         if response.status_code == 200:
             soup = BeautifulSoup(response.content, 'html.parser')
@@ -115,13 +123,14 @@ def get_mountain_forecast(peak, meter_height):
         print(f'Failed to fetch url for {peak}, error: {e}')
 
 # Function to get a list of all 14ers by scraping Wikipedia
-@st.cache_data(ttl='1d')
+@cache.cached(ttl='1d', max_bytes=1 * 1024 ** 2, persist=True)
+@instr.timed('fetch')
 def get_14ers():
     '''
     This function obtains the list of 14ers in Colorado from Wikipedia.
     '''
     url = 'https://en.wikipedia.org/wiki/List_of_Colorado_fourteeners'
-    response = requests.get(url)
+    response = hc.get(url)
 
     if response.status_code == 200:
         soup = BeautifulSoup(response.content, 'html.parser')
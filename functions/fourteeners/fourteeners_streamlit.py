@@ -81,7 +81,7 @@ def fourteeners_heading():
 # Function to fetch and display data table
 def fourteeners_table():
     # Get zipcode data
-    all_zipcodes = fd.read_zipcodes('data/us_zipcodes/uszips.csv')
+    all_zipcodes = fd.read_zipcodes(fd.ZIPCODES_PATH)
 
     # Create dropdown for user location
     zipcode_selection = st.selectbox("**Enter Zipcode**", all_zipcodes['zip'].to_list(), index=None, placeholder="Defaulting to 80501")
@@ -95,8 +95,18 @@ def fourteeners_table():
     user_lat = all_zipcodes['lat'][0]
     user_long = all_zipcodes['lng'][0]
 
-    # Get the 14er data from wikipedia
-    data = fd.get_14ers()
+    # Get the 14er data from wikipedia, and the mountain-forecast.com meter height for each peak
+    try:
+        data = fd.get_14ers()
+        mf_data = fd.get_forecast_meters()
+    except Exception as e:
+        print(f"Error fetching 14ers data: {e}")
+        data = mf_data = None
+
+    # Wikipedia or mountain-forecast.com is failing and there's nothing cached to fall back on, so there's nothing to show
+    if not data or not mf_data:
+        st.warning("The 14ers list is unavailable right now, please try again in a few minutes.")
+        return
     df = pd.DataFrame(data)
 
     # Get clean up that wikipedia data
@@ -109,9 +119,8 @@ def fourteeners_table():
     df['long'] = df['location'].str.split('°N').str[1].str.replace(r'[^\d.]', '', regex=True).astype(float) * -1
     df['distance_from_user_miles'] = df.apply(lambda row: calculate_distance(user_lat, user_long, row['lat'], row['long'], 'Miles'), axis=1) # Distance calculation
    
-    # Get the mountain-forecast.com meter height for each peak
-    data = fd.get_forecast_meters()
-    mf_df = pd.DataFrame(data)
+    # Mountain-forecast.com meter height for each peak
+    mf_df = pd.DataFrame(mf_data)
     mf_df['MF Height'] = mf_df['MF Height'].str.replace(r'[^\d.]', '', regex=True)
 
     # Merge mountain-forecast meter height into main df
@@ -121,11 +130,18 @@ def fourteeners_table():
     # Get mountain weather forecast for each peak in the df
     with st.spinner("Fetching forecast data for each peak..."):
         forecast_df = pd.DataFrame()
+        forecast_age = 0
         for idx, row in df.iterrows():
             meter_height = row['MF Height']
             peak = row['peak_forecast_name']
-            data = fd.get_mountain_forecast(peak, meter_height)
-            forecast_df = pd.concat([forecast_df, pd.DataFrame(data)])
+            forecast = fd.get_mountain_forecast.with_age(peak, meter_height)
+            forecast_age = max(forecast_age, forecast.age)
+            forecast_df = pd.concat([forecast_df, pd.DataFrame(forecast.value)])
+
+    # No peak's forecast could be fetched or served from cache
+    if forecast_df.empty:
+        st.warning("Peak forecasts are unavailable right now, please try again in a few minutes.")
+        return
 
     # Clean up the returned forecast df
     padding_len = len(str(forecast_df.index.max()))
@@ -183,3 +199,6 @@ def fourteeners_table():
 
     # Display the df
     st.dataframe(df_styled, hide_index=True, use_container_width=True, height=580)
+
+    # Age of the oldest peak forecast in the table
+    st.caption(f"Peak forecasts updated {t.format_age(forecast_age)}")
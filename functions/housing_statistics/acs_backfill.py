@@ -0,0 +1,63 @@
+#%%
+'''
+Populates the local ACS store with every variable the housing page uses, so most housing renders
+never need to call the Census API. Only (vintage, variable) cells missing from the store are fetched,
+so re-running after a new ACS release only pulls the new year.
+
+Usage:
+    python -m functions.housing_statistics.acs_backfill [--api-key KEY] [--years 10]
+'''
+import argparse
+import os
+import rwend_tools.utils as ru
+import functions.housing_statistics.acs_data_fetch as cf
+
+
+# Function to collect every ACS variable referenced by the housing config files
+def housing_variables():
+    '''
+    Returns:
+        - acs1_vars: Sorted list of variables pulled at the state and national level
+        - acs5_vars: Sorted list of variables pulled at the county level
+    '''
+    acs_vars = ru.read_config('config/acs_vars.yaml')
+    line_chart_setup = ru.read_config('config/yoy_comp_line_chart_setup.yaml')
+
+    acs1_vars = set(acs_vars['acs_cum_change_chart']) | set(acs_vars['acs_renter_housing_burden'])
+    for metric in line_chart_setup['metrics']:
+        details = metric['details']
+        acs1_vars |= {details[key] for key in ['variable', 'numerator', 'denominator'] if details[key] != 'None'}
+
+    acs5_vars = set(acs_vars['acs_renter_housing_burden'])
+    return sorted(acs1_vars), sorted(acs5_vars)
+
+
+# Function to backfill the store for the most recent n years of each ACS type
+def backfill(api_key, n_years=10):
+    acs1_vars, acs5_vars = housing_variables()
+    catalog = cf.get_acs_vintages()
+
+    jobs = []
+    for year in catalog['acs1'][-(n_years + 1):]:
+        jobs += [(acs1_vars, level, year, 'acs1') for level in ['state:*', 'us:1']]
+    for year in catalog['acs5'][-1:]:
+        jobs.append((acs5_vars, 'county:*', year, 'acs5'))
+
+    for variables, level, year, acs_type in jobs:
+        df = cf.load_acs_data(api_key, variables, level, year, acs_type)
+        status = 'ok' if not df.empty else 'failed'
+        print(f'{acs_type} {year} {level}: {len(variables)} variables, {status}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill the local ACS store')
+    parser.add_argument('--api-key', default=os.environ.get('CENSUS_API_KEY'), help='Census API key, defaults to $CENSUS_API_KEY then streamlit secrets')
+    parser.add_argument('--years', type=int, default=10, help='Number of years back from the most recent vintage to backfill')
+    args = parser.parse_args()
+
+    api_key = args.api_key
+    if not api_key:
+        import streamlit as st
+        api_key = st.secrets['census_api_key']
+
+    backfill(api_key, args.years)
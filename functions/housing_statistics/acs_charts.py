@@ -2,9 +2,12 @@
 import plotly.express as px
 import numpy as np
 import streamlit as st
-import geopandas as gpd
 import pandas as pd
 import rwend_tools.utils as t
+import functions.housing_statistics.geo_build as gb
+import json
+import us
+import functions.instrumentation as instr
 
 #%% Get Map color pallete from generate_colors 
 high_color = '#ffffcc'
@@ -12,26 +15,51 @@ low_color = '#245d38'
 num_colors = 10
 colors = t.generate_colors(high_color, low_color, num_colors)
 
-# Function to Load GEOSJON and County FIPS code datasets 
-@st.cache_data(ttl='1d')
+# Function to Load County FIPS code dataset from the local geography data built by geo_build, on first use
+@st.cache_resource
 def get_geo_data():
-    geojson_url = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
-    gdf = gpd.read_file(geojson_url)
-    gdf['StateCounty'] = gdf['STATE'] + gdf['COUNTY']
-    geojson = gdf.__geo_interface__
-
-    fips_url = 'https://www2.census.gov/geo/docs/reference/codes/files/national_county.txt'
-    fips_df = pd.read_csv(fips_url, sep=',', header=None, names=['State', 'StateFIPS', 'CountyFIPS', 'County', 'idk'])
-    fips_df['CountyFIPS'] = fips_df['CountyFIPS'].astype(str).str.zfill(3)
-    fips_df['StateFIPS'] = fips_df['StateFIPS'].astype(str).str.zfill(2)
-    fips_df['MapFIPS'] = fips_df['StateFIPS'] + fips_df['CountyFIPS']
-
-    return geojson, fips_df
-geojson, fips_df = get_geo_data()
+    return gb.load_fips()
+
+
+# Function to load the county geometry for one detail level from the local geography data built by geo_build
+@st.cache_resource
+def get_geometry_index(detail):
+    '''
+    Reads the county geometry for a detail level, one FeatureCollection per state keyed by State FIPS code, so a map
+    only ships the geometry it draws. Each detail level is its own compact json file and is only loaded when first used.
+
+    Parameters:
+        - detail: Key of geo_build.GEOMETRY_DETAIL
+
+    Returns:
+        - index: Dict of State FIPS code to FeatureCollection
+    '''
+    with open(gb.ensure_artifact(f'county_geometry_{detail}.json')) as f:
+        return json.load(f)
+
+# Function to get the county geojson for one state or the whole country
+def get_county_geojson(state_fips=None, detail=None):
+    '''
+    Parameters:
+        - state_fips: Optional 2 digit State FIPS code, every state if None
+        - detail: Key of geo_build.GEOMETRY_DETAIL, defaults to 'medium' for a single state and 'coarse' for the whole country
+
+    Returns:
+        - FeatureCollection of county geometries
+    '''
+    if state_fips:
+        index = get_geometry_index(detail or 'medium')
+        return index.get(state_fips, {'type': 'FeatureCollection', 'features': []})
+    index = get_geometry_index(detail or 'coarse')
+    return {
+        'type': 'FeatureCollection',
+        'features': [feature for collection in index.values() for feature in collection['features']],
+    }
 
 
 
 # Map of Renter Housing Burden
+@instr.timed('chart')
 def renter_housing_burden_share_map(df, level_selection, state_selection=None):
     # Calculate Share Renters Housing Burdened
     df['Share Renters Housing Burdened'] = df['B25140_011E'] / df['B25140_010E']
@@ -39,7 +67,7 @@ def renter_housing_burden_share_map(df, level_selection, state_selection=None):
     if level_selection == 'State Level':
         # Get full FIPS df merged in
         df['state'] = df['state'].astype(str).str.zfill(2)
-        state_fips_df = fips_df[['State', 'StateFIPS']].drop_duplicates()
+        state_fips_df = get_geo_data()[['State', 'StateFIPS']].drop_duplicates()
         df = df.merge(state_fips_df, how='left', left_on=['state'], right_on=['StateFIPS'])
 
         # Calculate color scale range
@@ -84,12 +112,19 @@ def renter_housing_burden_share_map(df, level_selection, state_selection=None):
         df['state'] = df['state'].astype(str).str.zfill(2)
         df['county'] = df['county'].astype(str).str.zfill(3)
         df['MapFIPS'] = df['state'] + df['county']
-        df = df.merge(fips_df, how='left', on=['MapFIPS'])
+        df = df.merge(get_geo_data(), how='left', on=['MapFIPS'])
 
-         # Filter to selected state if state filter is used
+         # Filter to selected state if state filter is used, and only ship that state's county geometry
         if state_selection:
             df = df[df['State']==t.get_state_abbr(state_selection)]
 
+            # Nothing to draw for a state with no county rows in this release
+            if df.empty:
+                return None, df
+            county_geojson = get_county_geojson(us.states.lookup(state_selection).fips)
+        else:
+            county_geojson = get_county_geojson()
+
         # Calculate color scale range
         min_value = np.floor(df['Share Renters Housing Burdened'].min() * 20) / 20  
         max_value = np.ceil(df['Share Renters Housing Burdened'].max() * 20) / 20    
@@ -97,7 +132,7 @@ def renter_housing_burden_share_map(df, level_selection, state_selection=None):
         # Create choropleth map using Plotly Express
         fig = px.choropleth(
             df, 
-            geojson=geojson, 
+            geojson=county_geojson, 
             locations='MapFIPS',
             featureidkey="properties.StateCounty", 
             scope='usa',
@@ -144,22 +179,14 @@ def renter_housing_burden_share_map(df, level_selection, state_selection=None):
 
 
 # Function for Comp Line Charts YoY 
-def comp_line_chart_yoy(df, location_selection, label, y_format, variable=None, rate_flag=None, numerator=None, denominator=None):
-    # Get full list of variables from the config file, filter out None
-    vars = [variable, numerator, denominator]
-    vars = list(filter(lambda x: x is not None, vars))
+@instr.timed('chart')
+def comp_line_chart_yoy(metrics_cube, location_selection, metric_name, label, y_format):
+    # Get the already computed metric from the metrics cube (see AcsCube.metrics) for the selected state and the nation
+    df = metrics_cube.to_frame(metric_name, value_name='Chart Var')
     locs = [location_selection, 'US National Average']
-    df = df[df['Variable'].isin(vars) & df['NAME'].isin(locs)].reset_index(drop=True)
-    df = df.pivot_table(index=['NAME', 'Year'], values='Value', columns='Variable').reset_index(drop=False)
-
-    # Get Chart Var based on rate_flag input
-    if rate_flag == 1:
-        df['Chart Var'] = df[numerator] / df[denominator]
-    else:
-        df['Chart Var'] = df[variable]
+    df = df[df['NAME'].isin(locs)]
 
-    # Keep columns relevant to the chart and plot them
-    df = df[['NAME', 'Year', 'Chart Var']]
+    # Plot it
     fig = px.line(df, x=df.Year, y=df['Chart Var'], color='NAME',
                     labels={'Chart Var': label, 'Year': 'Year'},)
 
@@ -185,26 +212,17 @@ def comp_line_chart_yoy(df, location_selection, label, y_format, variable=None,
 
 
 # Function for Line Charts YoY Cumulative Change 
-def line_chart_yoy_cum_change(df, vars):
-    # Clean up ACS data from api request
-    df = df.pivot_table(index=['NAME', 'Year'], values='Value', columns='Variable').reset_index()
-    df = df.rename(columns={
+@instr.timed('chart')
+def line_chart_yoy_cum_change(cube, vars):
+    # Calc cumulative change from the base (first) year in the cube
+    min_year = cube.years[0]
+    col_name = f'Cumulative Change since {min_year}'
+    df = cube.subset(vars).cumulative_change().to_frame(value_name=col_name, var_name='Metric')
+    df['Metric'] = df['Metric'].replace({
                             'B19013_001E': 'Median Household Income', 
                             'B25058_001E': 'Median Contract Rent',
                             'B25077_001E': 'Median Home Value',
                             })
-    min_year = df['Year'].min()
-
-    # Function to calc cumulative change from base year
-    def cumulative_change(column):
-        return (column - column.iloc[0]) / column.iloc[0]
-    cumulative_changes = df.groupby('NAME').transform(cumulative_change)
-    cumulative_changes.drop(columns='Year', inplace=True)
-
-    # Concatenate the cumulative changes with the original DataFrame and clean up
-    df = pd.concat([df['Year'], cumulative_changes], axis=1)
-    col_name = f'Cumulative Change since {min_year}'
-    df = df.melt(id_vars='Year', var_name='Metric', value_name=col_name)
 
     # Create the chart fig
     fig = px.line(df, x=df.Year, y=df[col_name], color='Metric',
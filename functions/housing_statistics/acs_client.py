@@ -0,0 +1,93 @@
+#%%
+import asyncio
+import concurrent.futures
+import threading
+import time
+import functions.upstreams as upstreams
+
+# Process wide limits on Census API traffic, shared by every Streamlit session
+MAX_CONCURRENCY = 8         # Requests in flight at once
+RATE_PER_SECOND = 10        # Token bucket refill rate
+BURST = 10                  # Token bucket size
+
+
+class TokenBucket:
+    '''
+    Async token bucket, each request takes one token and tokens refill at rate per second up to burst.
+    Only used from the client's event loop so it needs no locking.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class AcsClient:
+    '''
+    Asyncio based ACS client. One event loop runs on a background thread for the whole process, so the
+    concurrency cap and token bucket apply across every Streamlit session instead of each rerun spinning up
+    its own thread pool. The blocking http requests run on a worker pool sized to the concurrency cap.
+
+    Usage:
+        results = get_client().run([(cf.request_acs_data, (api_key, variables, 'state:*', 2022, 'acs1'))])
+    '''
+    def __init__(self, max_concurrency=MAX_CONCURRENCY, rate=RATE_PER_SECOND, burst=BURST):
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='acs-client')
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='acs-client-loop', daemon=True)
+        self.thread.start()
+
+        # asyncio primitives must be created on the loop they are used from
+        async def init():
+            self.semaphore = asyncio.Semaphore(max_concurrency)
+            self.bucket = TokenBucket(rate, burst)
+        asyncio.run_coroutine_threadsafe(init(), self.loop).result()
+
+    async def fetch(self, fn, args):
+        async with self.semaphore:
+            await self.bucket.acquire()
+            return await self.loop.run_in_executor(self.executor, fn, *args)
+
+    async def fetch_many(self, calls):
+        return await asyncio.gather(*[self.fetch(fn, args) for fn, args in calls], return_exceptions=True)
+
+    def run(self, calls, timeout=None):
+        '''
+        Synchronous wrapper for Streamlit code, runs every call on the client's loop and waits for them all.
+
+        Parameters:
+            - calls: A list of (function, args tuple) pairs
+            - timeout: Optional seconds to wait for every call to finish
+
+        Returns:
+            - results: One result per call in order, an exception instance for any call that raised
+        '''
+        if not calls:
+            return []
+        # Run each call in the caller's context, so upstream failures reach the caller's track_failures() scope
+        calls = [(upstreams.run_in_context(fn), args) for fn, args in calls]
+        return asyncio.run_coroutine_threadsafe(self.fetch_many(calls), self.loop).result(timeout)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+# Function to get the process wide client, created on first use
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = AcsClient()
+        return _client
@@ -1,42 +1,217 @@
 #%%
-import requests
+import functions.http_client as hc
 import pandas as pd
+import numpy as np
 import datetime
-import streamlit as st
+import functions.cache as cache
+import concurrent.futures
+import json
+import os
+import threading
+import functions.housing_statistics.acs_store as acs_store
+import functions.housing_statistics.acs_client as acs_client
+import functions.instrumentation as instr
+import functions.upstreams as upstreams
 
-@st.cache_data(ttl='1d')
-def get_most_recent_acs_year():
+# Location of the on disk ACS vintage catalog, shared by every process running the dashboard
+VINTAGE_CATALOG_PATH = os.environ.get('DASHBOARD_VINTAGE_CATALOG_PATH', 'data/cache/acs_vintages.json')
+VINTAGE_CATALOG_MAX_AGE = datetime.timedelta(days=1)
+
+# Fixed width of the Census geography codes we request
+GEO_CODE_WIDTH = {'us': 1, 'state': 2, 'county': 3}
+
+# Largest magnitude float32 holds every integer up to exactly
+FLOAT32_EXACT_LIMIT = 2 ** 24
+
+# First release year of each ACS product, no point probing before these
+ACS_FIRST_YEAR = {'acs1': 2005, 'acs5': 2009}
+
+
+# Function to check if a single ACS vintage is published
+@instr.timed('fetch')
+def acs_vintage_exists(year, acs_type):
+    '''
+    Checks if the Census API has a dataset for a given year and ACS type.
+
+    Parameters:
+        - year: Vintage year to check
+        - acs_type: ACS type, acs1 or acs5
+
+    Returns:
+        - True if the API returned a valid response for the dataset
+    '''
+    base_url = f"https://api.census.gov/data/{year}/acs/{acs_type}"
+    try:
+        response = hc.get(base_url)
+        return response.status_code == 200
+    except Exception as e:
+        print(f"Error probing {base_url}: {e}")
+        return False
+
+
+# Function to probe every candidate ACS vintage concurrently
+@instr.timed('fetch')
+def probe_acs_vintages():
     '''
-    Tries calling ACS api until it gets a valid response to find out most recent year available
+    Probes every candidate year for each ACS type at once instead of walking back one year at a time.
+    Gaps are kept, e.g. the 2020 1-year release that was never published.
 
     Returns:
-        - current_year: Most recent ACS year with valid response
+        - catalog: Dict with the probe timestamp and a sorted list of available years per ACS type
     '''
     current_year = datetime.datetime.now().year
+    candidates = [(year, acs_type) for acs_type, first_year in ACS_FIRST_YEAR.items() for year in range(first_year, current_year + 1)]
 
-    while current_year >= 2000:
-        base_url = f"https://api.census.gov/data/{current_year}/acs/acs1"
-        response = requests.get(base_url)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=16) as executor:
+        results = list(executor.map(upstreams.run_in_context(lambda candidate: acs_vintage_exists(*candidate)), candidates))
 
-        if response.status_code == 200:
-            break
-        else:
-            current_year -= 1
-    
-    return current_year
+    catalog = {'probed_at': datetime.datetime.now().isoformat()}
+    for acs_type in ACS_FIRST_YEAR:
+        catalog[acs_type] = sorted(year for (year, candidate_type), exists in zip(candidates, results) if exists and candidate_type == acs_type)
+
+    return catalog
+
+
+# Function to read the vintage catalog from disk, re-probing when it is missing or more than a day old
+@cache.cached(ttl='1h', max_bytes=1 * 1024 ** 2)
+@instr.timed('fetch')
+def get_acs_vintages(path=VINTAGE_CATALOG_PATH):
+    '''
+    Returns the catalog of published ACS vintages. The catalog is persisted to disk so the probe is paid
+    once per day per deployment rather than once per process. A probe that finds no vintage of an ACS type is
+    recorded as a Census API failure, so the cache serves the last good catalog (or this one uncached) and the next
+    call probes again rather than the empty catalog being kept for the ttl.
+
+    Parameters:
+        - path: Location of the catalog json file
+
+    Returns:
+        - catalog: Dict with 'probed_at' and a sorted list of available years for 'acs1' and 'acs5'
+    '''
+    try:
+        with open(path) as f:
+            catalog = json.load(f)
+        probed_at = datetime.datetime.fromisoformat(catalog['probed_at'])
+        if datetime.datetime.now() - probed_at < VINTAGE_CATALOG_MAX_AGE and all(catalog.get(acs_type) for acs_type in ACS_FIRST_YEAR):
+            return catalog
+    except (OSError, ValueError, KeyError):
+        pass
+
+    catalog = probe_acs_vintages()
+
+    # Only keep a catalog that actually found something, a failed probe should be retried
+    if not all(catalog[acs_type] for acs_type in ACS_FIRST_YEAR):
+        upstreams.record_failure('api.census.gov', 'no vintages found')
+        return catalog
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(catalog, f)
+    os.replace(tmp_path, path)
 
+    return catalog
 
-@st.cache_data
+
+def get_most_recent_acs_year(acs_type='acs1'):
+    '''
+    Looks up the most recent published ACS year in the vintage catalog
+
+    Parameters:
+        - acs_type: ACS type, defaults to acs1
+
+    Returns:
+        - Most recent ACS year available for acs_type
+    '''
+    years = get_acs_vintages()[acs_type]
+    if years:
+        return years[-1]
+    else:
+        # Nothing reachable, fall back to a year that is safe to assume is published
+        return datetime.datetime.now().year - 2
+
+
+@cache.cached(max_bytes=128 * 1024 ** 2, policy='lfu')
+@instr.timed('fetch')
 def get_acs_data(api_key, variables, level, year, acs_type='acs1'):
+    '''
+    Gets ACS data at given level and year for defined variables and ACS type, reading the local ACS store
+    first and only calling the Census API for variables the store does not hold yet.
+
+    Parameters:
+        - api_key: Census API Key
+        - variables: A list of ACS variable codes
+        - level: Census api "for" clause, i.e. 'state:08'
+        - year: Year to get data
+        - acs_type: ACS type, defaults to acs1
+
+    Returns:
+        - result_df: A df with all data from the ACS
+    '''
+    return load_acs_data(api_key, variables, level, year, acs_type)
+
+
+def load_acs_data(api_key, variables, level, year, acs_type='acs1'):
+    '''
+    Uncached version of get_acs_data, also used by the acs_backfill command.
+    '''
+    return load_acs_data_many(api_key, [(variables, level, year, acs_type)])[0]
+
+
+@instr.timed('fetch')
+def load_acs_data_many(api_key, requests):
+    '''
+    Serves a batch of ACS requests from the local store, fetching every missing (year, variable) cell through the
+    rate limited ACS client in one concurrent batch. Missing variables are fetched for every geography at the level
+    so the store can serve any of them next time.
+
+    Parameters:
+        - api_key: Census API Key
+        - requests: A list of (variables, level, year, acs_type) tuples
+
+    Returns:
+        - dfs: One df per request in order, an empty df for any request that could not be served
+    '''
+    # Find what the store is missing, merging requests for the same vintage and geography level into one fetch
+    fetches = {}
+    for variables, level, year, acs_type in requests:
+        df, missing = acs_store.read(year, acs_type, level, variables)
+        if missing:
+            geo_level, code = acs_store.parse_level(level)
+            fetches.setdefault((year, acs_type, geo_level), set()).update(missing)
+
+    # Fetch the missing cells concurrently and merge them into the store
+    fetch_keys = list(fetches)
+    calls = [(request_acs_data, (api_key, sorted(fetches[key]), f'{key[2]}:*', key[0], key[1])) for key in fetch_keys]
+    for (year, acs_type, geo_level), fetched_df in zip(fetch_keys, acs_client.get_client().run(calls)):
+        if isinstance(fetched_df, Exception):
+            print(f"An error occurred: {fetched_df}")
+        elif not fetched_df.empty:
+            acs_store.write(year, acs_type, geo_level, fetched_df)
+
+    dfs = []
+    for variables, level, year, acs_type in requests:
+        df, missing = acs_store.read(year, acs_type, level, variables)
+        if missing or df is None:
+            dfs.append(pd.DataFrame())
+        else:
+            geo_cols = [col for col in df.columns if not acs_store.is_variable(col)]
+            dfs.append(df[list(variables) + geo_cols])
+
+    return dfs
+
+
+@instr.timed('fetch')
+def request_acs_data(api_key, variables, level, year, acs_type='acs1'):
     '''
     Fetches ACS data from Census API at given level and year for defined variables and ACS type.
 
     Parameters:
         - api_key: Census API Key
         - variables: A list of ACS variable codes
-        - years: Years to get data 
+        - level: Census api "for" clause, i.e. 'state:*'
+        - year: Year to get data
         - acs_type: ACS type, defaults to acs1
-        - filter: For "in" parameter, defaults to None
 
     Returns:
         - result_df: A df with all data from the ACS
@@ -50,14 +225,12 @@ def get_acs_data(api_key, variables, level, year, acs_type='acs1'):
         "key": api_key,
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
             data = response.json()
-            df = pd.DataFrame(data[1:], columns=data[0]) 
-            df = df.apply(pd.to_numeric)
-            return df
+            return decode_acs_response(data)
         except Exception as e:
             print(f"Error: {e}")
             return pd.DataFrame()
@@ -70,3 +243,113 @@ def get_acs_data(api_key, variables, level, year, acs_type='acs1'):
             print(f"Error processing JSON for error message: {e}")
         return pd.DataFrame()
 
+
+
+@cache.cached(max_bytes=128 * 1024 ** 2, policy='lfu')
+@instr.timed('fetch')
+def get_acs_panel(api_key, variables, level, years, acs_type='acs1'):
+    '''
+    Fetches a wide geography-by-year panel, every geography at a level for every year in years. Any single
+    geography can then be served by slicing the panel with slice_acs_panel() instead of new api requests.
+
+    Parameters:
+        - api_key: Census API Key
+        - variables: A list of ACS variable codes
+        - level: Census api "for" clause, the code is ignored, i.e. 'state:*' and 'state:08' both return all states
+        - years: Years to include, years without a published vintage are skipped
+        - acs_type: ACS type, defaults to acs1
+
+    Returns:
+        - panel_df: A df with one row per geography per year, with a Year column
+    '''
+    geo_level, code = acs_store.parse_level(level)
+    years = [year for year in years if year in get_acs_vintages()[acs_type]]
+
+    dfs = []
+    for df, year in zip(load_acs_data_many(api_key, [(variables, f'{geo_level}:*', year, acs_type) for year in years]), years):
+        if not df.empty:
+            df = df.copy()
+            df['Year'] = year
+            dfs.append(df)
+
+    if not dfs:
+        return pd.DataFrame()
+    return pd.concat(dfs, ignore_index=True)
+
+
+@instr.timed('fetch')
+def slice_acs_panel(panel_df, level, name, year_range):
+    '''
+    Slices one geography and a year range out of a panel from get_acs_panel()
+
+    Parameters:
+        - panel_df: Panel df from get_acs_panel()
+        - level: Census api "for" clause of the geography to keep, i.e. 'state:08' or 'us:1'
+        - name: Value for the NAME column of the returned df
+        - year_range: Tuple of the first and last year to keep
+
+    Returns:
+        - df: One row per year with NAME, Year and the panel's variable columns
+    '''
+    geo_level, code = acs_store.parse_level(level)
+    if panel_df.empty:
+        return pd.DataFrame(columns=['NAME', 'Year'])
+
+    keep = panel_df['Year'].between(year_range[0], year_range[1])
+    if code != '*':
+        keep &= panel_df[geo_level].astype(str).str.zfill(len(code)) == code
+
+    var_cols = [col for col in panel_df.columns if acs_store.is_variable(col)]
+    df = panel_df.loc[keep, ['Year'] + var_cols].reset_index(drop=True)
+    df.insert(0, 'NAME', name)
+    return df
+
+
+# Function to decode a Census API json response straight into typed columns
+@instr.timed('fetch')
+def decode_acs_response(data):
+    '''
+    Decodes the Census API's json array of string rows column by column. Geography identifiers become zero padded
+    categorical codes and measures become float32 when every value survives the round trip exactly, float64 otherwise.
+
+    Parameters:
+        - data: Parsed json from the Census API, a header row followed by data rows
+
+    Returns:
+        - df: Typed df with the same columns as the header row
+    '''
+    header, rows = data[0], data[1:]
+    columns = list(zip(*rows)) if rows else [()] * len(header)
+
+    decoded = {}
+    for name, values in zip(header, columns):
+        if acs_store.is_variable(name):
+            values = np.array(['nan' if value is None else value for value in values], dtype=np.float64)
+            finite = values[np.isfinite(values)]
+            if np.all(np.abs(finite) < FLOAT32_EXACT_LIMIT) and np.array_equal(finite.astype(np.float32), finite):
+                values = values.astype(np.float32)
+            decoded[name] = values
+        else:
+            width = GEO_CODE_WIDTH.get(name, 0)
+            decoded[name] = pd.Categorical([str(value).zfill(width) for value in values])
+
+    return pd.DataFrame(decoded, columns=header)
+
+
+# Function to report the memory used by every cached ACS df
+def acs_memory_report():
+    '''
+    Reads the live cache entries, so frames the cache has evicted or expired are never reported.
+
+    Returns:
+        - df: One row per cached get_acs_data/get_acs_panel result with its function, cache key, rows, columns and
+              bytes, largest first
+    '''
+    rows = []
+    for function in [get_acs_data, get_acs_panel]:
+        with function.cache.lock:
+            entries = list(function.cache.entries.items())
+        rows += [{'function': function.__name__, 'key': key[:12], 'rows': len(entry.value), 'columns': entry.value.shape[1], 'bytes': entry.size}
+                 for key, entry in entries]
+    report_df = pd.DataFrame(rows, columns=['function', 'key', 'rows', 'columns', 'bytes'])
+    return report_df.sort_values('bytes', ascending=False).reset_index(drop=True)
@@ -0,0 +1,80 @@
+#%%
+import functions.housing_statistics.acs_data_fetch as cf
+import functions.housing_statistics.acs_store as acs_store
+
+
+class AcsRequestPlanner:
+    '''
+    Collects the ACS data needs of every section on a page and merges them into one canonical request per
+    (ACS type, geography level, year), with sorted and deduplicated variables, so overlapping sections share
+    a single api request and cache entry. Only sections that need the same years are merged, so no section's
+    variables are fetched for years nobody asked for. Results are fanned back out to each section with result().
+
+    Usage:
+        plan = AcsRequestPlanner(api_key)
+        plan.add('cum_change', ['B19013_001E', 'B25058_001E'], ['state:*', 'us:1'], range(2013, 2024))
+        plan.add('yoy_comp', ['B25058_001E', 'B19013_001E', 'B25001_001E'], ['state:*', 'us:1'], range(2013, 2024))
+        df = plan.result('cum_change', 'state:*')
+    '''
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.needs = {}
+        self.panels = {}
+
+    def add(self, section, variables, levels, years, acs_type='acs1'):
+        '''
+        Registers a section's needs.
+
+        Parameters:
+            - section: Name the section will later ask for its result by
+            - variables: A list of ACS variable codes, 'None' entries are dropped
+            - levels: A list of Census api "for" clauses, codes are ignored since a level is always fetched whole
+            - years: Years needed
+            - acs_type: ACS type, defaults to acs1
+        '''
+        variables = {var for var in variables if var and var != 'None'}
+        for level in levels:
+            geo_level, code = acs_store.parse_level(level)
+            self.needs[(section, geo_level)] = (variables, set(years), acs_type)
+
+    def canonical_requests(self):
+        '''
+        Returns:
+            - requests: Dict of (acs_type, geo_level, years) to the sorted union of variables every section needing
+                        exactly those years has, years being a sorted tuple
+        '''
+        requests = {}
+        for (section, geo_level), (variables, years, acs_type) in self.needs.items():
+            key = (acs_type, geo_level, tuple(sorted(years)))
+            requests[key] = requests.get(key, set()) | variables
+        return {key: sorted(variables) for key, variables in requests.items()}
+
+    def panel(self, acs_type, geo_level, years):
+        '''
+        Fetches (once) the merged panel for an ACS type, geography level and set of years.
+        '''
+        key = (acs_type, geo_level, tuple(sorted(years)))
+        if key not in self.panels:
+            variables = self.canonical_requests()[key]
+            self.panels[key] = cf.get_acs_panel(self.api_key, variables, f'{geo_level}:*', key[2], acs_type)
+        return self.panels[key]
+
+    def result(self, section, level):
+        '''
+        Fans a merged panel back out to one section.
+
+        Parameters:
+            - section: Section name used in add()
+            - level: One of the levels the section registered
+
+        Returns:
+            - df: Panel rows for the section's years, with only the section's variables, the geography columns and Year
+        '''
+        geo_level, code = acs_store.parse_level(level)
+        variables, years, acs_type = self.needs[(section, geo_level)]
+        panel_df = self.panel(acs_type, geo_level, years)
+        if panel_df.empty:
+            return panel_df
+
+        keep_cols = [col for col in panel_df.columns if not acs_store.is_variable(col) or col in variables]
+        return panel_df.loc[panel_df['Year'].isin(years), keep_cols].reset_index(drop=True)
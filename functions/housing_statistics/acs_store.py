@@ -0,0 +1,104 @@
+#%%
+import pandas as pd
+import os
+import threading
+
+# Root of the local ACS store, one parquet file per (vintage, acs type, geography level)
+ACS_STORE_PATH = os.environ.get('DASHBOARD_ACS_STORE_PATH', 'data/acs_store')
+
+# Serializes read, merge and write so sessions storing different variables of one file don't drop each other's columns
+_write_lock = threading.Lock()
+
+
+# Function to split an ACS api level string into its geography level and code
+def parse_level(level):
+    '''
+    Splits a Census api "for" clause into its geography level and code.
+
+    Parameters:
+        - level: Census api "for" clause, i.e. 'state:08', 'state:*', 'us:1', 'county:*'
+
+    Returns:
+        - geo_level: Geography level, i.e. 'state'
+        - code: Geography code, '*' for every geography at that level
+    '''
+    geo_level, code = level.split(':')
+    return geo_level, code
+
+
+# Function to get the parquet file path for a given vintage, acs type and geography level
+def store_path(year, acs_type, geo_level, root=ACS_STORE_PATH):
+    return os.path.join(root, acs_type, str(year), f'{geo_level}.parquet')
+
+
+# Function to read the stored cells for a request and report which variables still need fetching
+def read(year, acs_type, level, variables, root=ACS_STORE_PATH):
+    '''
+    Reads whatever the local store already holds for a request. The store keeps every geography of a
+    level in one file (one column per variable), so a single state is served by filtering the all states file.
+
+    Parameters:
+        - year: ACS vintage
+        - acs_type: ACS type, acs1 or acs5
+        - level: Census api "for" clause, i.e. 'state:08'
+        - variables: A list of ACS variable codes
+        - root: Root directory of the store
+
+    Returns:
+        - df: Stored rows for the request's geography with any stored requested variables, None if nothing is stored
+        - missing: Requested variables not in the store yet
+    '''
+    geo_level, code = parse_level(level)
+    path = store_path(year, acs_type, geo_level, root)
+    if not os.path.exists(path):
+        return None, list(variables)
+
+    try:
+        df = pd.read_parquet(path)
+    except Exception as e:
+        print(f"Error reading ACS store file {path}: {e}")
+        return None, list(variables)
+
+    missing = [var for var in variables if var not in df.columns]
+    if code != '*':
+        df = df[df[geo_level].astype(str).str.zfill(len(code)) == code]
+
+    return df.reset_index(drop=True), missing
+
+
+# Function to merge newly fetched variables into the store
+def write(year, acs_type, geo_level, df, root=ACS_STORE_PATH):
+    '''
+    Merges a df of newly fetched variables for every geography at a level into the store file for that
+    vintage. Writes go to a temp file first so other processes never see a partial file.
+
+    Parameters:
+        - year: ACS vintage
+        - acs_type: ACS type, acs1 or acs5
+        - geo_level: Geography level the df covers, i.e. 'state'
+        - df: Census api response df with every geography at geo_level
+        - root: Root directory of the store
+
+    Returns:
+        - df: The full stored df for that vintage, acs type and level after the merge
+    '''
+    path = store_path(year, acs_type, geo_level, root)
+    geo_cols = [col for col in df.columns if not is_variable(col)]
+
+    with _write_lock:
+        if os.path.exists(path):
+            stored_df = pd.read_parquet(path)
+            new_cols = [col for col in df.columns if col not in stored_df.columns]
+            df = stored_df.merge(df[geo_cols + new_cols], how='outer', on=geo_cols)
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, path)
+
+    return df
+
+
+# Function to tell ACS variable columns (i.e. B25001_001E) apart from geography columns (i.e. state)
+def is_variable(col):
+    return '_' in col
@@ -2,20 +2,50 @@
 import pandas as pd
 import functions.housing_statistics.acs_data_fetch as cf
 import functions.housing_statistics.acs_charts as fa
+import functions.housing_statistics.acs_planner as ap
+import functions.housing_statistics.acs_transforms as at
+import functions.instrumentation as instr
 from datetime import datetime
 import os
 import rwend_tools.utils as ru
 import streamlit as st
 import us
-import concurrent.futures
 
 # Read in acs vars
 acs_vars = ru.read_config('config/acs_vars.yaml')
 
+# Read in our setup yaml for the YoY comparison charts
+line_chart_setup = ru.read_config('config/yoy_comp_line_chart_setup.yaml')
+
 # Define parameters for api requests
 api_key = st.secrets["census_api_key"]
 year = cf.get_most_recent_acs_year()
 
+
+# Function to plan every ACS request the housing page makes in one render
+def plan_housing_requests(year=year):
+    '''
+    Registers every housing section's ACS needs with a request planner, so overlapping variables (i.e. median
+    income and rent used by both the cumulative change and YoY charts) are fetched once per year and geography.
+    The YoY section registers every metric in its setup yaml so changing a metric selection is a local slice.
+
+    Parameters:
+        - year: Most recent ACS year, the line charts cover the 10 years before it
+
+    Returns:
+        - plan: An AcsRequestPlanner to pass to each section
+    '''
+    panel_years = range(year - 10, year + 1)
+    yoy_vars = [metric['details'][key] for metric in line_chart_setup['metrics'] for key in ['variable', 'numerator', 'denominator']]
+
+    plan = ap.AcsRequestPlanner(api_key)
+    plan.add('cum_change', acs_vars['acs_cum_change_chart'], ['state:*', 'us:1'], panel_years)
+    plan.add('yoy_comp', yoy_vars, ['state:*', 'us:1'], panel_years)
+    plan.add('renter_burden', acs_vars['acs_renter_housing_burden'], ['state:*'], [year])
+    plan.add('renter_burden', acs_vars['acs_renter_housing_burden'], ['county:*'], [cf.get_most_recent_acs_year('acs5')], 'acs5')
+    return plan
+
+
 # Function to get State FIPS Code from name
 def get_fips_by_state(state_name):
     '''
@@ -33,8 +63,46 @@ def get_fips_by_state(state_name):
     else:
         return None
 
+# Function to display the Cumulative Change section with its own filters, as a fragment so they only rerun this section
+@st.experimental_fragment
+@instr.timed('fragment')
+def cum_change_section(us_states, plan, year=year):
+    '''
+    Parameters:
+        - us_states: List of all US States
+        - plan: AcsRequestPlanner from plan_housing_requests()
+        - year: Most recent ACS year, the slider covers the 10 years before it
+    '''
+    # Create two columns to display filters side by side
+    col1, col2 = st.columns([1, 2])
+    with col1:
+        state_selection = st.selectbox("**Select Geographic Level**", ['US National Average'] + us_states)
+    with col2:
+        year_range1 = st.slider('**Select Year Range**', min_value=year - 10, max_value=year, value=(year - 10, year), key='slider_key_1')
+
+    # Display the Cumulative Change in Housing Costs and Incomes chart based on filter selections
+    yoy_cum_change_line_charts(state_selection, year_range1, plan)
+
+
+# Function to display the Share of Renters Housing Burdened section with its level filter, as a fragment so it only reruns this section
+@st.experimental_fragment
+@instr.timed('fragment')
+def renter_burden_section(us_states, plan):
+    '''
+    Parameters:
+        - us_states: List of all US States
+        - plan: AcsRequestPlanner from plan_housing_requests()
+    '''
+    # State vs. County Selection
+    level_list = ['State Level', 'County Level']
+    level_selection = st.selectbox("**Geographic Level Selection**", level_list)
+
+    # Display the Share of Renters Housing Burdened figs based on filter selection
+    renter_house_burden(level_selection, us_states, plan)
+
+
 # Function to display Share of Renter's Housing Burdened Section
-def renter_house_burden(level_selection, us_states):
+def renter_house_burden(level_selection, us_states, plan):
     '''
     Generates the streamlit elements for the Share of Renter's Housing Burdened Section
     of the dashboard.
@@ -42,16 +110,14 @@ def renter_house_burden(level_selection, us_states):
     Parameters:
         - level_selection: 'State' or 'County', determines the level to generate the map and table at.
         - us_states: List of all US States
+        - plan: AcsRequestPlanner from plan_housing_requests()
     '''
-    vars = acs_vars['acs_renter_housing_burden']
 
     # Creates the Streamlit elements given a State Level user selection
     if level_selection == 'State Level':
 
-        # Run ACS Data Fetch
-        level = 'state:*'
-        acs_type = 'acs1'
-        df = cf.get_acs_data(api_key, vars, level, year, acs_type)
+        # Get ACS Data from the page's request plan
+        df = plan.result('renter_burden', 'state:*')
 
         # Get Chart Fig and Table df
         fig, fig_df = fa.renter_housing_burden_share_map(df, level_selection)
@@ -61,7 +127,7 @@ def renter_house_burden(level_selection, us_states):
 
         # Map into col1
         with col1:
-            st.plotly_chart(fig, use_container_width=True)
+            instr.plotly_chart(fig, 'renter_burden_state_map', use_container_width=True)
 
         # Df into col2 as a table 
         with col2:
@@ -82,10 +148,8 @@ def renter_house_burden(level_selection, us_states):
 
     # Creates the Streamlit elements given a County Level user selection
     if level_selection == 'County Level':
-        # Run ACS Data Fetch
-        level = 'county:*'
-        acs_type = 'acs5'
-        df = cf.get_acs_data(api_key, vars, level, 2022, acs_type)
+        # Get ACS Data from the page's request plan
+        df = plan.result('renter_burden', 'county:*')
 
         # Display an optional State Filter to view the County Level data on a state-by-state basis
         state_selection = st.selectbox("**Optional State Filter**", us_states, index=None)
@@ -96,12 +160,17 @@ def renter_house_burden(level_selection, us_states):
         else:
             fig, fig_df = fa.renter_housing_burden_share_map(df, level_selection)
 
+        # The map returns no fig when the selected state has no county rows
+        if fig is None:
+            st.info(f"No county level renter housing burden data for {state_selection} in the latest ACS release.")
+            return
+
         # Create two columns to show map and table side by side
         col1, col2 = st.columns([2, 1])
 
          # Map into col1
         with col1:
-            st.plotly_chart(fig, use_container_width=True)
+            instr.plotly_chart(fig, 'renter_burden_county_map', use_container_width=True)
 
         # Df into col2 as a table 
         with col2:
@@ -120,14 +189,17 @@ def renter_house_burden(level_selection, us_states):
                 }
             )
 
-# Function to display YoY Comparison Charts Section
-def yoy_comp_line_charts(state_selection, us_states, year=year):
+# Function to display YoY Comparison Charts Section, as a fragment so its filters only rerun this section
+@st.experimental_fragment
+@instr.timed('fragment')
+def yoy_comp_line_charts(us_states, plan, year=year):
     '''
     Generates the streamlit elements for the National Average vs. Select State -- Year over Year Section
     of the dashboard.
 
     Parameters:
-        - state_selection: User's selection of a state to compare YoY to US National Average of given metric
+        - us_states: List of all US States
+        - plan: AcsRequestPlanner from plan_housing_requests()
     '''
     # Cols here displays the year slider within the section, without this it spills over a bit horizontally 
     cols = st.columns([1, 2])
@@ -140,8 +212,7 @@ def yoy_comp_line_charts(state_selection, us_states, year=year):
         year_min = year - 10
         year_range2 = st.slider('**Select Year Range**', min_value=year_min, max_value=year_max, value=(year_min, year_max), key='slider_key_2')
 
-    # Read in our setup yaml and get a list of metrics from it for our metric selection dropdowns
-    line_chart_setup = ru.read_config('config/yoy_comp_line_chart_setup.yaml')
+    # Get a list of metrics from our setup yaml for our metric selection dropdowns
     metric_list = [metric['name'] for metric in line_chart_setup['metrics']]
 
     # Create two columns to show each selected metric's chart side by side
@@ -157,62 +228,34 @@ def yoy_comp_line_charts(state_selection, us_states, year=year):
         filtered_metrics_right = [metric for metric in line_chart_setup['metrics'] if metric['name'] == metric_selection_right]
         metric_right = filtered_metrics_right[0]       
 
-    # Run ACS Data Fetch needed for both charts
-    ## Grabbing the three possible metrics from the setup yaml filtered list
-    left_vars = [metric_left['details']['variable'], metric_left['details']['numerator'], metric_left['details']['denominator']]
-    right_vars = [metric_right['details']['variable'], metric_right['details']['numerator'], metric_right['details']['denominator']]
-    
-    ## Combine them into a master list and remove any strings=='None'
-    var_list = left_vars + right_vars
-    var_list = [item for item in var_list if item != 'None']
-    
-    ## Loop over each year in the year slider and fetch variables we need for the charts at both the state and national level,
-    ##  combining into one master df
-    dfs = []
+    # Get ACS Data from the page's request plan, it holds every state and the nation for every year and every metric,
+    #  so changing the state, year slider or metrics only re-slices it, no new api requests
+    state_panel = plan.result('yoy_comp', 'state:*')
+    us_panel = plan.result('yoy_comp', 'us:1')
+
     state_fips = get_fips_by_state(state_selection)
+    df = pd.concat([
+        cf.slice_acs_panel(state_panel, f'state:{state_fips}', state_selection, year_range2),
+        cf.slice_acs_panel(us_panel, 'us:1', 'US National Average', year_range2),
+    ], ignore_index=True)
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit tasks for each year and region
-        futures = []
-        for region in [f'state:{state_fips}', 'us:1']:
-            for year in range(year_range2[0], year_range2[1] + 1):
-                future = executor.submit(cf.get_acs_data, api_key, var_list, region, year)
-                futures.append((future, region, year))
-        for future, region, year in futures:
-            try:
-                result = future.result()
-                if not result.empty:
-                    result['Year'] = year
-                    result['NAME'] = state_selection if region.startswith('state') else 'US National Average'
-                    try:
-                        result = result.drop(columns=['state'])
-                    except:
-                        result = result.drop(columns=['us'])
-                    dfs.append(result)
-            except Exception as e:
-                print(f"An error occurred: {e}")
-
-    df = pd.concat(dfs, ignore_index=True)
-    df.reset_index(drop=True, inplace=True)
-    
-
-    # Melt the df so it works for our plots
-    df = pd.melt(df, id_vars=['NAME', 'Year'], var_name='Variable', value_name='Value')
+    # Compute every metric in the setup yaml for the state and nation in one vectorized pass
+    metrics_cube = at.AcsCube.from_wide(df).metrics(line_chart_setup['metrics'])
 
     # Get the chart the user selected for each column and display it
     with col1:
-        left_fig = fa.comp_line_chart_yoy(df, state_selection, metric_left['details']['label'], y_format=metric_left['details']['y_format'], variable=metric_left['details']['variable'] , rate_flag=metric_left['details']['rate_flag'], numerator=metric_left['details']['numerator'], denominator=metric_left['details']['denominator'])
+        left_fig = fa.comp_line_chart_yoy(metrics_cube, state_selection, metric_selection_left, metric_left['details']['label'], y_format=metric_left['details']['y_format'])
         st.write('')
         st.markdown(f'###### {metric_selection_left}')
-        st.plotly_chart(left_fig, use_container_width=True)
+        instr.plotly_chart(left_fig, 'yoy_comp_left', use_container_width=True)
     with col2:    
-        right_fig = fa.comp_line_chart_yoy(df, state_selection, metric_right['details']['label'], y_format=metric_right['details']['y_format'], variable=metric_right['details']['variable'] , rate_flag=metric_right['details']['rate_flag'], numerator=metric_right['details']['numerator'], denominator=metric_right['details']['denominator'])
+        right_fig = fa.comp_line_chart_yoy(metrics_cube, state_selection, metric_selection_right, metric_right['details']['label'], y_format=metric_right['details']['y_format'])
         st.write('')
         st.markdown(f'###### {metric_selection_right}')
-        st.plotly_chart(right_fig, use_container_width=True)
+        instr.plotly_chart(right_fig, 'yoy_comp_right', use_container_width=True)
 
 # Function to display YoY Cumulative Change Section
-def yoy_cum_change_line_charts(geolevel, year_range1):
+def yoy_cum_change_line_charts(geolevel, year_range1, plan):
     '''
     Generates the streamlit elements for the National Average vs. Select State -- Year over Year Section
     of the dashboard.
@@ -220,41 +263,22 @@ def yoy_cum_change_line_charts(geolevel, year_range1):
     Parameters:
         - geolevel: User's selection of a geographic level to view metrics for
         - year_range1: User's selection of years to view change over, min year selected here becomes the base year
+        - plan: AcsRequestPlanner from plan_housing_requests()
     '''
     var_list = acs_vars['acs_cum_change_chart']
 
-    # Run ACS Data Fetch 
-    ## Loop over each year in the year slider and fetch variables we need for the charts at either the state or national level
-    dfs = []
-
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        # Submit tasks for each year and region (state or US)
-        futures = []
-        for loop_year in range(year_range1[0], year_range1[1] + 1):
-            region = 'us:1' if geolevel == 'US National Average' else f'state:{get_fips_by_state(geolevel)}'
-            future = executor.submit(cf.get_acs_data, api_key, var_list, region, loop_year)
-            futures.append((future, loop_year))
-
-        for future, loop_year in futures:
-            try:
-                stagedf = future.result()
-                if not stagedf.empty:
-                    stagedf['Year'] = loop_year
-                    stagedf.rename(columns={'us': 'NAME', 'state': 'NAME'}, inplace=True)
-                    dfs.append(stagedf)
-            except Exception as e:
-                print(f"An error occurred: {e}")
-
-    df = pd.concat(dfs, ignore_index=True)
-    df.reset_index(drop=True, inplace=True)
-
-    # Melt the df so it works for our plot
-    df = pd.melt(df, id_vars=['NAME', 'Year'], var_name='Variable', value_name='Value')
+    # Get ACS Data from the page's request plan, then slice out the selected geography and years
+    if geolevel == 'US National Average':
+        panel_level, region = 'us:1', 'us:1'
+    else:
+        panel_level, region = 'state:*', f'state:{get_fips_by_state(geolevel)}'
+    panel_df = plan.result('cum_change', panel_level)
+    df = cf.slice_acs_panel(panel_df, region, geolevel, year_range1)
 
     # Get the plot fig and display it
-    fig = fa.line_chart_yoy_cum_change(df, var_list)
+    fig = fa.line_chart_yoy_cum_change(at.AcsCube.from_wide(df, var_list), var_list)
     st.markdown(f'###### Cumulative Change in Housing Costs and Incomes since {year_range1[0]}, {geolevel}')
-    st.plotly_chart(fig, use_container_width=True)
+    instr.plotly_chart(fig, 'cum_change', use_container_width=True)
 
 # Function to display housing terms and data citiations
 def housing_terms():
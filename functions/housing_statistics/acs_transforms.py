@@ -0,0 +1,118 @@
+#%%
+import numpy as np
+import pandas as pd
+
+
+class AcsCube:
+    '''
+    ACS data held as a dense NumPy (geography x year x variable) array, so the housing chart metrics are computed
+    with array operations instead of pivot, groupby-transform and melt round trips. Missing cells are NaN.
+
+    Usage:
+        cube = AcsCube.from_wide(df)                        # NAME, Year and one column per variable
+        metrics = cube.metrics(line_chart_setup['metrics'])  # every yaml metric at once, as a new cube
+        df = metrics.to_frame('Housing Units per Capita', 'Chart Var')
+    '''
+    def __init__(self, values, geographies, years, variables):
+        self.values = values
+        self.geographies = list(geographies)
+        self.years = list(years)
+        self.variables = list(variables)
+        self.var_index = {variable: i for i, variable in enumerate(self.variables)}
+
+    @classmethod
+    def from_wide(cls, df, variables=None, geo_col='NAME', year_col='Year'):
+        '''
+        Builds a cube from a wide df with one row per geography per year and one column per variable.
+
+        Parameters:
+            - df: Wide df, i.e. from acs_data_fetch.slice_acs_panel()
+            - variables: Optional list of variable columns, defaults to every column other than geo_col and year_col
+        '''
+        if variables is None:
+            variables = [col for col in df.columns if col not in (geo_col, year_col)]
+        geo_codes, geographies = pd.factorize(df[geo_col])
+        years = np.sort(df[year_col].unique())
+        year_codes = np.searchsorted(years, df[year_col].to_numpy())
+
+        values = np.full((len(geographies), len(years), len(variables)), np.nan)
+        values[geo_codes, year_codes, :] = df[variables].to_numpy(dtype=float)
+        return cls(values, geographies, years, variables)
+
+    def subset(self, variables):
+        return AcsCube(self.values[:, :, [self.var_index[variable] for variable in variables]], self.geographies, self.years, variables)
+
+    def cumulative_change(self):
+        '''
+        Change of every variable relative to each geography's first year with data, (x - x_first) / x_first, the same
+        base as the first row per geography the pandas groupby path used
+        '''
+        has_data = ~np.isnan(self.values).all(axis=2)
+        first_years = has_data.argmax(axis=1)
+        base = self.values[np.arange(len(self.geographies)), first_years, :][:, np.newaxis, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return AcsCube((self.values - base) / base, self.geographies, self.years, self.variables)
+
+    def yoy_change(self):
+        '''
+        Change of every variable from the prior year in the cube, NaN for the first year
+        '''
+        values = np.full_like(self.values, np.nan)
+        values[:, 1:, :] = self.values[:, 1:, :] - self.values[:, :-1, :]
+        return AcsCube(values, self.geographies, self.years, self.variables)
+
+    def metrics(self, metrics):
+        '''
+        Computes every metric from the YoY comparison setup yaml in one pass. Rate metrics divide all numerators by
+        all denominators in a single array operation, level metrics are a single gather.
+
+        Parameters:
+            - metrics: The 'metrics' list from config/yoy_comp_line_chart_setup.yaml
+
+        Returns:
+            - A cube with one variable per metric name. Metrics whose variables are not in this cube are skipped
+        '''
+        rate_metrics, level_metrics = [], []
+        for metric in metrics:
+            details = metric['details']
+            if details['rate_flag'] == 1:
+                if details['numerator'] in self.var_index and details['denominator'] in self.var_index:
+                    rate_metrics.append((metric['name'], self.var_index[details['numerator']], self.var_index[details['denominator']]))
+            elif details['variable'] in self.var_index:
+                level_metrics.append((metric['name'], self.var_index[details['variable']]))
+
+        numerators = [numerator for name, numerator, denominator in rate_metrics]
+        denominators = [denominator for name, numerator, denominator in rate_metrics]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rates = self.values[:, :, numerators] / self.values[:, :, denominators]
+        levels = self.values[:, :, [variable for name, variable in level_metrics]]
+
+        names = [name for name, *idx in rate_metrics] + [name for name, *idx in level_metrics]
+        return AcsCube(np.concatenate([rates, levels], axis=2), self.geographies, self.years, names)
+
+    def to_frame(self, variables=None, value_name='Value', var_name='Variable'):
+        '''
+        Converts (part of) the cube back into a long df for plotting, dropping missing cells.
+
+        Parameters:
+            - variables: One variable name or a list of them, defaults to every variable
+            - value_name: Name of the value column
+            - var_name: Name of the variable column, left out when a single variable name is passed
+
+        Returns:
+            - df: Long df with NAME, Year, (var_name) and value_name columns
+        '''
+        single = isinstance(variables, str)
+        variables = [variables] if single else (variables or self.variables)
+        values = self.values[:, :, [self.var_index[variable] for variable in variables]]
+
+        n_geo, n_year, n_var = values.shape
+        df = pd.DataFrame({
+            'NAME': np.repeat(self.geographies, n_year * n_var),
+            'Year': np.tile(np.repeat(self.years, n_var), n_geo),
+            var_name: np.tile(variables, n_geo * n_year),
+            value_name: values.ravel(),
+        })
+        if single:
+            df = df.drop(columns=[var_name])
+        return df.dropna(subset=[value_name]).reset_index(drop=True)
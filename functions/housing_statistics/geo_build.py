@@ -0,0 +1,231 @@
+#%%
+'''
+Builds the local geography reference data the housing maps use, so the dashboard never downloads it at startup.
+Run once (and again only if the source files change):
+
+    python -m functions.housing_statistics.geo_build
+
+Writes to data/geo (or DASHBOARD_GEO_DATA_PATH):
+    - county_fips.arrow: County names and FIPS codes from the Census national_county.txt file, as an Arrow IPC file
+      every worker process memory-maps
+    - county_geometry_{detail}.json: County geometry by State FIPS code at each detail level in GEOMETRY_DETAIL
+'''
+import io
+import json
+import os
+import threading
+import pandas as pd
+import pyarrow as pa
+import functions.http_client as hc
+
+GEO_DATA_PATH = os.environ.get('DASHBOARD_GEO_DATA_PATH', 'data/geo')
+GEOJSON_URL = 'https://raw.githubusercontent.com/plotly/datasets/master/geojson-counties-fips.json'
+FIPS_URL = 'https://www2.census.gov/geo/docs/reference/codes/files/national_county.txt'
+
+# Simplification tolerance (in degrees) of each county geometry detail level
+GEOMETRY_DETAIL = {
+    'full': 0,
+    'medium': 0.005,
+    'coarse': 0.02,
+}
+
+# Decimal places kept on coordinates, ~10m which is well below what the maps can show
+COORDINATE_PRECISION = 4
+
+FIPS_ARTIFACT = 'county_fips.arrow'
+
+# Serializes building a missing artifact on first use, so concurrent sessions build it once
+_build_lock = threading.Lock()
+
+
+# Function to get the path of a geography artifact
+def artifact_path(name, root=GEO_DATA_PATH):
+    return os.path.join(root, name)
+
+
+# Function to get the path of a geography artifact the dashboard needs, building it on first use if it's missing
+def ensure_artifact(name, root=GEO_DATA_PATH):
+    '''
+    Deployments build the geography data ahead of time with this module. On a checkout where it hasn't been built,
+    the build step that writes the artifact runs once, on first use, downloading its source file. Concurrent callers
+    wait for that build rather than starting their own.
+
+    Parameters:
+        - name: FIPS_ARTIFACT or a county_geometry_{detail}.json file name
+        - root: Root directory of the geography data
+
+    Returns:
+        - path: Path of the artifact
+    '''
+    path = artifact_path(name, root)
+    if os.path.exists(path):
+        return path
+
+    with _build_lock:
+        if not os.path.exists(path):
+            print(f'{path} not found, building it (run python -m functions.housing_statistics.geo_build to build it ahead of time)')
+            os.makedirs(root, exist_ok=True)
+            if name == FIPS_ARTIFACT:
+                build_fips(root)
+            else:
+                build_geometry(root)
+    return path
+
+
+# Function to load the county FIPS table, memory-mapping the Arrow file so worker processes share its pages
+def load_fips(root=GEO_DATA_PATH):
+    '''
+    Returns:
+        - fips_df: County FIPS table with State, StateFIPS, CountyFIPS, County and MapFIPS string columns
+    '''
+    with pa.memory_map(ensure_artifact(FIPS_ARTIFACT, root)) as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+
+# Function to write an artifact to a temp file and move it into place, so readers never see a partial file
+def write_atomic(path, write):
+    '''
+    Parameters:
+        - path: Artifact path
+        - write: Function that writes the artifact to the path it is given
+    '''
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+# Function to round every coordinate in a geojson geometry
+def round_coordinates(coordinates):
+    if isinstance(coordinates[0], (int, float)):
+        return [round(coordinate, COORDINATE_PRECISION) for coordinate in coordinates]
+    return [round_coordinates(part) for part in coordinates]
+
+
+# Function to build the county FIPS table
+def build_fips(root=GEO_DATA_PATH):
+    response = hc.get(FIPS_URL)
+    response.raise_for_status()
+    fips_df = pd.read_csv(io.StringIO(response.text), sep=',', header=None, names=['State', 'StateFIPS', 'CountyFIPS', 'County', 'idk'], dtype=str)
+    fips_df['CountyFIPS'] = fips_df['CountyFIPS'].str.zfill(3)
+    fips_df['StateFIPS'] = fips_df['StateFIPS'].str.zfill(2)
+    fips_df['MapFIPS'] = fips_df['StateFIPS'] + fips_df['CountyFIPS']
+    fips_df = fips_df.drop(columns=['idk'])
+
+    table = pa.Table.from_pandas(fips_df, preserve_index=False)
+    write_atomic(artifact_path(FIPS_ARTIFACT, root), lambda path: write_arrow(table, path))
+    return fips_df
+
+
+def write_arrow(table, path):
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+
+# Function to simplify polygons along their shared arcs, so neighbouring counties keep identical borders
+def simplify_coverage(geometries, tolerance):
+    '''
+    Simplifying each county on its own moves the two copies of a shared border differently, leaving slivers and gaps
+    between neighbours. Instead every ring is split into arcs at its junctions, the points where the set of rings
+    sharing the border changes, each distinct arc is simplified once, and the rings are rebuilt from the simplified
+    arcs, so both sides of a border get the same line. A ring that would collapse keeps its original points.
+
+    Parameters:
+        - geometries: List of geojson Polygon or MultiPolygon geometry dicts
+        - tolerance: Douglas-Peucker tolerance in degrees
+
+    Returns:
+        - geometries: Simplified geojson geometry dicts, in the same order
+    '''
+    # Only needed at build time, so kept out of the dashboard's imports
+    import shapely
+
+    # Every ring as a list of points without its closing point, in geometry, polygon and ring order
+    polygon_lists = [[geometry['coordinates']] if geometry['type'] == 'Polygon' else geometry['coordinates'] for geometry in geometries]
+    rings = [[tuple(point) for point in ring[:-1]] for polygons in polygon_lists for polygon in polygons for ring in polygon]
+
+    point_rings = {}
+    for ring_id, ring in enumerate(rings):
+        for point in ring:
+            point_rings.setdefault(point, set()).add(ring_id)
+    sharing = {point: frozenset(ring_ids) for point, ring_ids in point_rings.items()}
+
+    # Split each ring into arcs at its junctions, a ring without any is one closed arc started at its smallest point
+    # so every copy of it splits the same way
+    ring_arcs = []
+    for ring in rings:
+        n = len(ring)
+        junctions = [i for i in range(n) if len(sharing[ring[i]]) > 2 or sharing[ring[i]] != sharing[ring[i - 1]] or sharing[ring[i]] != sharing[ring[(i + 1) % n]]]
+        if not junctions:
+            start = ring.index(min(ring))
+            ring_arcs.append([ring[start:] + ring[:start + 1]])
+            continue
+        arcs = []
+        for j, start in enumerate(junctions):
+            end = junctions[(j + 1) % len(junctions)]
+            end = end if end > start else end + n
+            arcs.append([ring[i % n] for i in range(start, end + 1)])
+        ring_arcs.append(arcs)
+
+    # Simplify each distinct arc once, in the same direction whichever ring it came from
+    keys = list(dict.fromkeys(tuple(min(arc, arc[::-1])) for arcs in ring_arcs for arc in arcs))
+    lines = shapely.simplify([shapely.LineString(key) for key in keys], tolerance, preserve_topology=False)
+    simplified = {key: [tuple(point) for point in line.coords] for key, line in zip(keys, lines)}
+
+    rebuilt = []
+    for ring, arcs in zip(rings, ring_arcs):
+        points = []
+        for arc in arcs:
+            key = tuple(min(arc, arc[::-1]))
+            points += (simplified[key] if key == tuple(arc) else simplified[key][::-1])[:-1]
+        if len(set(points)) < 3:
+            points = ring
+        rebuilt.append([list(point) for point in points + points[:1]])
+
+    # Put the rings back into their polygons
+    rebuilt = iter(rebuilt)
+    results = []
+    for geometry, polygons in zip(geometries, polygon_lists):
+        polygons = [[next(rebuilt) for ring in polygon] for polygon in polygons]
+        results.append({'type': geometry['type'], 'coordinates': polygons[0] if geometry['type'] == 'Polygon' else polygons})
+    return results
+
+
+# Function to build the county geometry index at every detail level
+def build_geometry(root=GEO_DATA_PATH):
+    response = hc.get(GEOJSON_URL)
+    response.raise_for_status()
+    features = response.json()['features']
+    geometries = [feature['geometry'] for feature in features]
+
+    for detail, tolerance in GEOMETRY_DETAIL.items():
+        simplified = geometries if tolerance == 0 else simplify_coverage(geometries, tolerance)
+
+        index = {}
+        for feature, geometry in zip(features, simplified):
+            properties = feature['properties']
+            collection = index.setdefault(properties['STATE'], {'type': 'FeatureCollection', 'features': []})
+            collection['features'].append({
+                'type': 'Feature',
+                'properties': {'StateCounty': properties['STATE'] + properties['COUNTY']},
+                'geometry': {'type': geometry['type'], 'coordinates': round_coordinates(geometry['coordinates'])},
+            })
+
+        path = artifact_path(f'county_geometry_{detail}.json', root)
+        write_atomic(path, lambda tmp_path: write_json(index, tmp_path))
+        print(f'Wrote {path} ({os.path.getsize(path) / 1e6:.1f} MB)')
+
+
+def write_json(data, path):
+    with open(path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'))
+
+
+# Function to build every geography artifact
+def build(root=GEO_DATA_PATH):
+    os.makedirs(root, exist_ok=True)
+    build_fips(root)
+    build_geometry(root)
+
+
+if __name__ == '__main__':
+    build()
@@ -0,0 +1,133 @@
+#%%
+import os
+import random
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlparse
+import functions.upstreams as upstreams
+import functions.http_fixtures as fixtures
+
+# Default (connect, read) timeouts in seconds, can be overridden with environment variables
+CONNECT_TIMEOUT = float(os.environ.get('DASHBOARD_HTTP_CONNECT_TIMEOUT', 5))
+READ_TIMEOUT = float(os.environ.get('DASHBOARD_HTTP_READ_TIMEOUT', 30))
+
+# Per host (connect, read) timeouts for upstreams that need something other than the default
+HOST_TIMEOUTS = {
+    'api.census.gov': (CONNECT_TIMEOUT, 60),
+}
+
+# Retry settings, 429 and 5xx responses are retried with jittered exponential backoff
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_MAX = 10
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Keep-alive connections kept open per host
+POOL_MAXSIZE = 16
+
+# Requests made (or replayed) per host since the process started, for benchmarks
+REQUEST_COUNTS = {}
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+# Function to get the shared session for a host, each host gets its own keep-alive connection pool
+def get_session(host):
+    with _sessions_lock:
+        session = _sessions.get(host)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_MAXSIZE, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _sessions[host] = session
+        return session
+
+
+# Function to get how long to wait before a retry
+def backoff_delay(attempt, retry_after=None):
+    '''
+    Full jitter exponential backoff, a random wait between 0 and BACKOFF_BASE * 2^attempt (capped at BACKOFF_MAX),
+    so many sessions retrying the same upstream don't all retry at the same moment. A numeric Retry-After header wins.
+
+    Parameters:
+        - attempt: Number of attempts already made, starting at 0
+        - retry_after: Optional Retry-After header value
+
+    Returns:
+        - Seconds to wait
+    '''
+    if retry_after:
+        try:
+            return min(float(retry_after), BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# Function to make a GET request through the shared client
+def get(url, params=None, timeout=None, max_retries=MAX_RETRIES, **kwargs):
+    '''
+    Drop in replacement for requests.get used by every fetch module. Adds pooled keep-alive connections,
+    connect/read timeouts, and retries with backoff on connection errors, timeouts, 429 and 5xx responses.
+    Every attempt goes through the host's upstream policy (rate limit, concurrency cap and circuit breaker), see
+    functions/upstreams.py. While the host's breaker is open this raises upstreams.CircuitOpenError right away.
+    With DASHBOARD_HTTP_MODE set to record or replay, responses are saved to or served from fixtures, see
+    functions/http_fixtures.py.
+
+    Parameters:
+        - url: Url to request
+        - params: Optional query string parameters
+        - timeout: Optional (connect, read) timeout tuple, defaults to the host's entry in HOST_TIMEOUTS or the module defaults
+        - max_retries: Retries after the first attempt
+        - kwargs: Passed through to requests.Session.get
+
+    Returns:
+        - response: The requests response, the last one received if every retry failed
+    '''
+    host = urlparse(url).netloc
+    with _sessions_lock:
+        REQUEST_COUNTS[host] = REQUEST_COUNTS.get(host, 0) + 1
+    if fixtures.HTTP_MODE == 'replay':
+        try:
+            return fixtures.replay(url, params)
+        except requests.ConnectionError:
+            upstreams.record_failure(host, 'no fixture')
+            raise
+
+    upstream = upstreams.get_upstream(host)
+    session = get_session(host)
+    timeout = timeout or HOST_TIMEOUTS.get(host, (CONNECT_TIMEOUT, READ_TIMEOUT))
+    request_url = upstreams.resolve_url(url, host)
+
+    for attempt in range(max_retries + 1):
+        try:
+            with upstream.request():
+                response = session.get(request_url, params=params, timeout=timeout, **kwargs)
+        except upstreams.CircuitOpenError:
+            raise
+        except (requests.ConnectionError, requests.Timeout) as e:
+            upstream.breaker.record_failure()
+            if attempt == max_retries:
+                upstreams.record_failure(host, e.__class__.__name__)
+                raise
+            print(f"Request to {host} failed ({e.__class__.__name__}), retrying")
+            time.sleep(backoff_delay(attempt))
+            continue
+
+        if response.status_code in RETRY_STATUSES:
+            upstream.breaker.record_failure()
+            if attempt < max_retries:
+                print(f"Request to {host} returned {response.status_code}, retrying")
+                time.sleep(backoff_delay(attempt, response.headers.get('Retry-After')))
+                continue
+            upstreams.record_failure(host, response.status_code)
+        else:
+            upstream.breaker.record_success()
+
+        if fixtures.HTTP_MODE == 'record':
+            fixtures.record(url, params, response)
+        return response
@@ -0,0 +1,100 @@
+#%%
+'''
+Record and replay transport for http_client, so every page can be rendered and measured without API keys or network
+access. Set DASHBOARD_HTTP_MODE to choose how http_client.get() behaves:
+    - live: Normal requests (default)
+    - record: Normal requests, and every final response is saved as a fixture
+    - replay: No requests, responses come from the fixtures, a request without one fails like a connection error
+
+Fixtures are json files under DASHBOARD_FIXTURES_PATH/{host}/, keyed by the request url with api keys left out, so
+fixtures recorded with one set of keys replay with any other (or none). Dates in the url (i.e. a price history's date
+range, or today's astronomy) are keyed as days from the day of the request, so fixtures recorded on one day replay the
+same requests made on a later day.
+Text bodies are saved as text so fixtures can be read and diffed, anything else as base64.
+'''
+import base64
+import datetime
+import hashlib
+import json
+import os
+import re
+import requests
+from urllib.parse import urlparse, parse_qsl, urlencode
+
+HTTP_MODE = os.environ.get('DASHBOARD_HTTP_MODE', 'live')
+FIXTURES_PATH = os.environ.get('DASHBOARD_FIXTURES_PATH', 'devtools/fixtures')
+
+# Query string parameters that hold api keys, never written to a fixture or used in its key
+SECRET_PARAMS = {'key', 'token', 'apikey', 'api_key'}
+
+# Response headers worth keeping, the rest are connection details
+KEPT_HEADERS = {'content-type', 'retry-after'}
+
+# ISO dates in a url, replaced with their offset from today in fixture keys
+DATE_PATTERN = re.compile(r'\d{4}-\d{2}-\d{2}')
+
+
+# Function to get a request's canonical url, its full url with the secret parameters removed and the rest sorted
+def canonical_url(url, params=None):
+    full_url = requests.Request('GET', url, params=params).prepare().url
+    parsed = urlparse(full_url)
+    query = sorted((name, value) for name, value in parse_qsl(parsed.query, keep_blank_values=True) if name.lower() not in SECRET_PARAMS)
+    return parsed._replace(query=urlencode(query)).geturl()
+
+
+# Function to write a date matched in a url as days from today, i.e. 2024-10-18 requested on 2026-10-18 is {today-730}
+def relative_date(match):
+    try:
+        days = (datetime.date.fromisoformat(match.group()) - datetime.date.today()).days
+    except ValueError:
+        return match.group()
+    return f'{{today{days:+d}}}'
+
+
+# Function to get the path of a request's fixture
+def fixture_path(url, params=None, root=None):
+    canonical = canonical_url(url, params)
+    host = urlparse(canonical).netloc
+    key = hashlib.sha256(DATE_PATTERN.sub(relative_date, canonical).encode()).hexdigest()[:24]
+    return os.path.join(root or FIXTURES_PATH, host, f'{key}.json'), canonical
+
+
+# Function to save a response as a fixture
+def record(url, params, response, root=None):
+    path, canonical = fixture_path(url, params, root)
+    fixture = {
+        'url': canonical,
+        'status_code': response.status_code,
+        'headers': {name: value for name, value in response.headers.items() if name.lower() in KEPT_HEADERS},
+    }
+    try:
+        fixture['text'] = response.content.decode('utf-8')
+    except UnicodeDecodeError:
+        fixture['body'] = base64.b64encode(response.content).decode()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(fixture, f, indent=1)
+
+
+# Function to build a response from a request's fixture
+def replay(url, params=None, root=None):
+    '''
+    Returns:
+        - response: A requests response built from the fixture
+
+    Raises:
+        - requests.ConnectionError if there is no fixture for the request, so fetchers treat it like the network being down
+    '''
+    path, canonical = fixture_path(url, params, root)
+    if not os.path.exists(path):
+        raise requests.ConnectionError(f'No fixture for {canonical}')
+    with open(path) as f:
+        fixture = json.load(f)
+
+    response = requests.Response()
+    response.status_code = fixture['status_code']
+    response.headers.update(fixture['headers'])
+    response._content = fixture['text'].encode('utf-8') if 'text' in fixture else base64.b64decode(fixture['body'])
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    response.url = canonical
+    return response
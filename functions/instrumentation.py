@@ -0,0 +1,163 @@
+#%%
+import contextlib
+import functools
+import os
+import threading
+import time
+import pandas as pd
+import streamlit as st
+import functions.cache as cache
+import functions.upstreams as upstreams
+from prometheus_client import Histogram, REGISTRY, start_http_server
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+# Local port the Prometheus text format metrics are served on, 0 to turn the endpoint off
+METRICS_PORT = int(os.environ.get('DASHBOARD_METRICS_PORT', 9464))
+
+# Show the render timings table in the sidebar by default
+SHOW_TIMINGS = os.environ.get('DASHBOARD_SHOW_TIMINGS', '0') == '1'
+
+# Streamlit re-imports this module when a file changes but the Prometheus registry lives on, so the histogram a
+# previous import registered is reused rather than registered again
+SPAN_SECONDS = REGISTRY._names_to_collectors.get('dashboard_span_seconds') or Histogram(
+    'dashboard_span_seconds',
+    'Time spent in instrumented spans, by kind (page, fetch, chart, plotly) and name',
+    ['kind', 'name'],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+
+# Spans recorded during the current script run, per thread so concurrent sessions don't mix
+_render = threading.local()
+
+
+# Context manager to time a block of code
+@contextlib.contextmanager
+def span(kind, name):
+    '''
+    Records how long the block took in the dashboard_span_seconds histogram, and in the current render's timings
+    if begin_render() was called on this thread.
+
+    Parameters:
+        - kind: What is being timed, i.e. 'page', 'fetch', 'chart' or 'plotly'
+        - name: Which one, i.e. the function name
+
+    Usage:
+        with instr.span('page', view_selection):
+            render(...)
+    '''
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        SPAN_SECONDS.labels(kind, name).observe(seconds)
+        spans = getattr(_render, 'spans', None)
+        if spans is not None:
+            spans.append((kind, name, seconds))
+
+
+# Decorator to time every call to a function
+def timed(kind, name=None):
+    '''
+    Parameters:
+        - kind: What is being timed, i.e. 'fetch' or 'chart'
+        - name: Optional span name, defaults to module.function
+
+    Usage:
+        @cache.cached(ttl='1h')
+        @instr.timed('fetch')
+        def get_news_data(api_key, country, category, number=15):
+            ...
+    '''
+    def decorator(func):
+        label = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(kind, label):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Function to draw a plotly chart with the time streamlit spends serializing it recorded as a span
+def plotly_chart(fig, name, **kwargs):
+    with span('plotly', name):
+        return st.plotly_chart(fig, **kwargs)
+
+
+# Function to start collecting the spans of a new script run on this thread
+def begin_render():
+    _render.spans = []
+
+
+# Function to get the spans recorded since begin_render()
+def render_timings():
+    '''
+    Returns:
+        - df: One row per span in the order they finished, with Kind, Name and Seconds columns
+    '''
+    return pd.DataFrame(getattr(_render, 'spans', []), columns=['Kind', 'Name', 'Seconds'])
+
+
+class CacheCollector:
+    '''
+    Exports every @cache.cached function's counters at scrape time, so the cache keeps a single set of counters.
+    '''
+    COUNTERS = ['hits', 'misses', 'stale_hits', 'refreshes', 'coalesced', 'degraded', 'evictions']
+
+    def collect(self):
+        infos = [c.info() for c in cache.CACHES.values()]
+        for counter in self.COUNTERS:
+            metric = CounterMetricFamily(f'dashboard_cache_{counter}', f'Cache {counter.replace("_", " ")} by function', labels=['function'])
+            for info in infos:
+                metric.add_metric([info['function']], info[counter])
+            yield metric
+        for gauge in ['entries', 'bytes', 'max_bytes']:
+            metric = GaugeMetricFamily(f'dashboard_cache_{gauge}', f'Cache {gauge.replace("_", " ")} by function', labels=['function'])
+            for info in infos:
+                metric.add_metric([info['function']], info[gauge])
+            yield metric
+
+
+class UpstreamCollector:
+    '''
+    Exports each upstream's circuit breaker state, 0 closed, 1 half open, 2 open.
+    '''
+    STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+    def collect(self):
+        metric = GaugeMetricFamily('dashboard_upstream_breaker_state', 'Circuit breaker state by upstream host', labels=['host'])
+        for info in upstreams.upstream_report():
+            metric.add_metric([info['host']], self.STATES[info['state']])
+        yield metric
+
+
+# Function to register a collector, replacing the one a previous import of this module registered, which would
+# otherwise clash with it and report the previous import's caches and upstreams
+def register_collector(collector, name):
+    previous = REGISTRY._names_to_collectors.get(name)
+    if previous is not None:
+        REGISTRY.unregister(previous)
+    REGISTRY.register(collector)
+
+
+register_collector(CacheCollector(), 'dashboard_cache_entries')
+register_collector(UpstreamCollector(), 'dashboard_upstream_breaker_state')
+
+_server_started = False
+_server_lock = threading.Lock()
+
+
+# Function to serve the metrics in Prometheus text format at http://127.0.0.1:{port}/metrics, once per process
+def start_metrics_server(port=METRICS_PORT):
+    global _server_started
+    with _server_lock:
+        if _server_started or not port:
+            return
+        try:
+            start_http_server(port, addr='127.0.0.1')
+            print(f"Serving metrics on http://127.0.0.1:{port}/metrics")
+        except OSError as e:
+            print(f"Error starting metrics endpoint on port {port}: {e}")
+        _server_started = True
@@ -1,11 +1,13 @@
 #%%
-import requests
-import streamlit as st
+import functions.http_client as hc
+import functions.cache as cache
 import pandas as pd
 import xmltodict
 import json
+import functions.instrumentation as instr
 
-@st.cache_data(ttl='1h')
+@cache.cached(ttl='1h', max_bytes=8 * 1024 ** 2, persist=True, max_stale='6h')
+@instr.timed('fetch')
 def get_news_data(api_key, country, category, number=15):
     '''
     Fetches news headlines, sources, links, images, and summaries given a category
@@ -28,7 +30,7 @@ def get_news_data(api_key, country, category, number=15):
         "pageSize": number
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
@@ -48,7 +50,8 @@ def get_news_data(api_key, country, category, number=15):
         return None
     
 
-@st.cache_data(ttl='1h')
+@cache.cached(ttl='1h', max_bytes=8 * 1024 ** 2, persist=True)
+@instr.timed('fetch')
 def get_research_data(title_keyword, author_keyword=None, api_key=None):
     '''
     Fetches economics research articles.
@@ -70,7 +73,7 @@ def get_research_data(title_keyword, author_keyword=None, api_key=None):
         "max_results": 10
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
@@ -0,0 +1,132 @@
+#%%
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from datetime import date, timedelta
+import json
+import os
+import threading
+
+# Root of the local daily bar store, one parquet file per stock symbol
+BAR_STORE_PATH = os.environ.get('DASHBOARD_BAR_STORE_PATH', 'data/bar_store')
+
+# Parquet metadata key holding the date spans a symbol's file covers
+SPANS_KEY = b'covered_spans'
+
+# Serializes read, merge and write so sessions filling different edges of one symbol don't drop each other's bars
+_write_lock = threading.Lock()
+
+
+# Function to get the parquet file path for a given stock symbol
+def store_path(symbol, root=BAR_STORE_PATH):
+    return os.path.join(root, f'{symbol}.parquet')
+
+
+# Function to merge date spans that overlap or touch
+def merge_spans(spans):
+    '''
+    Parameters:
+        - spans: List of (start, end) date tuples, both days included
+
+    Returns:
+        - spans: The same days as a sorted list of non overlapping (start, end) tuples
+    '''
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start <= merged[-1][1] + timedelta(days=1):
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+# Function to find the parts of a date range the covered spans don't include
+def missing_spans(spans, start, end):
+    '''
+    Parameters:
+        - spans: Sorted, non overlapping list of covered (start, end) date tuples
+        - start: First day of the range
+        - end: Last day of the range
+
+    Returns:
+        - missing: List of (start, end) date tuples inside the range that aren't covered, empty if it's all covered
+    '''
+    missing = []
+    for span_start, span_end in spans:
+        if span_end < start:
+            continue
+        if span_start > end:
+            break
+        if span_start > start:
+            missing.append((start, span_start - timedelta(days=1)))
+        start = max(start, span_end + timedelta(days=1))
+    if start <= end:
+        missing.append((start, end))
+    return missing
+
+
+# Function to read a symbol's stored bars and the date spans they cover
+def read(symbol, root=BAR_STORE_PATH):
+    '''
+    Reads a symbol's file from the store. Days inside a covered span with no bar are days the market was closed, so a
+    covered span never needs fetching again.
+
+    Parameters:
+        - symbol: Stock symbol (i.e. AAPL)
+        - root: Root directory of the store
+
+    Returns:
+        - df: Stored daily bars sorted by t, None if nothing is stored
+        - spans: Sorted list of covered (start, end) date tuples
+    '''
+    path = store_path(symbol, root)
+    if not os.path.exists(path):
+        return None, []
+
+    try:
+        table = pq.read_table(path)
+        metadata = table.schema.metadata or {}
+        spans = [(date.fromisoformat(start), date.fromisoformat(end)) for start, end in json.loads(metadata.get(SPANS_KEY, b'[]'))]
+        return table.to_pandas(), spans
+    except Exception as e:
+        print(f"Error reading bar store file {path}: {e}")
+        return None, []
+
+
+# Function to merge newly fetched bars and the span they cover into the store
+def write(symbol, df, start, end, root=BAR_STORE_PATH):
+    '''
+    Merges a df of bars fetched for start through end into the symbol's file, newer bars replacing stored bars for the
+    same day. The covered spans live in the parquet file's metadata, so bars and spans are always written together,
+    and writes go to a temp file first so other processes never see a partial file.
+
+    Parameters:
+        - symbol: Stock symbol (i.e. AAPL)
+        - df: Daily bars for start through end, with a datetime t column (empty if the market was closed throughout)
+        - start: First day the fetch covered
+        - end: Last day the fetch covered, None to store the bars without marking any span covered
+        - root: Root directory of the store
+
+    Returns:
+        - df: Every stored bar for the symbol after the merge, sorted by t
+    '''
+    with _write_lock:
+        stored_df, spans = read(symbol, root)
+        if stored_df is not None and not stored_df.empty:
+            df = pd.concat([stored_df, df]) if not df.empty else stored_df
+        df = df.drop_duplicates(subset='t', keep='last').sort_values('t').reset_index(drop=True) if not df.empty else df
+
+        if end is not None and start <= end:
+            spans = merge_spans(spans + [(start, end)])
+
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        spans_json = json.dumps([(span_start.isoformat(), span_end.isoformat()) for span_start, span_end in spans])
+        table = table.replace_schema_metadata({**(table.schema.metadata or {}), SPANS_KEY: spans_json.encode()})
+
+        path = store_path(symbol, root)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        pq.write_table(table, tmp_path)
+        os.replace(tmp_path, path)
+
+    return df
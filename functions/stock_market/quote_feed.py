@@ -0,0 +1,201 @@
+#%%
+import asyncio
+import json
+import os
+import threading
+import time
+from tornado.websocket import websocket_connect
+import functions.stock_market.stocks_data_fetch as sdf
+import functions.http_fixtures as fixtures
+
+# Finnhub's trade stream, point it at devtools/quote_feed_stub.py to run without a Finnhub key. Replayed runs have no
+# stream unless one is given, the feed then serves the replayed REST quotes as it does while the stream is down
+FEED_URL = os.environ.get('DASHBOARD_QUOTE_FEED_URL', None if fixtures.HTTP_MODE == 'replay' else 'wss://ws.finnhub.io')
+
+# Symbols streamed at once (Finnhub's free tier allows 50), the least recently read are unsubscribed past this
+MAX_SYMBOLS = 50
+
+# Seconds between REST snapshots of every subscribed symbol, which keep previous closes current (and are the only
+# updates while the stream is down)
+SNAPSHOT_INTERVAL = 15 * 60
+FALLBACK_POLL_INTERVAL = 30
+
+# Seconds to wait before reconnecting to the stream, doubling up to the max
+RECONNECT_DELAY = 1
+RECONNECT_DELAY_MAX = 60
+
+
+class QuoteFeed:
+    '''
+    Process wide live quote table. One websocket subscription to Finnhub's trade stream keeps the last price of every
+    symbol any session has asked for, seeded and corrected by REST snapshots. Every session reads from the table, so
+    the number of upstream calls depends on the symbols watched, not on how many people are watching. If the stream
+    is down the feed falls back to polling the REST quote endpoint for the subscribed symbols.
+
+    One feed runs per api key, every session using the same key shares it.
+
+    Usage:
+        quotes = get_feed(finnhub_api_key).get_quotes(['AAPL', 'MSFT'])
+    '''
+    def __init__(self, api_key, url=FEED_URL):
+        self.api_key = api_key
+        self.url = url
+        self.quotes = {}
+        self.last_read = {}
+        self.seeding = {}
+        self.streaming = False
+        self.lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='quote-feed-loop', daemon=True)
+        self.thread.start()
+        if self.url:
+            asyncio.run_coroutine_threadsafe(self.stream(), self.loop)
+        asyncio.run_coroutine_threadsafe(self.snapshots(), self.loop)
+
+    def get_quotes(self, symbols, deadline=2.0):
+        '''
+        Parameters:
+            - symbols: List of stock symbols
+            - deadline: Seconds to wait for the first snapshot of symbols the feed doesn't have yet, including symbols
+                        another session is already fetching
+
+        Returns:
+            - quotes: Dictionary keyed by symbol like sdf.fetch_stock_quotes() returns, {'symbol': symbol, 'late': True}
+                      for a symbol whose first snapshot hasn't arrived yet
+        '''
+        start = time.monotonic()
+        with self.lock:
+            self.last_read.update({symbol: start for symbol in symbols})
+            missing = [symbol for symbol in symbols if symbol not in self.quotes and symbol not in self.seeding]
+            waiting = [self.seeding[symbol] for symbol in symbols if symbol not in self.quotes and symbol in self.seeding]
+            seeded = threading.Event()
+            self.seeding.update({symbol: seeded for symbol in missing})
+
+        if missing:
+            try:
+                self.store(sdf.fetch_stock_quotes(self.api_key, missing, deadline))
+            finally:
+                with self.lock:
+                    for symbol in missing:
+                        self.seeding.pop(symbol, None)
+                seeded.set()
+            self.call_on_loop(self.subscribe, missing)
+            self.trim()
+
+        # Wait out the rest of the deadline for symbols another session started fetching first
+        for event in waiting:
+            event.wait(max(0, deadline - (time.monotonic() - start)))
+
+        with self.lock:
+            return {symbol: dict(self.quotes[symbol]) if symbol in self.quotes else {'symbol': symbol, 'late': True} for symbol in symbols}
+
+    def get_quote(self, symbol, deadline=5.0):
+        quote = self.get_quotes([symbol], deadline)[symbol]
+        return None if quote.get('late') else quote
+
+    # Function to save REST quotes into the table
+    def store(self, quotes):
+        with self.lock:
+            for symbol, quote in quotes.items():
+                if quote and not quote.get('late'):
+                    self.quotes[symbol] = {**quote, 'updated': time.time()}
+
+    # Function to apply one trade from the stream
+    def trade(self, symbol, price, timestamp):
+        with self.lock:
+            quote = self.quotes.get(symbol)
+            if quote is None:
+                return
+            quote['current_price'] = price
+            quote['change_from_prev_close'] = round(price - quote['prev_close'], 2)
+            quote['daily_high'] = max(quote['daily_high'], price)
+            quote['daily_low'] = min(quote['daily_low'], price)
+            quote['updated'] = timestamp / 1000
+
+    # Function to drop the least recently read symbols past MAX_SYMBOLS, and symbols whose first snapshot never came
+    def trim(self):
+        with self.lock:
+            evicted = [symbol for symbol in self.last_read if symbol not in self.quotes and symbol not in self.seeding]
+            if len(self.quotes) > MAX_SYMBOLS:
+                evicted += sorted(self.quotes, key=lambda symbol: self.last_read.get(symbol, 0))[:len(self.quotes) - MAX_SYMBOLS]
+            for symbol in evicted:
+                self.quotes.pop(symbol, None)
+                self.last_read.pop(symbol, None)
+        if evicted:
+            self.call_on_loop(self.unsubscribe, evicted)
+
+    def call_on_loop(self, fn, symbols):
+        asyncio.run_coroutine_threadsafe(fn(symbols), self.loop)
+
+    async def send(self, message):
+        if self.streaming:
+            await self.ws.write_message(json.dumps(message))
+
+    async def subscribe(self, symbols):
+        for symbol in symbols:
+            await self.send({'type': 'subscribe', 'symbol': symbol})
+
+    async def unsubscribe(self, symbols):
+        for symbol in symbols:
+            await self.send({'type': 'unsubscribe', 'symbol': symbol})
+
+    # Keeps one websocket connection to the trade stream open, reconnecting with backoff
+    async def stream(self):
+        delay = RECONNECT_DELAY
+        while True:
+            try:
+                self.ws = await websocket_connect(f'{self.url}?token={self.api_key}')
+                self.streaming = True
+                delay = RECONNECT_DELAY
+                with self.lock:
+                    symbols = list(self.quotes)
+                await self.subscribe(symbols)
+
+                while True:
+                    message = await self.ws.read_message()
+                    if message is None:
+                        break
+                    message = json.loads(message)
+                    if message.get('type') == 'trade':
+                        for trade in message['data']:
+                            self.trade(trade['s'], trade['p'], trade['t'])
+            except Exception as e:
+                # Report each outage once rather than every retry, without the api key the connection url carries
+                if self.streaming or delay == RECONNECT_DELAY:
+                    print(f"Quote stream error: {str(e).replace(self.api_key, '***')}")
+            if self.streaming or delay == RECONNECT_DELAY:
+                print("Quote stream disconnected, polling quotes until it reconnects")
+            self.streaming = False
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, RECONNECT_DELAY_MAX)
+
+    # Refreshes every subscribed symbol from the REST endpoint, often while the stream is down and rarely while it's up
+    async def snapshots(self):
+        last = time.monotonic()
+        while True:
+            await asyncio.sleep(FALLBACK_POLL_INTERVAL)
+            if self.streaming and time.monotonic() - last < SNAPSHOT_INTERVAL:
+                continue
+            with self.lock:
+                symbols = list(self.quotes)
+            if symbols:
+                quotes = await self.loop.run_in_executor(None, sdf.fetch_stock_quotes, self.api_key, symbols, FALLBACK_POLL_INTERVAL)
+                self.store(quotes)
+            last = time.monotonic()
+
+    def info(self):
+        with self.lock:
+            return {'streaming': self.streaming, 'symbols': len(self.quotes)}
+
+
+_feeds = {}
+_feed_lock = threading.Lock()
+
+
+# Function to get the process wide quote feed for an api key, started on first use
+def get_feed(api_key):
+    with _feed_lock:
+        if api_key not in _feeds:
+            _feeds[api_key] = QuoteFeed(api_key)
+        return _feeds[api_key]
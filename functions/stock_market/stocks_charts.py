@@ -3,16 +3,15 @@ import plotly.express as px
 import numpy as np
 import plotly.graph_objects as go
 import streamlit as st
+import functions.instrumentation as instr
 
 
 #%%
 # Function to create a candle stick chart
+@instr.timed('chart')
 def candle_stick_chart(df):
-    # Format the dates
-    formatted_dates = df['t'].dt.strftime('%Y-%m-%d')
-
     # Create candlestick chart
-    fig = go.Figure(data=[go.Candlestick(x=formatted_dates,
+    fig = go.Figure(data=[go.Candlestick(x=df['t'],
                                         open=df['o'],
                                         high=df['h'],
                                         low=df['l'],
@@ -34,25 +33,39 @@ def candle_stick_chart(df):
     
     # Add hover labels to candlestick trace
     fig.update_traces(hoverinfo='text',
-                      hovertext=df[['t', 'o', 'h', 'l', 'c']].apply(lambda row: f"<b>Date</b>: {row['t'].strftime('%Y-%m-%d')}<br>"
-                                                                                f"<b>Open</b>: ${row['o']:.2f}<br>"
-                                                                                f"<b>High</b>: ${row['h']:.2f}<br>"
-                                                                                f"<b>Low</b>: ${row['l']:.2f}<br>"
-                                                                                f"<b>Close</b>: ${row['c']:.2f}",
-                                                                                axis=1))
+                      hovertext=candle_stick_hover_text(df))
 
     return fig
 
+
+# Function to build the candlestick hover labels for every bar at once
+def candle_stick_hover_text(df):
+    '''
+    Candlesticks don't take a hovertemplate in plotly 5, so the labels are built here. Dates are formatted as a
+    numpy date array and the columns are pulled out as lists once, which leaves one string format per bar.
+
+    Parameters:
+        - df: Pandas df with daily stock data (t, o, h, l and c columns)
+
+    Returns:
+        - List with one hover label per bar
+    '''
+    label = '<b>Date</b>: %s<br><b>Open</b>: $%.2f<br><b>High</b>: $%.2f<br><b>Low</b>: $%.2f<br><b>Close</b>: $%.2f'
+    dates = df['t'].to_numpy().astype('datetime64[D]').astype(str).tolist()
+    return [label % bar for bar in zip(dates, df['o'].tolist(), df['h'].tolist(), df['l'].tolist(), df['c'].tolist())]
+
 #%%
 # Function to create a stock time series chart
+@instr.timed('chart')
 def time_series_chart(df, title):
     # Create a Plotly figure for the time series plot
     fig = go.Figure()
 
     # Add a line trace for the time series data
-    fig.add_trace(go.Line(
+    fig.add_trace(go.Scatter(
         x=df['t'], 
         y=df['c'], 
+        mode='lines',
         hovertemplate=(
             'Date: %{x|%Y-%m-%d}<br>' + 
             'Close Price: $%{y:,.2f}<br>' + 
@@ -1,15 +1,39 @@
 # %%
-import requests
+import functions.http_client as hc
 from bs4 import BeautifulSoup
 import pandas as pd
-import streamlit as st
+import functions.cache as cache
+import concurrent.futures
+import random
+import time
+import functions.instrumentation as instr
+import functions.upstreams as upstreams
+import functions.stock_market.bar_store as bar_store
+from datetime import date, datetime, time as clock_time, timedelta
+from zoneinfo import ZoneInfo
 
-# Function to get time series data on a give stock over a given timeframe from polygon api
-@st.cache_data
+# The market's calendar, a day's bar is final once extended hours trading has ended in New York
+MARKET_TZ = ZoneInfo('America/New_York')
+MARKET_DAY_END = clock_time(20, 0)
+
+
+# Function to get the last day whose trading has ended, on the New York market calendar rather than the server's
+def last_closed_day(now=None):
+    now = now or datetime.now(MARKET_TZ)
+    return now.date() if now.time() >= MARKET_DAY_END else now.date() - timedelta(days=1)
+
+
+# Function to get time series data on a give stock over a given timeframe, from the local bar store where it can
+@instr.timed('fetch')
 def get_time_series(symbol, api_key, start_date, end_date):
     '''
     Takes a stock symbol, polygon api key, start date and end date, returns a df with daily 
-    stock data on given stock over defined timeframe.
+    stock data on given stock over defined timeframe. Bars come from the local bar store (see bar_store.py), and
+    only the days the store doesn't cover yet are fetched from polygon. A day's bar never changes once its trading
+    has ended in New York, so closed days are fetched and written to the store once. The current day's bar changes
+    until then, so it's never written, it's served from request_time_series' 10 minute cache and merged in memory.
+    Polygon can publish the latest closed day's bar late, so a span reaching it is only marked covered through the
+    last bar fetched, and the days after that are fetched again next time.
 
     Parameters:
         - symbol: Stock symbol (i.e. APPL)
@@ -20,23 +44,116 @@ def get_time_series(symbol, api_key, start_date, end_date):
     Returns:
         - Pandas df with daily stock data
     '''
+    start, end = date.fromisoformat(start_date), date.fromisoformat(end_date)
+    closed_through = last_closed_day()
+    open_from = pd.Timestamp(closed_through + timedelta(days=1))
+
+    df, spans = bar_store.read(symbol)
+    open_dfs = []
+    for missing_start, missing_end in bar_store.missing_spans(spans, start, end):
+        fetched_df = request_time_series(symbol, api_key, missing_start.isoformat(), missing_end.isoformat())
+        if fetched_df is None:
+            continue
+
+        # Store the closed days, only when the span reaches back before the open day so there is something new to store
+        closed_end = min(missing_end, closed_through)
+        if closed_end >= missing_start:
+            closed_df = fetched_df[fetched_df['t'] < open_from] if not fetched_df.empty else fetched_df
+            if closed_end == closed_through:
+                closed_end = closed_df['t'].max().date() if not closed_df.empty else missing_start - timedelta(days=1)
+            if closed_end >= missing_start or not closed_df.empty:
+                df = bar_store.write(symbol, closed_df, missing_start, closed_end)
+        if not fetched_df.empty:
+            open_dfs.append(fetched_df[fetched_df['t'] >= open_from])
+
+    frames = [frame for frame in [df] + open_dfs if frame is not None and not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames).drop_duplicates(subset='t', keep='last').sort_values('t') if len(frames) > 1 else frames[0]
+    return slice_dates(df, start, end)
+
+
+# Function to cut a df of daily bars down to the bars from start through end
+def slice_dates(df, start, end):
+    '''
+    Parameters:
+        - df: Pandas df with daily stock data, sorted by t
+        - start: First day to keep, a date or datetime (its time of day is ignored)
+        - end: Last day to keep, a date or datetime (its time of day is ignored)
+
+    Returns:
+        - Pandas df with the bars in the range, empty if df is (it has no t column when a fetch failed)
+    '''
+    if df.empty:
+        return df
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize() + pd.Timedelta(days=1)
+    return df[(df['t'] >= start) & (df['t'] < end)].reset_index(drop=True)
+
+
+# Function to get the two years of daily bars every stock overview metric and chart window is sliced from
+@cache.cached(ttl='10m', max_bytes=32 * 1024 ** 2)
+@instr.timed('fetch')
+def get_stock_history(symbol, api_key, end_date):
+    '''
+    Takes a stock symbol, polygon api key and end date, returns two years of daily stock data up to the end date
+    with rolling 52 week extrema, so the 52 week stats and any window inside the two years come from one fetch.
+
+    Parameters:
+        - symbol: Stock symbol (i.e. APPL)
+        - api_key: Polygon api key
+        - end_date: Last day to get, usually today
+
+    Returns:
+        - Pandas df with daily stock data, plus high_52w and low_52w columns with the highest high and lowest low of
+          the 52 weeks up to each day
+    '''
+    start_date = (date.fromisoformat(end_date) - timedelta(days=2*365)).isoformat()
+    df = get_time_series(symbol, api_key, start_date, end_date)
+    if df.empty:
+        return df
+
+    rolling = df.rolling('365D', on='t')
+    df['high_52w'] = rolling['h'].max()
+    df['low_52w'] = rolling['l'].min()
+    return df
+
+
+# Function to fetch daily bars on a given stock over a given timeframe from polygon api
+@cache.cached(ttl='10m', max_bytes=16 * 1024 ** 2)
+@instr.timed('fetch')
+def request_time_series(symbol, api_key, start_date, end_date):
+    '''
+    Parameters:
+        - symbol: Stock symbol (i.e. APPL)
+        - api_key: Polygon api key
+        - start_date
+        - end_date
+
+    Returns:
+        - Pandas df with daily stock data, empty if there were no trading days in the timeframe, None if the fetch failed
+    '''
     base_url = f"https://api.polygon.io/v2/aggs/ticker/{symbol}/range/1/day/{start_date}/{end_date}"
     params = {
         "sort": "asc",
         "adjusted": "true",
         "apikey": api_key,
     }
-    response = requests.get(base_url, params=params)
+    try:
+        response = hc.get(base_url, params=params)
+    except Exception as e:
+        print(f"Error fetching data: {e}")
+        return None
 
     if response.status_code == 200:
         try:
             data = response.json()
-            df = pd.DataFrame(data['results'])
-            df['t'] = pd.to_datetime(df['t'], unit='ms')
+            df = pd.DataFrame(data.get('results', []))
+            if not df.empty:
+                df['t'] = pd.to_datetime(df['t'], unit='ms')
             return df
         except Exception as e:
             print(f"Error: {e}")
-            return pd.DataFrame()
+            return None
     else:
         print(f"Error fetching data: {response.status_code}")
         try:
@@ -44,30 +161,33 @@ def get_time_series(symbol, api_key, start_date, end_date):
             print(f"Error message: {error_message}")
         except Exception as e:
             print(f"Error processing JSON for error message: {e}")
-        return pd.DataFrame()
+        return None
 
 
 # Function to get current stock quote of selected stock using finnhub
-def fetch_stock_quote(finnhub_client, symbol):
+@instr.timed('fetch')
+def fetch_stock_quote(api_key, symbol):
     '''
-    Takes a finnhub_client and stock symbol. Initialize the finnhub_client and pass it to the function. Returns
-    current stock quote.
+    Takes a finnhub api key and stock symbol. Returns current stock quote.
 
     Parameters:
-        - finnhub_client
+        - api_key: Finnhub api key
         - symbol: Stock symbol (i.e. APPL)
 
     Returns:
         - Stock quote dictionary 
     '''
     try:
-        quote = finnhub_client.quote(symbol)
+        response = hc.get('https://finnhub.io/api/v1/quote', params={'symbol': symbol, 'token': api_key})
+        response.raise_for_status()
+        quote = response.json()
         quote = {
             'symbol': symbol,
             'current_price': quote['c'],
             'change_from_prev_close': quote['d'],
             'daily_high': quote['h'],
             'daily_low': quote['l'],
+            'prev_close': quote['pc'],
         }
         return quote
     except Exception as e:
@@ -75,12 +195,75 @@ def fetch_stock_quote(finnhub_client, symbol):
         return None
 
 
+# Quotes fetched at once by fetch_stock_quotes(), every session shares these workers
+QUOTE_WORKERS = 8
+_quote_executor = concurrent.futures.ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix='quotes')
+
+
+# Function to get current stock quotes for several symbols at once, within a deadline
+@instr.timed('fetch')
+def fetch_stock_quotes(api_key, symbols, deadline=2.0):
+    '''
+    Takes a finnhub api key and a list of stock symbols, fetches every quote concurrently and returns whatever
+    arrived within the deadline. Quotes that are still in flight at the deadline are returned marked late rather than
+    waited on, so one slow quote can't hold up the page.
+
+    Parameters:
+        - api_key: Finnhub api key
+        - symbols: List of stock symbols (i.e. ['AAPL', 'MSFT'])
+        - deadline: Seconds to wait for the quotes
+
+    Returns:
+        - quotes: Dictionary keyed by symbol, in the order given. Each value is a quote dictionary like
+                  fetch_stock_quote() returns, {'symbol': symbol, 'late': True} if it didn't arrive in time, or None
+                  if the fetch failed
+    '''
+    start = time.monotonic()
+    futures = {symbol: _quote_executor.submit(upstreams.run_in_context(fetch_stock_quote), api_key, symbol) for symbol in symbols}
+    concurrent.futures.wait(futures.values(), timeout=deadline)
+
+    quotes = {}
+    for symbol, future in futures.items():
+        quotes[symbol] = future.result() if future.done() else {'symbol': symbol, 'late': True}
+    late = [symbol for symbol, quote in quotes.items() if quote and quote.get('late')]
+    if late:
+        print(f"Quotes for {', '.join(late)} missed the {deadline}s deadline ({time.monotonic() - start:.2f}s)")
+    return quotes
+
+
+# Function to get a list of all US Stock symbols using finnhub
+@cache.cached(ttl='1d', max_bytes=32 * 1024 ** 2, persist=True)
+@instr.timed('fetch')
+def get_us_stock_symbols(api_key):
+    '''
+    Takes a finnhub api key, returns a df of every US stock symbol finnhub knows about.
+
+    Parameters:
+        - api_key: Finnhub api key
+
+    Returns:
+        - Pandas df of symbols with displaySymbol and description columns
+    '''
+    response = hc.get('https://finnhub.io/api/v1/stock/symbol', params={'exchange': 'US', 'token': api_key})
+
+    if response.status_code == 200:
+        try:
+            return pd.DataFrame(response.json())
+        except Exception as e:
+            print(f"Error: {e}")
+            return pd.DataFrame()
+    else:
+        print(f"Error fetching data: {response.status_code}")
+        return pd.DataFrame()
+
+
 # Function to a list of all S&P 500 Stocks by scraping Wikipedia
-@st.cache_data(ttl='1d')
+@cache.cached(ttl='1d', max_bytes=1 * 1024 ** 2, persist=True, max_stale='7d')
+@instr.timed('fetch')
 def get_sp500_symbols():
     # Grab Wikipedia article with all the S&P 500 stocks
     url = 'https://en.wikipedia.org/wiki/List_of_S%26P_500_companies'
-    response = requests.get(url)
+    response = hc.get(url)
 
     if response.status_code == 200:
         soup = BeautifulSoup(response.content, 'html.parser')
@@ -105,3 +288,19 @@ def get_sp500_symbols():
         except Exception as e:
             print(f"Error processing JSON for error message: {e}")
         return None
+
+
+# Function to pick n random S&P 500 stocks for the ticker strip, kept for 30 seconds so every session shows the same ones
+@cache.cached(ttl='30s', max_bytes=1 * 1024 ** 2)
+def get_ticker_symbols(n):
+    '''
+    Parameters:
+        - n: Number of stocks to pick
+
+    Returns:
+        - List of {'symbol': symbol, 'name': name} dictionaries, empty if the S&P 500 list is unavailable
+    '''
+    symbols = get_sp500_symbols()
+    if not symbols:
+        return []
+    return random.sample(symbols, min(n, len(symbols)))
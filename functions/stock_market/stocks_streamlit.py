@@ -1,10 +1,10 @@
 #%%
 import streamlit as st
-import random
 import functions.stock_market.stocks_data_fetch as sdf
+import functions.stock_market.quote_feed as qf
 import functions.stock_market.stocks_charts as sc
+import functions.instrumentation as instr
 import os
-import finnhub
 import pandas as pd
 from datetime import datetime, timedelta
 from streamlit_extras.stylable_container import stylable_container
@@ -18,15 +18,16 @@ one_years_ago_plus_one_day = (current_date - timedelta(days=364))
 # Get API Keys
 polygon_api_key = st.secrets["polygon_stock_api_key"]
 finnhub_api_key = st.secrets["finnhub_api_key"]
-finnhub_client = finnhub.Client(api_key=finnhub_api_key)
 
-# Function to get list of all US Stock symbols
-st.cache_data(ttl='1d')
-def us_stock_symbols():
-    symbols = finnhub_client.stock_symbols('US')
-    symbol_df = pd.DataFrame(symbols)
-    return symbol_df
-symbol_df = us_stock_symbols()
+# Get list of all US Stock symbols, empty if finnhub is failing and there's nothing cached to fall back on
+try:
+    symbol_df = sdf.get_us_stock_symbols(finnhub_api_key)
+except Exception as e:
+    print(f"Error fetching stock symbols: {e}")
+    symbol_df = pd.DataFrame()
+
+# Seconds between ticker strip redraws, it only reads the shared quote feed so redraws cost no upstream calls
+TICKER_REFRESH = 10
 
 # Function to format data for stock ticker
 def stock_ticker_labels(df):
@@ -53,8 +54,9 @@ def stock_ticker_labels(df):
 
     return cp, delta, cp_num
 
-# Generates the stock tickers
-@st.cache_data(ttl='30s')
+# Generates the stock tickers, as a fragment that redraws itself from the live quote feed
+@st.experimental_fragment(run_every=TICKER_REFRESH)
+@instr.timed('fragment')
 def stock_ticker(n):
     '''
     Takes a number n and displays that many stock tickers side by side
@@ -62,28 +64,31 @@ def stock_ticker(n):
     Parameters:
         - n: The number of columns/stock tickers to create
     '''
-    # All Stock Symbols of S&P500 Stocks
-    sp500_symbols = sdf.get_sp500_symbols()
+    # n random S&P 500 stocks, the same ones for every session for 30 seconds
+    try:
+        fetch_symbols = sdf.get_ticker_symbols(n)
+    except Exception as e:
+        print(f"Error picking ticker symbols: {e}")
+        fetch_symbols = []
+    names = {symbol['symbol']: symbol['name'] for symbol in fetch_symbols}
 
-    # Pick 10 at random
-    fetch_symbols = random.sample(sp500_symbols, n)
-    data = [sdf.fetch_stock_quote(finnhub_client, symbol['symbol']) for symbol in fetch_symbols]
+    # Read their quotes from the shared live feed, quotes it doesn't have yet and can't get in time are shown as late
+    data = qf.get_feed(finnhub_api_key).get_quotes(list(names))
 
     # Create n columns
     cols = st.columns(n)
 
-    # Loop through columns and fetch_stock_quote() returns to create tickers
-    for i, stock in enumerate(data):
+    # Loop through columns and the feed's quotes to create tickers
+    for i, stock in enumerate(data.values()):
         if stock:
             with cols[i % n]:
-                for item in fetch_symbols:
-                    if item['symbol']==stock['symbol']:
-                        stock_name = item['name']
-                        break
-
-                label = f"{stock['symbol']}, ({stock_name})"
+                label = f"{stock['symbol']}, ({names[stock['symbol']]})"
 
-                cp, delta, cp_num = stock_ticker_labels(stock)
+                if stock.get('late'):
+                    cp, delta, help = '...', None, 'This quote did not arrive in time, it will show on the next refresh'
+                else:
+                    cp, delta, cp_num = stock_ticker_labels(stock)
+                    help = None
                 with stylable_container(
                     key='stock-tickers',
                     css_styles="""
@@ -96,11 +101,13 @@ def stock_ticker(n):
                     }
                     """,
                 ):
-                    st.metric(label=label, value=cp, delta=delta)
+                    st.metric(label=label, value=cp, delta=delta, help=help)
                 
 
 
-# Create the Market Index Time Series section
+# Create the Market Index Time Series section, as a fragment so its radio and slider only rerun this section
+@st.experimental_fragment
+@instr.timed('fragment')
 def market_time_series():
     st.write('')
     st.markdown(f'#### Market Index Hisotry')
@@ -119,23 +126,32 @@ def market_time_series():
     # Get the right chart based on radio selection
     st.write('')
     if market == "Dow Jones Industrial Average":
-        symbol = 'DIA'
-        df = sdf.get_time_series(symbol, polygon_api_key, start_date, end_date)
-        fig = sc.time_series_chart(df, title='SPDR Dow Jones Industrial Average ETF (DIA)')
-        st.plotly_chart(fig, use_container_width=True)
+        symbol, title, chart_name = 'DIA', 'SPDR Dow Jones Industrial Average ETF (DIA)', 'market_dia'
     elif market == "S&P 500":
-        symbol = 'VOO'
-        df = sdf.get_time_series(symbol, polygon_api_key, start_date, end_date)
-        fig = sc.time_series_chart(df, title='Vanguard S&P 500 ETF (VOO)')
-        st.plotly_chart(fig, use_container_width=True)
+        symbol, title, chart_name = 'VOO', 'Vanguard S&P 500 ETF (VOO)', 'market_voo'
+    df = sdf.get_time_series(symbol, polygon_api_key, start_date, end_date)
+
+    # polygon is failing and the bar store doesn't hold the range yet, so there's nothing to show
+    if df.empty:
+        st.warning(f"Price history for {symbol} is unavailable right now, please try again in a few minutes.")
+        return
+    fig = sc.time_series_chart(df, title=title)
+    instr.plotly_chart(fig, chart_name, use_container_width=True)
     st.write('')
 
 
-# Creates the Selected Stock Summary Section
+# Creates the Selected Stock Summary Section, as a fragment so its selection and slider only rerun this section
+@st.experimental_fragment
+@instr.timed('fragment')
 def selected_stock_summary(symbol_df=symbol_df):
     st.write('')
     st.markdown(f'#### Selected Stock Overview')
     
+    # finnhub was failing when the page loaded and there's nothing cached to fall back on, so there's nothing to pick from
+    if symbol_df.empty:
+        st.warning("Stock symbols are unavailable right now, please try again in a few minutes.")
+        return
+
     # Create the stock selection box with symbol and name
     symbol_df['searchText'] = symbol_df['displaySymbol'] + ' (' + symbol_df['description'] +')'
     stock_selection = st.selectbox("", symbol_df['searchText'], index=None, placeholder="Enter a stock symbol (defaults to MSFT)")
@@ -152,47 +168,57 @@ def selected_stock_summary(symbol_df=symbol_df):
     symbol_selection.reset_index(drop=True, inplace=True)
 
     # Get Ticker data for the Stock
-    stock = sdf.fetch_stock_quote(finnhub_client, symbol_selection)
-    cp, delta, cp_num = stock_ticker_labels(stock)
-
-    # Get 52 Week High and Low, and YoY Change
-    df = sdf.get_time_series(symbol_selection[0], polygon_api_key, one_years_ago.strftime('%Y-%m-%d'), current_date.strftime('%Y-%m-%d'))
+    stock = qf.get_feed(finnhub_api_key).get_quote(symbol_selection[0])
+    if stock:
+        cp, delta, cp_num = stock_ticker_labels(stock)
+        quote_help = None
+    else:
+        # The quote didn't arrive in time, shown like a late quote in the ticker strip
+        cp, delta, cp_num = '...', None, None
+        quote_help = 'This quote did not arrive in time, it will show when the section next reruns'
+
+    # Get two years of bars once, the 52 week stats and the candlestick window are both sliced from it
+    # Empty if polygon is failing with nothing stored, and the last year is empty for a recent listing or a delisted stock,
+    # either way the stats it feeds show n/a
+    history_df = sdf.get_stock_history(symbol_selection[0], polygon_api_key, current_date.strftime('%Y-%m-%d'))
+    year_df = sdf.slice_dates(history_df, one_years_ago, current_date)
     
     # Create the four metric columns and populate with relevant data
     cols = st.columns(4)
     # Normal ticker
     with cols[0]:
-        st.metric(label=stock_selection, value=cp, delta=delta)
+        st.metric(label=stock_selection, value=cp, delta=delta, help=quote_help)
     # Price Change Year over Year
     with cols[3]:
-        close_last_year = df[df['t']==df['t'].min()]['c']
-        yoy_change = cp_num - close_last_year
-        yoy_percent_change = yoy_change / close_last_year 
-        value = f"${yoy_change[0]:.2f}"
-
-        # Similar to stock_ticker_labels() but different since main value can be negative to not using that function to format here
-        if yoy_change[0] < 0:
-            value = yoy_change[0] * -1
-            value = f"-${value:.2f}"
+        # Without a current price or a price from a year ago there's nothing to compare
+        if cp_num is None or year_df.empty:
+            value, delta_percent = 'n/a', None
         else:
-            value = f"${yoy_change[0]:.2f}"
-        if yoy_percent_change[0] < 0:
-            delta_percent = yoy_percent_change[0] * -1
-            delta_percent = f"-{delta_percent*100:.2f}%"
-        else:
-            delta_percent = f"{yoy_percent_change[0]*100:.2f}%"
+            close_last_year = year_df['c'].iloc[0]
+            yoy_change = cp_num - close_last_year
+            yoy_percent_change = yoy_change / close_last_year 
+
+            # Similar to stock_ticker_labels() but different since main value can be negative to not using that function to format here
+            if yoy_change < 0:
+                value = yoy_change * -1
+                value = f"-${value:.2f}"
+            else:
+                value = f"${yoy_change:.2f}"
+            if yoy_percent_change < 0:
+                delta_percent = yoy_percent_change * -1
+                delta_percent = f"-{delta_percent*100:.2f}%"
+            else:
+                delta_percent = f"{yoy_percent_change*100:.2f}%"
 
         # Display metrics
         st.metric(label='Price Change YoY', value=value, delta=delta_percent)
     # 52 Week Low
     with cols[1]:
-        year_min = df['l'].min()
-        value = f"${year_min:.2f}"
+        value = f"${history_df['low_52w'].iloc[-1]:.2f}" if not year_df.empty else 'n/a'
         st.metric(label='52 Week Low', value=value)
     # 52 Week High
     with cols[2]:
-        year_max = df['h'].max()
-        value = f"${year_max:.2f}"
+        value = f"${history_df['high_52w'].iloc[-1]:.2f}" if not year_df.empty else 'n/a'
         st.metric(label='52 Week Max', value=value)
     
     # Candlestick Chart
@@ -201,13 +227,14 @@ def selected_stock_summary(symbol_df=symbol_df):
 
     cols = st.columns([1, 98, 1])
     with cols[1]:
-        # Create Year Slider
-        year_range = st.slider('', min_value=two_years_ago, max_value=current_date, value=(datetime(2024, 3, 1), datetime(2024, 6, 1)), key='slider_stock')
-        start_date = year_range[0].strftime('%Y-%m-%d')
-        end_date = year_range[1].strftime('%Y-%m-%d')
+        # Create Year Slider, defaulting to the last three months
+        year_range = st.slider('', min_value=two_years_ago, max_value=current_date, value=(current_date - timedelta(days=90), current_date), key='slider_stock')
 
-    df = sdf.get_time_series(symbol_selection[0], polygon_api_key, start_date, end_date)
+    df = sdf.slice_dates(history_df, year_range[0], year_range[1])
+    if df.empty:
+        st.warning(f"There is no price history for {symbol_selection[0]} in this range, it may be unavailable right now.")
+        return
     fig = sc.candle_stick_chart(df)
-    st.plotly_chart(fig, use_container_width=True)
+    instr.plotly_chart(fig, 'stock_candlestick', use_container_width=True)
 
 
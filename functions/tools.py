@@ -17,3 +17,22 @@ def write_around_markdown(message, above=0, below=0):
     st.markdown(f'{message}', unsafe_allow_html=True)
     if below == 1:
         st.write('')
+
+
+# Function to describe how old a cached value is, for captions under data that can be served stale
+def format_age(seconds):
+    '''
+    Parameters:
+        - seconds: Age of the value in seconds, i.e. the age from a cached function's with_age()
+
+    Returns:
+        - A short description like 'just now', '12 min ago', '3 hr ago' or '2 days ago'
+    '''
+    if seconds < 60:
+        return 'just now'
+    if seconds < 60 * 60:
+        return f'{int(seconds // 60)} min ago'
+    if seconds < 24 * 60 * 60:
+        return f'{int(seconds // (60 * 60))} hr ago'
+    days = int(seconds // (24 * 60 * 60))
+    return f"{days} day{'s' if days > 1 else ''} ago"
@@ -0,0 +1,197 @@
+#%%
+import contextlib
+import contextvars
+import os
+import threading
+import time
+import requests
+
+# Set to a base url (i.e. http://127.0.0.1:8765) to send every upstream request to devtools/upstream_stub.py instead,
+# requests keep their path with the upstream's host as the first path segment
+UPSTREAM_BASE_URL = os.environ.get('DASHBOARD_UPSTREAM_BASE_URL')
+
+# Requests per second, burst, requests in flight, failures in a row that open the breaker, and seconds it stays open
+DEFAULT_POLICY = {'rate': 10, 'burst': 10, 'max_concurrency': 8, 'failure_threshold': 5, 'reset_timeout': 30}
+
+# Policy overrides for each upstream the dashboard calls, by host
+UPSTREAM_POLICIES = {
+    'api.census.gov':           {'rate': 10, 'burst': 10, 'max_concurrency': 8},
+    'api.polygon.io':           {'rate': 5 / 60, 'burst': 5, 'max_concurrency': 2},    # Free tier is 5 calls a minute
+    'finnhub.io':               {'rate': 1, 'burst': 30, 'max_concurrency': 8},         # 60 calls a minute
+    'newsapi.org':              {'rate': 1, 'burst': 5, 'max_concurrency': 2},
+    'export.arxiv.org':         {'rate': 1 / 3, 'burst': 1, 'max_concurrency': 1},      # arXiv asks for one call every 3 seconds
+    'api.weatherapi.com':       {'rate': 5, 'burst': 10, 'max_concurrency': 4},
+    'www.mountain-forecast.com': {'rate': 2, 'burst': 4, 'max_concurrency': 4, 'failure_threshold': 10},
+    'en.wikipedia.org':         {'rate': 1, 'burst': 2, 'max_concurrency': 2},
+}
+
+
+# Raised instead of making a request while an upstream's breaker is open, a ConnectionError so fetchers that already
+# handle network failures handle it the same way
+class CircuitOpenError(requests.ConnectionError):
+    pass
+
+
+class RateLimiter:
+    '''
+    Thread safe token bucket, each request takes one token and tokens refill at rate per second up to burst.
+    '''
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class CircuitBreaker:
+    '''
+    Opens after failure_threshold failed requests in a row, so callers fail fast instead of each waiting on timeouts.
+    After reset_timeout one trial request is let through (half open), its success closes the breaker and its failure
+    opens it again.
+    '''
+    def __init__(self, failure_threshold, reset_timeout):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.state == 'open' and time.monotonic() - self.opened >= self.reset_timeout:
+                self.state = 'half_open'
+                return True
+            return self.state == 'closed'
+
+    def record_success(self):
+        with self.lock:
+            self.state = 'closed'
+            self.failures = 0
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                if self.state != 'open':
+                    print(f"Circuit breaker opened after {self.failures} failures")
+                self.state = 'open'
+                self.opened = time.monotonic()
+
+
+class Upstream:
+    '''
+    Everything the http client enforces for one upstream host, a rate limiter, a cap on requests in flight and a
+    circuit breaker.
+    '''
+    def __init__(self, host, rate, burst, max_concurrency, failure_threshold, reset_timeout):
+        self.host = host
+        self.limiter = RateLimiter(rate, burst)
+        self.slots = threading.BoundedSemaphore(max_concurrency)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+
+    @contextlib.contextmanager
+    def request(self):
+        '''
+        Wraps one request attempt, raises CircuitOpenError without waiting if the breaker is open.
+        '''
+        if not self.breaker.allow():
+            record_failure(self.host, 'circuit open')
+            raise CircuitOpenError(f'Circuit breaker for {self.host} is open')
+        self.limiter.acquire()
+        with self.slots:
+            yield
+
+    def info(self):
+        return {
+            'host': self.host,
+            'state': self.breaker.state,
+            'failures': self.breaker.failures,
+            'tokens': round(self.limiter.tokens, 2),
+        }
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+# Function to get the process wide policy for a host, hosts not in UPSTREAM_POLICIES get the default policy
+def get_upstream(host):
+    with _upstreams_lock:
+        upstream = _upstreams.get(host)
+        if upstream is None:
+            upstream = Upstream(host, **{**DEFAULT_POLICY, **UPSTREAM_POLICIES.get(host, {})})
+            _upstreams[host] = upstream
+        return upstream
+
+
+# Function to point a request at the stub server when DASHBOARD_UPSTREAM_BASE_URL is set
+def resolve_url(url, host):
+    if not UPSTREAM_BASE_URL:
+        return url
+    return f"{UPSTREAM_BASE_URL.rstrip('/')}/{host}{url.split(host, 1)[1]}"
+
+
+# Function to report on every upstream used so far
+def upstream_report():
+    return [upstream.info() for upstream in _upstreams.values()]
+
+
+# The open track_failures() scope's failure list. A context variable rather than a thread local, so work handed to
+# worker threads with contextvars.copy_context().run (see run_in_context()) still reports to the caller's scope
+_failures = contextvars.ContextVar('upstream_failures', default=None)
+
+
+# Context manager that collects the upstream failures seen while it is open, on this thread or on workers given its context
+@contextlib.contextmanager
+def track_failures():
+    '''
+    The cache wraps each fetch in this, so it knows when a fetcher's empty or None result came from a failing upstream
+    rather than from the upstream itself, and can serve the last good value instead. Fetchers that fan requests out
+    to worker threads submit them through run_in_context() so those failures land in this scope too.
+
+    Usage:
+        with upstreams.track_failures() as failures:
+            value = fetch()
+        if failures:
+            ...
+    '''
+    outer = _failures.get()
+    failures = []
+    token = _failures.set(failures)
+    try:
+        yield failures
+    finally:
+        _failures.reset(token)
+        if outer is not None:
+            outer.extend(failures)
+
+
+# Function to record a failed request against the open track_failures() scope
+def record_failure(host, reason):
+    current = _failures.get()
+    if current is not None:
+        current.append((host, reason))
+
+
+# Function to wrap a call so it runs in a copy of the caller's context, for executor.submit() and run_in_executor()
+def run_in_context(fn):
+    '''
+    Usage:
+        executor.submit(upstreams.run_in_context(fetch), *args)
+    '''
+    context = contextvars.copy_context()
+    return lambda *args, **kwargs: context.copy().run(fn, *args, **kwargs)
@@ -1,10 +1,12 @@
 #%%
-import requests
+import functions.http_client as hc
 import pandas as pd
-import streamlit as st
+import functions.cache as cache
+import functions.instrumentation as instr
 
 #%%
-@st.cache_data(ttl='6h')
+@cache.cached(ttl='6h', max_bytes=4 * 1024 ** 2, persist=True)
+@instr.timed('fetch')
 def astronomy_get(api_key, location, date):
     '''
     Takes a weatherapi.com api key, a location, and date returning astronomical data for that location/date.
@@ -25,7 +27,7 @@ def astronomy_get(api_key, location, date):
         "dt": date,
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
@@ -50,7 +52,8 @@ def astronomy_get(api_key, location, date):
 
 
 #%%
-@st.cache_data(ttl='10m')
+@cache.cached(ttl='10m', max_bytes=4 * 1024 ** 2, persist=True)
+@instr.timed('fetch')
 def current_weather_get(api_key, location):
     '''
     Takes a weatherapi.com api key and a location returning current weather data for that location.
@@ -70,7 +73,7 @@ def current_weather_get(api_key, location):
         "aqi": "yes",
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
@@ -103,7 +106,8 @@ def current_weather_get(api_key, location):
 
 
 #%%
-@st.cache_data(ttl='10m')
+@cache.cached(ttl='10m', max_bytes=8 * 1024 ** 2, persist=True, max_stale='1h')
+@instr.timed('fetch')
 def forecast_weather_get(api_key, location, days_out):
     '''
     Takes a weatherapi.com api key, a location, and days you want the forecast out for,
@@ -125,7 +129,7 @@ def forecast_weather_get(api_key, location, days_out):
         "days": days_out,
     }
 
-    response = requests.get(base_url, params=params)
+    response = hc.get(base_url, params=params)
 
     if response.status_code == 200:
         try:
@@ -159,7 +163,8 @@ def forecast_weather_get(api_key, location, days_out):
 
 
 #%%
-@st.cache_data
+@cache.cached(max_bytes=1 * 1024 ** 2)
+@instr.timed('fetch')
 def get_moon_icon_path(moon_phase):
     moon_phase = moon_phase.lower().replace(' ', '_')
     img_path = f'assets/moon_icons/{moon_phase}.png'
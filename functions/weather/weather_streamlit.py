@@ -3,6 +3,7 @@ import streamlit as st
 import functions.weather.weather_data_fetch as fw
 import functions.weather.weather_streamlit as fs
 import functions.fourteeners.fourteeners_data_fetch as fd
+import functions.tools as t
 from datetime import datetime
 import base64
 
@@ -11,7 +12,7 @@ weather_api_key = st.secrets["weather_api_key"]
 
 def weather_main():
     # Get zipcode data
-    all_zipcodes = fd.read_zipcodes('data/us_zipcodes/uszips.csv')
+    all_zipcodes = fd.read_zipcodes(fd.ZIPCODES_PATH)
 
     # Create dropdown for user location
     location = st.selectbox("**Enter Zipcode**", all_zipcodes['zip'].to_list(), index=None, placeholder="Defaulting to 80501")
@@ -23,15 +24,26 @@ def weather_main():
     # Add title
     st.write(f"#### Weather Outlook for {location}")
 
-    # Fetch Current Weather data for user's location
-    weather_df, condition_df, aqi_df = fw.current_weather_get(weather_api_key, location)
+    try:
+        # Fetch Current Weather data for user's location
+        current = fw.current_weather_get(weather_api_key, location)
 
-    # Fetch Astronomy data
-    date = datetime.now().strftime('%Y-%m-%d')
-    astro_df = fw.astronomy_get(weather_api_key, location, date)
+        # Fetch Astronomy data
+        date = datetime.now().strftime('%Y-%m-%d')
+        astro_df = fw.astronomy_get(weather_api_key, location, date)
 
-    # Fetch 7-Day Forecast
-    forecast_df = fw.forecast_weather_get(weather_api_key, location, 7)
+        # Fetch 7-Day Forecast
+        forecast = fw.forecast_weather_get.with_age(weather_api_key, location, 7)
+        forecast_df = forecast.value
+    except Exception as e:
+        print(f"Error fetching weather data: {e}")
+        current = astro_df = forecast_df = None
+
+    # weatherapi.com is failing and there's nothing cached to fall back on, so there's nothing to show
+    if current is None or astro_df is None or forecast_df is None or current[0].empty or astro_df.empty or forecast_df.empty:
+        st.warning("Weather data is unavailable right now, please try again in a few minutes.")
+        return
+    weather_df, condition_df, aqi_df = current
 
     # Get astro df variables set
     moon_phase = astro_df[astro_df['index']=='moon_phase']['astro'].reset_index(drop=True)
@@ -139,6 +151,10 @@ def weather_main():
             </div>
     """)
 
+    # Say how old the forecast is when an older copy is shown while it refreshes
+    if forecast.stale:
+        st.caption(f"Forecast updated {t.format_age(forecast.age)}, refreshing in the background.")
+
 
     
 